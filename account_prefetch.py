@@ -0,0 +1,297 @@
+"""Speculative account lookups started from interim transcripts
+
+While the caller is still reading out their SSN last 4 and date of birth, the interim
+transcripts already contain them. `AccountPrefetcher` spots the pair and starts the same
+`verify()` lookup the tool would run, so that when the LLM calls `verify_account` the result
+is ready (or already in flight). Results are only served for the exact credentials the tool is
+called with, and expire after a short TTL.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import Counter
+from datetime import date
+from itertools import product
+from typing import Any, Dict, List, Optional, Tuple
+from livekit.agents import stt
+from account_store import AccountStore, normalize_date_of_birth
+
+logger = logging.getLogger("account-prefetch")
+logger.setLevel(logging.INFO)
+
+UNITS = {"zero": 0, "oh": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9}
+TEENS = {
+    "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+    "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+TENS = {"twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90}
+ORDINAL_UNITS = {
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "sixth": 6, "seventh": 7, "eighth": 8, "ninth": 9,
+}
+ORDINALS = dict(
+    ORDINAL_UNITS,
+    tenth=10, eleventh=11, twelfth=12, thirteenth=13, fourteenth=14, fifteenth=15, sixteenth=16,
+    seventeenth=17, eighteenth=18, nineteenth=19, twentieth=20, thirtieth=30,
+)
+
+MONTHS = {
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7, "august": 8,
+    "september": 9, "october": 10, "november": 11, "december": 12,
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "jun": 6, "jul": 7, "aug": 8, "sep": 9, "sept": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+MONTH_NAMES = "|".join(sorted(MONTHS, key=len, reverse=True))
+
+# "01/15/1980", "1-15-1980", "1980-01-15"
+NUMERIC_DATE = re.compile(r"\b(?P<month>\d{1,2})[/-](?P<day>\d{1,2})[/-](?P<year>\d{4})\b|\b(?P<iso_year>\d{4})-(?P<iso_month>\d{2})-(?P<iso_day>\d{2})\b")
+# On spoken text with numbers as digits: "january 15th 1980", "the 15th of january 1980"
+NAMED_DATE = re.compile(
+    rf"\b(?P<month>{MONTH_NAMES}) (?:the )?(?P<day>\d{{1,2}})(?:st|nd|rd|th)? (?:of )?(?P<year>\d{{4}})\b"
+    rf"|\b(?:the )?(?P<day2>\d{{1,2}})(?:st|nd|rd|th)? (?:of )?(?P<month2>{MONTH_NAMES}) (?P<year2>\d{{4}})\b"
+)
+LAST4 = re.compile(r"\b\d{4}\b")
+
+
+def _cardinal(words: List[str], i: int) -> Tuple[Optional[int], int]:
+    """A number below 100 spelled out at words[i], and how many words it took"""
+    word = words[i]
+    if word in TENS:
+        if i + 1 < len(words) and words[i + 1] in UNITS and UNITS[words[i + 1]]:
+            return TENS[word] + UNITS[words[i + 1]], 2
+        return TENS[word], 1
+    if word in TEENS:
+        return TEENS[word], 1
+    return None, 0
+
+
+def _read_number(words: List[str], i: int) -> Tuple[Optional[str], int]:
+    """The spoken number starting at words[i] as digits ("15th" for ordinals), and how many words it took"""
+    word = words[i]
+    following = words[i + 1] if i + 1 < len(words) else ""
+
+    # Years: "nineteen eighty five", "nineteen oh five", "twenty twenty", "two thousand and three"
+    if word == "two" and following == "thousand":
+        j = i + 2
+        if j < len(words) and words[j] == "and":
+            j += 1
+        if j < len(words):
+            rest, used = _cardinal(words, j)
+            if rest is None and words[j] in UNITS:
+                rest, used = UNITS[words[j]], 1
+            if rest is not None:
+                return str(2000 + rest), j - i + used
+        return "2000", 2
+    if (word in TEENS and TEENS[word] >= 11) or word == "twenty":
+        century = TEENS.get(word, 20)
+        if i + 1 < len(words):
+            if following == "oh" and i + 2 < len(words) and UNITS.get(words[i + 2]):
+                return str(century * 100 + UNITS[words[i + 2]]), 3
+            rest, used = _cardinal(words, i + 1)
+            if rest is not None and rest >= 10:
+                return str(century * 100 + rest), 1 + used
+
+    # Ordinals: "fifteenth", "twenty first"
+    if word in ORDINALS:
+        return f"{ORDINALS[word]}th", 1
+    if word in TENS and following in ORDINAL_UNITS:
+        return f"{TENS[word] + ORDINAL_UNITS[following]}th", 2
+
+    value, used = _cardinal(words, i)
+    if value is not None:
+        return str(value), used
+    if word in UNITS:
+        return str(UNITS[word]), 1
+    return None, 0
+
+
+def spoken_digits(text: str) -> str:
+    """Lowercase words with spoken numbers turned into digits; digit-by-digit runs are joined ("1 2 3 4" -> "1234")"""
+    words = re.findall(r"[a-z]+|\d+(?:st|nd|rd|th)?", text.lower().replace("-", " "))
+    tokens: List[str] = []
+    i = 0
+    while i < len(words):
+        # "the last four" names the digits rather than starting them
+        if words[i] in ("four", "4") and i and words[i - 1] == "last":
+            tokens.append("four")
+            i += 1
+            continue
+        number, used = _read_number(words, i)
+        if number is None:
+            tokens.append(words[i])
+            i += 1
+            continue
+        tokens.append(number)
+        i += used
+
+    # "one two three four" or "12 34": short digit groups read one after another form one number
+    joined: List[str] = []
+    for token in tokens:
+        if token.isdigit() and len(token) <= 2 and joined and joined[-1].isdigit() and len(joined[-1] + token) <= 4:
+            joined[-1] += token
+        else:
+            joined.append(token)
+    return " ".join(joined)
+
+
+def _valid_birth_date(year: str, month: Any, day: str) -> Optional[str]:
+    try:
+        born = date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+    if born.year < 1900 or born > date.today():
+        return None
+    return born.isoformat()
+
+
+def extract_credentials(text: str, complete: bool = True) -> List[Tuple[str, str]]:
+    """(SSN last 4, YYYY-MM-DD date of birth) pairs the text could contain
+
+    With `complete` unset the text is still being spoken, so a number it ends on may grow
+    ("nineteen eighty" -> "nineteen eighty five") and is left out.
+    """
+    dates: List[str] = []
+
+    def take_numeric(match: "re.Match") -> str:
+        if match.group("iso_year"):
+            found = _valid_birth_date(match.group("iso_year"), match.group("iso_month"), match.group("iso_day"))
+        else:
+            found = _valid_birth_date(match.group("year"), match.group("month"), match.group("day"))
+        if found:
+            dates.append(found)
+        return " "
+
+    if not complete:
+        # A partial word could be anything, and a trailing number may still grow
+        text = " ".join(text.split()[:-1])
+    spoken = spoken_digits(NUMERIC_DATE.sub(take_numeric, text))
+    if not complete:
+        spoken = re.sub(r"(?:\s*\b\d+(?:st|nd|rd|th)?)+$", "", spoken)
+
+    def take_named(match: "re.Match") -> str:
+        if match.group("month"):
+            found = _valid_birth_date(match.group("year"), MONTHS[match.group("month")], match.group("day"))
+        else:
+            found = _valid_birth_date(match.group("year2"), MONTHS[match.group("month2")], match.group("day2"))
+        if found:
+            dates.append(found)
+        return " "
+
+    spoken = NAMED_DATE.sub(take_named, spoken)
+    if not dates:
+        return []
+    last4s = list(dict.fromkeys(LAST4.findall(spoken)))
+    return list(product(last4s, dict.fromkeys(dates)))
+
+
+def credential_key(identifier: str, date_of_birth: str) -> Tuple[str, str]:
+    """The form verify() compares in, so spoken and tool-call credentials meet on the same key"""
+    return identifier.strip().replace("-", ""), normalize_date_of_birth(date_of_birth)
+
+
+class AccountPrefetcher:
+    """Per-session cache of speculative `verify()` lookups, keyed by the credentials they were started with
+
+    Use `verify()` in place of the store's. A credential pair is looked up at most once per TTL,
+    and at most `max_prefetches` lookups are started per session.
+    """
+
+    def __init__(self, store: AccountStore, ttl: float = 30.0, max_prefetches: int = 8, enabled: bool = True):
+        self.store = store
+        self.ttl = ttl
+        self.max_prefetches = max_prefetches
+        self.enabled = enabled
+        self._lookups: Dict[Tuple[str, str], Tuple[float, asyncio.Task]] = {}
+        self.counts: Counter = Counter()
+        # Lookup time already spent by the time the tool asked for it
+        self.saved_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, store: AccountStore) -> "AccountPrefetcher":
+        return cls(
+            store,
+            ttl=float(os.getenv("ACCOUNT_PREFETCH_TTL", "30")),
+            max_prefetches=int(os.getenv("ACCOUNT_PREFETCH_MAX", "8")),
+            enabled=os.getenv("ACCOUNT_PREFETCH", "1") != "0",
+        )
+
+    def on_speech_event(self, event: stt.SpeechEvent) -> None:
+        """TappedSTT listener: look for credentials in every interim and final transcript"""
+        if event.type not in (stt.SpeechEventType.INTERIM_TRANSCRIPT, stt.SpeechEventType.FINAL_TRANSCRIPT):
+            return
+        if event.alternatives:
+            self.observe(event.alternatives[0].text, final=event.type == stt.SpeechEventType.FINAL_TRANSCRIPT)
+
+    def observe(self, text: str, final: bool = True) -> None:
+        if not self.enabled:
+            return
+        for identifier, date_of_birth in extract_credentials(text, complete=final):
+            self.prefetch(identifier, date_of_birth)
+
+    def prefetch(self, identifier: str, date_of_birth: str) -> None:
+        key = credential_key(identifier, date_of_birth)
+        self._expire()
+        if key in self._lookups:
+            return
+        if self.counts["prefetched"] >= self.max_prefetches:
+            self.counts["over_limit"] += 1
+            return
+        self.counts["prefetched"] += 1
+        self._lookups[key] = (time.monotonic(), asyncio.create_task(self._lookup(key)))
+
+    async def _lookup(self, key: Tuple[str, str]) -> Tuple[Optional[Dict[str, Any]], float]:
+        try:
+            account = await self.store.verify(*key)
+        except Exception as e:
+            # The tool call then looks the account up itself
+            logger.warning(f"Account prefetch failed: {e}")
+            raise
+        return account, time.monotonic()
+
+    async def verify(self, identifier: str, date_of_birth: str) -> Optional[Dict[str, Any]]:
+        """The store's `verify()`, served from a prefetch with the same credentials when there is one"""
+        key = credential_key(identifier, date_of_birth)
+        self._expire()
+        entry = self._lookups.pop(key, None)
+        if entry is not None:
+            started, task = entry
+            asked = time.monotonic()
+            if task.done():
+                self.counts["ready"] += 1
+            try:
+                account, finished = await task
+            except Exception:
+                self.counts["failed"] += 1
+            else:
+                self.counts["hits"] += 1
+                self.saved_seconds += min(asked, finished) - started
+                return account
+        self.counts["misses"] += 1
+        return await self.store.verify(identifier, date_of_birth)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, (started, _) in self._lookups.items() if now - started > self.ttl]:
+            self._lookups.pop(key)[1].cancel()
+            self.counts["wasted"] += 1
+
+    def close(self) -> None:
+        """Drop lookups that were never used; they count as wasted"""
+        for _, task in self._lookups.values():
+            task.cancel()
+        self.counts["wasted"] += len(self._lookups)
+        self._lookups.clear()
+        self.enabled = False
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counts["hits"] + self.counts["misses"] + self.counts["failed"]
+        return {
+            "prefetched": self.counts["prefetched"],
+            "hits": self.counts["hits"],
+            "ready_on_call": self.counts["ready"],
+            "misses": self.counts["misses"],
+            "hit_rate": round(self.counts["hits"] / lookups, 3) if lookups else 0.0,
+            "wasted": self.counts["wasted"],
+            "over_limit": self.counts["over_limit"],
+            "saved_ms": round(self.saved_seconds * 1000),
+        }
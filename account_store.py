@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import aiosqlite
+
+logger = logging.getLogger("account-store")
+logger.setLevel(logging.INFO)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    account_number TEXT PRIMARY KEY,
+    ssn_last4 TEXT NOT NULL,
+    date_of_birth TEXT NOT NULL,
+    balance REAL NOT NULL,
+    past_due REAL NOT NULL,
+    days_overdue INTEGER NOT NULL,
+    last_payment_date TEXT,
+    minimum_payment REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS accounts_identity ON accounts (ssn_last4, date_of_birth);
+CREATE TABLE IF NOT EXISTS payment_plans (
+    plan_id TEXT PRIMARY KEY,
+    account_number TEXT,
+    data TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS payment_plans_account ON payment_plans (account_number);
+CREATE TABLE IF NOT EXISTS transactions (
+    transaction_id TEXT PRIMARY KEY,
+    account_number TEXT,
+    amount REAL NOT NULL,
+    data TEXT NOT NULL,
+    processed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_account ON transactions (account_number);
+"""
+
+ACCOUNT_COLUMNS = (
+    "account_number", "ssn_last4", "date_of_birth", "balance", "past_due",
+    "days_overdue", "last_payment_date", "minimum_payment",
+)
+
+
+def normalize_date_of_birth(date_of_birth: str) -> str:
+    """Store and compare birth dates as YYYY-MM-DD; callers say them as MM/DD/YYYY"""
+    for fmt in ("%m/%d/%Y", "%Y-%m-%d", "%m-%d-%Y"):
+        try:
+            return datetime.strptime(date_of_birth.strip(), fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return date_of_birth.strip()
+
+
+class AccountStore:
+    """Async storage interface used by the collections tools"""
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def verify(self, identifier: str, date_of_birth: str) -> Optional[Dict[str, Any]]:
+        """Find the account matching an account number or SSN last 4, plus date of birth"""
+        raise NotImplementedError
+
+    async def save_payment_plan(self, account_number: Optional[str], plan: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def record_transaction(self, account_number: Optional[str], transaction: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+class SQLiteAccountStore(AccountStore):
+    """SQLite store with a small pool of aiosqlite connections and batched plan/transaction writes"""
+
+    def __init__(self, path: str, pool_size: int = 4, batch_size: int = 256, flush_interval: float = 0.05):
+        self.path = path
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pool: asyncio.Queue = asyncio.Queue()
+        self._connections: List[aiosqlite.Connection] = []
+        self._writes: List[Tuple[str, Tuple[Any, ...]]] = []
+        self._writes_ready = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def open(self) -> None:
+        """Open the connection pool and make sure the schema exists"""
+        for _ in range(self.pool_size):
+            conn = await aiosqlite.connect(self.path)
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute("PRAGMA synchronous=NORMAL")
+            await conn.execute("PRAGMA mmap_size=268435456")
+            self._connections.append(conn)
+            self._pool.put_nowait(conn)
+        await self._connections[0].executescript(SCHEMA)
+        await self._connections[0].commit()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        for conn in self._connections:
+            await conn.close()
+        self._connections.clear()
+
+    async def _fetch_one(self, query: str, params: Tuple[Any, ...]) -> Optional[Dict[str, Any]]:
+        conn = await self._pool.get()
+        try:
+            async with conn.execute(query, params) as cursor:
+                row = await cursor.fetchone()
+        finally:
+            self._pool.put_nowait(conn)
+        return dict(zip(ACCOUNT_COLUMNS, row)) if row else None
+
+    async def get_account(self, account_number: str) -> Optional[Dict[str, Any]]:
+        return await self._fetch_one(
+            f"SELECT {', '.join(ACCOUNT_COLUMNS)} FROM accounts WHERE account_number = ?",
+            (account_number,),
+        )
+
+    async def verify(self, identifier: str, date_of_birth: str) -> Optional[Dict[str, Any]]:
+        identifier = identifier.strip().replace("-", "")
+        date_of_birth = normalize_date_of_birth(date_of_birth)
+        if len(identifier) == 4 and identifier.isdigit():
+            return await self._fetch_one(
+                f"SELECT {', '.join(ACCOUNT_COLUMNS)} FROM accounts WHERE ssn_last4 = ? AND date_of_birth = ?",
+                (identifier, date_of_birth),
+            )
+        account = await self.get_account(identifier)
+        if account is None or account["date_of_birth"] != date_of_birth:
+            return None
+        return account
+
+    async def count_accounts(self) -> int:
+        conn = await self._pool.get()
+        try:
+            async with conn.execute("SELECT COUNT(*) FROM accounts") as cursor:
+                return (await cursor.fetchone())[0]
+        finally:
+            self._pool.put_nowait(conn)
+
+    async def load_accounts(self, accounts: Iterable[Dict[str, Any]], chunk_size: int = 10000) -> int:
+        """Bulk insert or replace accounts, committing once per chunk"""
+        conn = await self._pool.get()
+        count = 0
+        try:
+            chunk = []
+            for account in accounts:
+                row = dict(account, date_of_birth=normalize_date_of_birth(account["date_of_birth"]))
+                chunk.append(tuple(row.get(column) for column in ACCOUNT_COLUMNS))
+                if len(chunk) >= chunk_size:
+                    count += await self._insert_accounts(conn, chunk)
+                    chunk = []
+            if chunk:
+                count += await self._insert_accounts(conn, chunk)
+        finally:
+            self._pool.put_nowait(conn)
+        return count
+
+    async def _insert_accounts(self, conn: aiosqlite.Connection, rows: List[Tuple[Any, ...]]) -> int:
+        placeholders = ", ".join("?" for _ in ACCOUNT_COLUMNS)
+        await conn.executemany(
+            f"INSERT OR REPLACE INTO accounts ({', '.join(ACCOUNT_COLUMNS)}) VALUES ({placeholders})",
+            rows,
+        )
+        await conn.commit()
+        return len(rows)
+
+    async def save_payment_plan(self, account_number: Optional[str], plan: Dict[str, Any]) -> None:
+        self._queue_write(
+            "INSERT OR REPLACE INTO payment_plans (plan_id, account_number, data, created_at) VALUES (?, ?, ?, ?)",
+            (plan["plan_id"], account_number, json.dumps(plan), plan["created_at"]),
+        )
+
+    async def record_transaction(self, account_number: Optional[str], transaction: Dict[str, Any]) -> None:
+        self._queue_write(
+            "INSERT OR REPLACE INTO transactions (transaction_id, account_number, amount, data, processed_at) VALUES (?, ?, ?, ?, ?)",
+            (transaction["transaction_id"], account_number, transaction["amount"], json.dumps(transaction), transaction["processed_at"]),
+        )
+
+    def _queue_write(self, query: str, params: Tuple[Any, ...]) -> None:
+        # Writes are queued so a tool call never waits on a commit; the flush loop batches them
+        self._writes.append((query, params))
+        if len(self._writes) >= self.batch_size:
+            self._writes_ready.set()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._writes_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._writes_ready.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush account store writes: {e}")
+
+    async def flush(self) -> None:
+        """Write every queued plan and transaction in a single commit"""
+        if not self._writes:
+            return
+        writes, self._writes = self._writes, []
+        batches: Dict[str, List[Tuple[Any, ...]]] = {}
+        for query, params in writes:
+            batches.setdefault(query, []).append(params)
+
+        conn = await self._pool.get()
+        try:
+            for query, rows in batches.items():
+                await conn.executemany(query, rows)
+            await conn.commit()
+        except Exception:
+            self._writes = writes + self._writes
+            raise
+        finally:
+            self._pool.put_nowait(conn)
+
+
+_shared_store: Optional[AccountStore] = None
+_shared_store_lock = asyncio.Lock()
+
+
+async def shared_account_store() -> AccountStore:
+    """Account store of this job process, opened on first use
+
+    Jobs run in processes of their own, so each opens its own connection pool; what they share
+    is the database file, which WAL mode lets them read while another process writes.
+    """
+    global _shared_store
+    async with _shared_store_lock:
+        if _shared_store is None:
+            store = SQLiteAccountStore(
+                os.getenv("ACCOUNT_DB_PATH", "accounts.db"),
+                pool_size=int(os.getenv("ACCOUNT_DB_POOL_SIZE", "4")),
+            )
+            await store.open()
+            _shared_store = store
+    return _shared_store
+
+
+async def flush_account_store() -> None:
+    """Commit the queued plan and transaction writes now; the job process exits right after shutdown"""
+    if _shared_store is not None:
+        await _shared_store.flush()
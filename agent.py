@@ -2,13 +2,36 @@ import asyncio
 import logging
 from typing import Annotated
 from livekit import agents, rtc
-from livekit.agents import JobContext, WorkerOptions, cli, llm, stt, tts, vad
+from livekit.agents import JobContext, JobProcess, WorkerOptions, cli, llm, stt, tts, vad
 from livekit.agents.voice_assistant import VoiceAssistant
-from livekit.plugins import openai, silero, deepgram
+from chat_window import ChatWindow
+from endpointing import EndpointPolicy, attach
+from call_events import flush_event_sink, shared_event_sink
+from call_state import flush_call_state, shared_call_state
+from latency import TurnTracer, flush_latency_dump
+from prewarm import JobTimer, get_plugins, prewarm_process
+from recorder import shared_recorder
 
 logger = logging.getLogger("voice-assistant")
 logger.setLevel(logging.INFO)
 
+# Plugin settings, built once per worker process by prewarm()
+PLUGIN_CONFIG = {
+    "stt": {  # Speech-to-Text
+        "model": "nova-2",
+        "language": "en",
+    },
+    "llm": {  # Language Model
+        "model": "gpt-4o-mini",
+        "temperature": 0.7,
+    },
+    "tts": {  # Text-to-Speech
+        "model": "tts-1",
+        "voice": "alloy",
+        "speed": 1.0,
+    },
+}
+
 
 class AssistantFunction(agents.llm.FunctionContext):
     """Define custom functions that the assistant can call"""
@@ -33,14 +56,24 @@ class AssistantFunction(agents.llm.FunctionContext):
         return f"Appointment scheduled for {date} at {time}: {description}"
 
 
+def prewarm(proc: JobProcess):
+    """Load the VAD model and plugin clients before the worker accepts jobs"""
+    prewarm_process(proc, {"general": PLUGIN_CONFIG})
+
+
 async def entrypoint(ctx: JobContext):
     """Main entry point for the agent"""
+    timer = JobTimer("general")
+    plugins = get_plugins(ctx.proc, "general", PLUGIN_CONFIG)
+    timer.mark("plugins")
     
     # Initialize the room and participant
     await ctx.connect(auto_subscribe=agents.AutoSubscribe.AUDIO_ONLY)
+    timer.mark("connect")
     
     # Wait for the first participant to connect
     participant = await ctx.wait_for_participant()
+    timer.mark("participant")
     logger.info(f"Participant {participant.identity} connected")
     
     # Configure the LLM with system prompt
@@ -60,64 +93,91 @@ async def entrypoint(ctx: JobContext):
         )
     )
     
+    # Per-job plugin wrappers that time each pipeline stage of every turn
+    tracer = TurnTracer("agent")
+    traced = tracer.wrap(plugins)
+    ctx.add_shutdown_callback(flush_latency_dump)
+    
+    # Transcripts and function calls, written in batches off the event loop
+    events = shared_event_sink()
+    session = ctx.room.name
+    ctx.add_shutdown_callback(flush_event_sink)
+    
+    # Live call state for dashboards, pushed to the call state hub
+    call_state = shared_call_state()
+    ctx.add_shutdown_callback(flush_call_state)
+    
+    # Keeps the prompt of long calls within budget by summarizing older turns
+    chat_window = ChatWindow.from_env()
+    
     # Set up the voice assistant with plugins
     assistant = VoiceAssistant(
-        vad=silero.VAD.load(),  # Voice Activity Detection
-        stt=deepgram.STT(
-            model="nova-2",
-            language="en",
-        ),  # Speech-to-Text
-        llm=openai.LLM(
-            model="gpt-4o-mini",
-            temperature=0.7,
-        ),  # Language Model
-        tts=openai.TTS(
-            model="tts-1",
-            voice="alloy",
-            speed=1.0,
-        ),  # Text-to-Speech
+        vad=plugins["vad"],  # Voice Activity Detection
+        stt=traced["stt"],
+        llm=traced["llm"],
+        tts=traced["tts"],
         chat_ctx=initial_ctx,
+        before_llm_cb=chat_window.before_llm_cb,
         fnc_ctx=AssistantFunction(),  # Custom functions
         interrupt_min_words=2,  # Allow interruption after 2 words
     )
     
+    tracer.attach(assistant)
+    # Waits out the caller's own pauses, and holds the turn while a card number or date is half read
+    endpointing = EndpointPolicy.from_env()
+    attach(assistant, endpointing)
+    timer.mark("assistant")
+    
+    # Compliance recording of both legs, from the frames the pipeline already moves
+    recording = shared_recorder().start(session)
+    recording.attach(assistant, traced["stt"])
+    ctx.add_shutdown_callback(recording.close)
+    
     # Start the assistant for the participant
+    call_state.update(session, agent="agent", phase="in_progress", participant=participant.identity)
     assistant.start(ctx.room, participant)
+    timer.mark("start")
     
     # Handle function calls from the assistant
     @assistant.on("function_calls_finished")
     def on_function_calls_finished(called_functions: list[agents.llm.CalledFunction]):
-        """Log when functions are called"""
+        """Record when functions are called"""
         for func in called_functions:
-            logger.info(f"Function called: {func.function_info.name} with result: {func.result}")
+            events.emit(session, "function_call", name=func.call_info.function_info.name, arguments=func.call_info.arguments, result=func.result)
     
-    # Log user transcriptions
+    # Record user transcriptions
     @assistant.on("user_speech_committed")
     def on_user_speech_committed(msg: llm.ChatMessage):
-        """Log what the user said"""
-        logger.info(f"User: {msg.content}")
+        """Record what the user said"""
+        events.emit(session, "user_speech", text=msg.content)
     
-    # Log assistant responses
+    # Record assistant responses
     @assistant.on("agent_speech_committed")
     def on_agent_speech_committed(msg: llm.ChatMessage):
-        """Log what the assistant said"""
-        logger.info(f"Assistant: {msg.content}")
+        """Record what the assistant said"""
+        events.emit(session, "agent_speech", text=msg.content)
     
-    # Handle metrics
-    @assistant.on("metrics_collected")
-    def on_metrics_collected(metrics: agents.metrics.AssistantMetrics):
-        """Log performance metrics"""
-        logger.info(f"Metrics - TTF: {metrics.ttf:.2f}s, Processing: {metrics.processing_time:.2f}s")
+    timer.log()
     
     # Say hello when the assistant is ready
     await assistant.say("Hello! I'm your AI assistant. How can I help you today?", allow_interruptions=True)
 
+    # Log prompt size statistics when the call ends
+    @ctx.room.on("participant_disconnected")
+    def on_participant_disconnected(participant: rtc.RemoteParticipant):
+        call_state.update(session, phase="ended")
+        logger.info(f"Chat context - {chat_window.stats()}")
+        logger.info(f"Call events - {events.stats()}")
+        logger.info(f"Endpointing - {endpointing.stats()}")
+        logger.info(f"Recording - {recording.stats()}")
+
 
 if __name__ == "__main__":
     # Run the agent
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,  # Load models once per process, off the answer path
             api_key=None,  # Will use LIVEKIT_API_KEY env var
             api_secret=None,  # Will use LIVEKIT_API_SECRET env var
             ws_url=None,  # Will use LIVEKIT_URL env var
@@ -3,27 +3,76 @@ import logging
 from typing import Annotated, Optional, Dict, Any
 from datetime import datetime, timedelta
 from livekit import agents, rtc
-from livekit.agents import JobContext, WorkerOptions, cli, llm, stt, tts, vad
+from livekit.agents import JobContext, JobProcess, WorkerOptions, cli, llm, stt, tts, vad
 from livekit.agents.voice_assistant import VoiceAssistant
-from livekit.plugins import openai, silero, deepgram
+from chat_window import ChatWindow
+from endpointing import EndpointPolicy, attach
+from hardship import assess
+from call_events import flush_event_sink, shared_event_sink
+from call_state import flush_call_state, shared_call_state
+from latency import TurnTracer, flush_latency_dump
+from prewarm import JobTimer, get_plugins, get_tts_cache, prewarm_process
+from prompts import INBOUND
+from recorder import shared_recorder
+from quotes import payment_options, quote_balance, shared_quote_book
+from speech_chunker import PipelinedTTS
+from account_store import AccountStore, flush_account_store, shared_account_store
+from account_prefetch import AccountPrefetcher
+from journal import TransactionJournal, shared_journal
+from ids import IdempotencyIndex, idempotency_key, new_id
+from outbox import Outbox, drain_outbox, shared_outbox
 import json
 import os
 
 logger = logging.getLogger("collections-agent")
 logger.setLevel(logging.INFO)
 
+# Plugin settings, built once per worker process by prewarm()
+PLUGIN_CONFIG = {
+    "stt": {
+        "model": "nova-2",
+        "language": "en",
+        "smart_format": True,  # Better formatting for numbers and dates
+    },
+    "llm": {
+        "model": "gpt-4o-mini",
+        "temperature": 0.3,  # Lower temperature for more consistent responses
+    },
+    "tts": {
+        "model": "tts-1",
+        "voice": "nova",  # Professional, calm voice
+        "speed": 0.95,  # Slightly slower for clarity
+    },
+}
+
+# Initial greeting with compliance statement, identical on every call
+GREETING = (
+    "Hello, this is Sarah from the Financial Recovery Department. "
+    "This is an attempt to collect a debt, and any information obtained will be used for that purpose. "
+    "May I please verify your identity by confirming the last four digits of your social security number and your date of birth?"
+)
+
+# Fixed phrases kept in the TTS audio cache so they play without a synthesis round trip
+CACHED_PHRASES = [GREETING]
+
 
 class CollectionsAssistant(agents.llm.FunctionContext):
     """Collections-specific functions for debt recovery and payment processing"""
     
-    def __init__(self):
+    def __init__(self, store: AccountStore, journal: TransactionJournal, outbox: Outbox, prefetcher: Optional[AccountPrefetcher] = None):
         super().__init__()
-        # In production, this would connect to your database
-        self.mock_db = {
-            "accounts": {},
-            "payment_plans": {},
-            "transactions": []
-        }
+        self.store = store
+        # Serves verify_account from a lookup started on the caller's interim transcripts
+        self.prefetcher = prefetcher
+        self.journal = journal
+        self.outbox = outbox
+        # Set once the caller has been verified, so plans and payments are tied to the account
+        self.account_number: Optional[str] = None
+        # Repeated payment tool calls within the session return the original result
+        self.idempotency = IdempotencyIndex()
+        # Call outcomes, read when the call ends
+        self.payment_collected = False
+        self.arrangement_made = False
     
     @agents.llm.ai_callable()
     async def verify_account(
@@ -32,15 +81,24 @@ class CollectionsAssistant(agents.llm.FunctionContext):
         date_of_birth: Annotated[str, agents.llm.TypeInfo(description="Date of birth in MM/DD/YYYY format")],
     ) -> str:
         """Verify customer identity and retrieve account information"""
-        # Mock verification - replace with actual database lookup
+        account = await (self.prefetcher or self.store).verify(account_number, date_of_birth)
+        if account is None:
+            return json.dumps({
+                "verified": False,
+                "reason": "No account matches the details provided"
+            })
+        
+        self.account_number = account["account_number"]
+        if self.prefetcher is not None:
+            self.prefetcher.close()
         return json.dumps({
             "verified": True,
-            "account_number": account_number,
-            "balance": 2500.00,
-            "past_due": 450.00,
-            "days_overdue": 45,
-            "last_payment_date": "2024-06-15",
-            "minimum_payment": 150.00
+            "account_number": account["account_number"],
+            "balance": account["balance"],
+            "past_due": account["past_due"],
+            "days_overdue": account["days_overdue"],
+            "last_payment_date": account["last_payment_date"],
+            "minimum_payment": account["minimum_payment"]
         })
     
     @agents.llm.ai_callable()
@@ -50,62 +108,52 @@ class CollectionsAssistant(agents.llm.FunctionContext):
         monthly_income: Annotated[Optional[float], agents.llm.TypeInfo(description="Customer's monthly income if provided")] = None,
     ) -> str:
         """Generate payment plan options based on balance and customer situation"""
-        options = []
-        
-        # Full payment option
-        options.append({
-            "type": "full_payment",
-            "amount": balance,
-            "description": "Pay in full today with 10% discount",
-            "discount": balance * 0.10,
-            "final_amount": balance * 0.90
-        })
+        quote = None
+        book = shared_quote_book()
+        if book is not None and self.account_number is not None:
+            quote = book.get(self.account_number)
+            # The book is priced ahead of the call; a balance that has moved since is priced live
+            if quote is not None and abs(quote["balance"] - balance) >= 0.005:
+                quote = None
+        if quote is None:
+            quote = quote_balance(balance)
         
-        # Payment plan options
-        for months in [3, 6, 12]:
-            monthly_payment = balance / months
-            options.append({
-                "type": "payment_plan",
-                "months": months,
-                "monthly_payment": round(monthly_payment, 2),
-                "total_amount": balance,
-                "description": f"{months}-month payment plan"
-            })
-        
-        # Settlement option
-        options.append({
-            "type": "settlement",
-            "amount": balance * 0.60,
-            "description": "One-time settlement offer",
-            "savings": balance * 0.40
-        })
-        
-        return json.dumps(options)
+        return json.dumps(payment_options(quote))
     
     @agents.llm.ai_callable()
     async def process_payment(
         self,
         amount: Annotated[float, agents.llm.TypeInfo(description="Payment amount")],
         payment_method: Annotated[str, agents.llm.TypeInfo(description="Payment method: card, ach, or phone")],
-        payment_details: Annotated[Dict[str, str], agents.llm.TypeInfo(description="Payment details like card number or account info")],
+        payment_details: Annotated[str, agents.llm.TypeInfo(description="Payment details like card number or account info")],
     ) -> str:
         """Process a payment or set up a payment arrangement"""
-        # Mock payment processing - integrate with actual payment gateway
-        transaction_id = f"TXN-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        result = {
-            "success": True,
-            "transaction_id": transaction_id,
-            "amount": amount,
-            "method": payment_method,
-            "processed_at": datetime.now().isoformat(),
-            "confirmation_number": f"CONF-{hash(transaction_id) % 1000000:06d}"
-        }
-        
-        # Log transaction
-        self.mock_db["transactions"].append(result)
+        async def charge() -> str:
+            # Mock payment processing - integrate with actual payment gateway
+            result = {
+                "success": True,
+                "transaction_id": new_id("TXN"),
+                "amount": amount,
+                "method": payment_method,
+                "processed_at": datetime.now().isoformat(),
+                "confirmation_number": new_id("CONF")
+            }
+            
+            # Make the transaction durable before confirming it to the customer
+            await self.journal.append("transaction", dict(result, account_number=self.account_number))
+            await self.store.record_transaction(self.account_number, result)
+            self.payment_collected = True
+            
+            return json.dumps(result)
         
-        return json.dumps(result)
+        key = idempotency_key(
+            "process_payment",
+            account_number=self.account_number,
+            amount=amount,
+            payment_method=payment_method,
+            payment_details=payment_details,
+        )
+        return await self.idempotency.run(key, charge)
     
     @agents.llm.ai_callable()
     async def setup_payment_plan(
@@ -116,36 +164,54 @@ class CollectionsAssistant(agents.llm.FunctionContext):
         auto_pay: Annotated[bool, agents.llm.TypeInfo(description="Whether to set up autopay")] = False,
     ) -> str:
         """Set up a payment plan arrangement"""
-        monthly_payment = round(total_amount / months, 2)
-        plan_id = f"PLAN-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        payment_plan = {
-            "plan_id": plan_id,
-            "total_amount": total_amount,
-            "months": months,
-            "monthly_payment": monthly_payment,
-            "first_payment_date": first_payment_date,
-            "auto_pay": auto_pay,
-            "status": "active",
-            "created_at": datetime.now().isoformat()
-        }
-        
-        self.mock_db["payment_plans"][plan_id] = payment_plan
+        async def create_plan() -> str:
+            payment_plan = {
+                "plan_id": new_id("PLAN"),
+                "total_amount": total_amount,
+                "months": months,
+                "monthly_payment": round(total_amount / months, 2),
+                "first_payment_date": first_payment_date,
+                "auto_pay": auto_pay,
+                "status": "active",
+                "created_at": datetime.now().isoformat()
+            }
+            
+            await self.journal.append("payment_plan", dict(payment_plan, account_number=self.account_number))
+            await self.store.save_payment_plan(self.account_number, payment_plan)
+            self.arrangement_made = True
+            
+            return json.dumps(payment_plan)
         
-        return json.dumps(payment_plan)
+        key = idempotency_key(
+            "setup_payment_plan",
+            account_number=self.account_number,
+            total_amount=total_amount,
+            months=months,
+            first_payment_date=first_payment_date,
+            auto_pay=auto_pay,
+        )
+        return await self.idempotency.run(key, create_plan)
     
     @agents.llm.ai_callable()
     async def send_payment_confirmation(
         self,
         email: Annotated[str, agents.llm.TypeInfo(description="Customer email address")],
         phone: Annotated[Optional[str], agents.llm.TypeInfo(description="Customer phone number for SMS")] = None,
-        confirmation_details: Annotated[Dict[str, Any], agents.llm.TypeInfo(description="Payment or plan details to confirm")] = None,
+        confirmation_details: Annotated[str, agents.llm.TypeInfo(description="Payment or plan details to confirm")] = "",
     ) -> str:
         """Send payment confirmation via email and/or SMS"""
-        # Mock sending - integrate with actual email/SMS service
+        # Delivery happens in the background so the provider's response time never holds up the turn
+        details = {"summary": confirmation_details} if confirmation_details else {}
+        message_ids = []
+        if email:
+            message_ids.append(self.outbox.enqueue("email", email, details))
+        if phone:
+            message_ids.append(self.outbox.enqueue("sms", phone, details))
+        
         return json.dumps({
-            "email_sent": True if email else False,
-            "sms_sent": True if phone else False,
+            "email_queued": bool(email),
+            "sms_queued": bool(phone),
+            "message_ids": message_ids,
             "timestamp": datetime.now().isoformat()
         })
     
@@ -157,136 +223,139 @@ class CollectionsAssistant(agents.llm.FunctionContext):
         hardship_reason: Annotated[str, agents.llm.TypeInfo(description="Reason for financial hardship")],
     ) -> str:
         """Check if customer qualifies for hardship program"""
-        debt_to_income = (expenses / income) if income > 0 else 1.0
-        
-        eligible = debt_to_income > 0.8 or "medical" in hardship_reason.lower() or "unemployment" in hardship_reason.lower()
-        
-        return json.dumps({
-            "eligible": eligible,
-            "debt_to_income_ratio": debt_to_income,
-            "recommended_program": "hardship_payment_plan" if eligible else "standard_payment_plan",
-            "discount_available": 0.25 if eligible else 0.10
-        })
+        return json.dumps(assess(income, expenses, hardship_reason))
+
+
+def prewarm(proc: JobProcess):
+    """Load the VAD model and plugin clients before the worker accepts jobs"""
+    prewarm_process(proc, {"collections": PLUGIN_CONFIG}, {"collections": CACHED_PHRASES})
 
 
 async def entrypoint(ctx: JobContext):
     """Main entry point for the collections agent"""
+    timer = JobTimer("collections")
+    plugins = get_plugins(ctx.proc, "collections", PLUGIN_CONFIG)
+    plugins["tts"].populate_missing()
+    timer.mark("plugins")
     
     await ctx.connect(auto_subscribe=agents.AutoSubscribe.AUDIO_ONLY)
+    timer.mark("connect")
+    
+    store = await shared_account_store()
+    ctx.add_shutdown_callback(flush_account_store)
+    timer.mark("store")
     
     participant = await ctx.wait_for_participant()
+    timer.mark("participant")
     logger.info(f"Customer {participant.identity} connected")
     
-    # Collections-specific system prompt
-    initial_ctx = llm.ChatContext()
-    initial_ctx.messages.append(
-        llm.ChatMessage.create(
-            role="system",
-            text="""You are a professional and empathetic collections agent for a financial services company. 
-            Your primary goals are to:
-            1. Help customers resolve their outstanding balances
-            2. Offer flexible payment solutions that work for their situation
-            3. Maintain a respectful and understanding tone
-            4. Ensure compliance with FDCPA regulations
-            
-            Key behaviors:
-            - Always verify the customer's identity before discussing account details
-            - Be empathetic to financial hardships
-            - Clearly explain all payment options available
-            - Never use threatening language or make false statements
-            - Document all payment arrangements accurately
-            - Provide confirmation numbers for all transactions
-            
-            Compliance requirements:
-            - Identify yourself and the company at the beginning
-            - State that this is an attempt to collect a debt
-            - Inform that any information obtained will be used for that purpose
-            - Respect requests to cease communication
-            - Only call between 8 AM and 9 PM local time
-            
-            Start by introducing yourself and asking to verify their identity."""
-        )
-    )
+    # Collections-specific system prompt, identical on every call so the provider can cache it
+    initial_ctx = INBOUND.chat_context()
+    
+    # Per-job plugin wrappers that time each pipeline stage of every turn
+    tracer = TurnTracer("agent_collections")
+    traced = tracer.wrap(plugins)
+    ctx.add_shutdown_callback(flush_latency_dump)
+    
+    # Transcripts and call outcomes, written in batches off the event loop
+    events = shared_event_sink()
+    session = ctx.room.name
+    ctx.add_shutdown_callback(flush_event_sink)
+    
+    # Live call state for dashboards, pushed to the call state hub
+    call_state = shared_call_state()
+    ctx.add_shutdown_callback(flush_call_state)
+    
+    # Keeps the prompt of long calls within budget by summarizing older turns
+    chat_window = ChatWindow.from_env()
+    
+    # Starts the account lookup while the caller is still reading out their SSN last 4 and date of birth
+    prefetcher = AccountPrefetcher.from_env(store)
+    traced["stt"].add_listener(prefetcher.on_speech_event)
+    
+    functions = CollectionsAssistant(store, shared_journal(), shared_outbox(), prefetcher)
+    ctx.add_shutdown_callback(drain_outbox)
     
     # Configure the voice assistant
     assistant = VoiceAssistant(
-        vad=silero.VAD.load(),
-        stt=deepgram.STT(
-            model="nova-2",
-            language="en",
-            smart_format=True,  # Better formatting for numbers and dates
-        ),
-        llm=openai.LLM(
-            model="gpt-4o-mini",
-            temperature=0.3,  # Lower temperature for more consistent responses
-        ),
-        tts=openai.TTS(
-            model="tts-1",
-            voice="nova",  # Professional, calm voice
-            speed=0.95,  # Slightly slower for clarity
-        ),
+        vad=plugins["vad"],
+        stt=traced["stt"],
+        llm=traced["llm"],
+        tts=PipelinedTTS.from_env(traced["tts"], keep_whole=plugins["tts"].has_audio),
         chat_ctx=initial_ctx,
-        fnc_ctx=CollectionsAssistant(),
+        before_llm_cb=chat_window.before_llm_cb,
+        fnc_ctx=functions,
         interrupt_min_words=2,
         preemptive_synthesis=True,  # Start synthesizing while user is speaking
     )
     
+    tracer.attach(assistant)
+    # Waits out the caller's own pauses, and holds the turn while a card number or date is half read
+    endpointing = EndpointPolicy.from_env()
+    attach(assistant, endpointing)
+    timer.mark("assistant")
+    
+    # Compliance recording of both legs, from the frames the pipeline already moves
+    recording = shared_recorder().start(session)
+    recording.attach(assistant, traced["stt"])
+    ctx.add_shutdown_callback(recording.close)
+    
+    call_state.update(session, agent="agent_collections", phase="in_progress", participant=participant.identity)
     assistant.start(ctx.room, participant)
+    timer.mark("start")
     
     # Track call metrics
     call_start = datetime.now()
-    payment_collected = False
-    arrangement_made = False
     
     @assistant.on("function_calls_finished")
     def on_function_calls_finished(called_functions: list[agents.llm.CalledFunction]):
-        nonlocal payment_collected, arrangement_made
-        
         for func in called_functions:
-            logger.info(f"Function: {func.function_info.name}, Result: {func.result}")
-            
-            # Track successful outcomes
-            if func.function_info.name == "process_payment":
-                result = json.loads(func.result)
-                if result.get("success"):
-                    payment_collected = True
-                    logger.info(f"Payment collected: ${result.get('amount')}")
-            
-            elif func.function_info.name == "setup_payment_plan":
-                arrangement_made = True
-                logger.info("Payment arrangement established")
+            events.emit(session, "function_call", name=func.call_info.function_info.name, arguments=func.call_info.arguments, result=func.result)
+        call_state.update(
+            session,
+            identity_confirmed=functions.account_number is not None,
+            payment_secured=functions.payment_collected,
+            arrangement_made=functions.arrangement_made,
+        )
     
     @assistant.on("user_speech_committed")
     def on_user_speech_committed(msg: llm.ChatMessage):
-        logger.info(f"Customer: {msg.content}")
+        events.emit(session, "user_speech", text=msg.content)
     
     @assistant.on("agent_speech_committed")
     def on_agent_speech_committed(msg: llm.ChatMessage):
-        logger.info(f"Agent: {msg.content}")
+        events.emit(session, "agent_speech", text=msg.content)
     
-    @assistant.on("metrics_collected")
-    def on_metrics_collected(metrics: agents.metrics.AssistantMetrics):
-        logger.info(f"Metrics - TTF: {metrics.ttf:.2f}s, Processing: {metrics.processing_time:.2f}s")
+    timer.log()
     
     # Initial greeting with compliance statement
-    await assistant.say(
-        "Hello, this is Sarah from the Financial Recovery Department. "
-        "This is an attempt to collect a debt, and any information obtained will be used for that purpose. "
-        "May I please verify your identity by confirming the last four digits of your social security number and your date of birth?",
-        allow_interruptions=True
-    )
+    await assistant.say(GREETING, allow_interruptions=True)
     
     # Handle session end
     @ctx.room.on("participant_disconnected")
     def on_participant_disconnected(participant: rtc.RemoteParticipant):
         call_duration = (datetime.now() - call_start).total_seconds()
-        logger.info(f"Call ended - Duration: {call_duration:.0f}s, Payment: {payment_collected}, Arrangement: {arrangement_made}")
+        events.emit(
+            session, "call_ended",
+            duration=call_duration, payment_collected=functions.payment_collected, arrangement_made=functions.arrangement_made,
+        )
+        call_state.update(session, phase="ended")
+        logger.info(f"Call ended - Duration: {call_duration:.0f}s, Payment: {functions.payment_collected}, Arrangement: {functions.arrangement_made}")
+        logger.info(f"TTS cache - {get_tts_cache(ctx.proc).stats}")
+        logger.info(f"Outbox - {shared_outbox().metrics()}")
+        logger.info(f"Chat context - {chat_window.stats()}")
+        prefetcher.close()
+        logger.info(f"Account prefetch - {prefetcher.stats()}")
+        logger.info(f"Call events - {events.stats()}")
+        logger.info(f"Endpointing - {endpointing.stats()}")
+        logger.info(f"Recording - {recording.stats()}")
 
 
 if __name__ == "__main__":
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,
             api_key=os.getenv("LIVEKIT_API_KEY"),
             api_secret=os.getenv("LIVEKIT_API_SECRET"),
             ws_url=os.getenv("LIVEKIT_URL"),
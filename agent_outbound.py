@@ -5,13 +5,58 @@ import json
 from typing import Dict, Any, Optional
 from datetime import datetime
 from livekit import agents, rtc
-from livekit.agents import JobContext, WorkerOptions, cli, llm, stt, tts, vad
+from livekit.agents import JobContext, JobProcess, WorkerOptions, cli, llm, stt, tts, vad
 from livekit.agents.voice_assistant import VoiceAssistant
-from livekit.plugins import openai, silero, deepgram
+from amd import MACHINE, VOICEMAIL_TEMPLATE, detect, handle_machine, watch_for_machine
+from callbacks import build_callback, customer_now, parse_callback, shared_callback_log
+from chat_window import ChatWindow
+from endpointing import EndpointPolicy, attach
+from hardship import describe_prescore
+from intent_router import FastPathRouter
+from call_events import flush_event_sink, shared_event_sink
+from call_state import flush_call_state, shared_call_state
+from latency import TurnTracer, flush_latency_dump
+from prewarm import JobTimer, get_plugins, prewarm_process
+from prompts import OUTBOUND
+from recorder import shared_recorder
+from quotes import FULL_PAY_DISCOUNT, quote_balance, shared_quote_book
+from speech_chunker import PipelinedTTS
+from ids import IdempotencyIndex, idempotency_key, new_id
+from utterance_templates import UtteranceTemplate
 
 logger = logging.getLogger("outbound-collections")
 logger.setLevel(logging.INFO)
 
+# Plugin settings, built once per worker process by prewarm()
+PLUGIN_CONFIG = {
+    "stt": {
+        "model": "nova-2",
+        "language": "en",
+        "smart_format": True,
+    },
+    "llm": {
+        "model": "gpt-4o-mini",
+        "temperature": 0.5,
+    },
+    "tts": {
+        "model": "tts-1",
+        "voice": "nova",
+        "speed": 1.0,
+    },
+}
+
+# What to do when an answering machine picks up: "voicemail", "hangup", or "off" to skip detection
+AMD_ON_MACHINE = os.getenv("AMD_ON_MACHINE", "voicemail")
+
+# Opening line; its static segments are cached and only the slots are synthesized per call
+GREETING_TEMPLATE = UtteranceTemplate(
+    "Hello, this is Sarah calling from Financial Services regarding your upcoming payment of "
+    "{amount} due on {due_date}. May I please speak with {name}?"
+)
+
+# Fixed phrases and template segments kept in the TTS audio cache
+CACHED_PHRASES = [GREETING_TEMPLATE, VOICEMAIL_TEMPLATE]
+
 
 class OutboundCollectionsAssistant(agents.llm.FunctionContext):
     """Functions for outbound collection calls"""
@@ -23,9 +68,12 @@ class OutboundCollectionsAssistant(agents.llm.FunctionContext):
             "payment_secured": False,
             "arrangement_made": False,
             "callback_scheduled": False,
+            "identity_confirmed": False,
             "amount_collected": 0,
             "notes": []
         }
+        # Repeated commitments within the call return the original confirmation
+        self.idempotency = IdempotencyIndex()
     
     @agents.llm.ai_callable()
     async def confirm_speaking_with_customer(
@@ -35,6 +83,7 @@ class OutboundCollectionsAssistant(agents.llm.FunctionContext):
     ) -> str:
         """Confirm we're speaking with the right person"""
         if confirmed:
+            self.call_outcome["identity_confirmed"] = True
             self.call_outcome["notes"].append("Identity confirmed")
             return "Identity confirmed. Proceeding with collection discussion."
         else:
@@ -46,11 +95,18 @@ class OutboundCollectionsAssistant(agents.llm.FunctionContext):
         """Present payment options based on the amount owed"""
         amount = self.customer_info.get("amountOwed", 0)
         
+        # Precomputed by the campaign's quote book when the account is in it, otherwise priced now
+        book = shared_quote_book()
+        account_number = self.customer_info.get("accountNumber")
+        quote = book.get(account_number) if book is not None and account_number else None
+        if quote is None or abs(quote["balance"] - amount) >= 0.005:
+            quote = quote_balance(amount)
+        
         options = f"""Based on your balance of ${amount:.2f}, I can offer you several options:
         
-        1. Pay in full today with a 10% discount: ${amount * 0.9:.2f}
-        2. Split into 3 monthly payments of ${amount / 3:.2f}
-        3. Split into 6 monthly payments of ${amount / 6:.2f}
+        1. Pay in full today with a {FULL_PAY_DISCOUNT:.0%} discount: ${quote['full_pay']:.2f}
+        2. Split into 3 monthly payments of ${quote['plan_3']:.2f}
+        3. Split into 6 monthly payments of ${quote['plan_6']:.2f}
         4. Make a partial payment today of any amount you can afford
         5. Discuss a hardship program if you're experiencing financial difficulties
         
@@ -68,17 +124,27 @@ class OutboundCollectionsAssistant(agents.llm.FunctionContext):
         payment_method: str = "not specified"
     ) -> str:
         """Record a payment commitment from the customer"""
-        self.call_outcome["payment_secured"] = True
-        self.call_outcome["amount_collected"] = amount
-        self.call_outcome["notes"].append(
-            f"Payment commitment: {payment_type} - ${amount} on {payment_date} via {payment_method}"
-        )
-        
-        confirmation = f"""Perfect! I've recorded your commitment to pay ${amount:.2f} on {payment_date}.
-        You'll receive a confirmation email shortly with all the details.
-        Your confirmation number is: CONF-{datetime.now().strftime('%Y%m%d%H%M%S')}"""
+        async def record_commitment() -> str:
+            self.call_outcome["payment_secured"] = True
+            self.call_outcome["amount_collected"] = amount
+            self.call_outcome["notes"].append(
+                f"Payment commitment: {payment_type} - ${amount} on {payment_date} via {payment_method}"
+            )
+            
+            confirmation = f"""Perfect! I've recorded your commitment to pay ${amount:.2f} on {payment_date}.
+            You'll receive a confirmation email shortly with all the details.
+            Your confirmation number is: {new_id("CONF")}"""
+            
+            return confirmation
         
-        return confirmation
+        key = idempotency_key(
+            "process_payment_commitment",
+            payment_type=payment_type,
+            amount=amount,
+            payment_date=payment_date,
+            payment_method=payment_method,
+        )
+        return await self.idempotency.run(key, record_commitment)
     
     @agents.llm.ai_callable()
     async def schedule_callback(
@@ -88,10 +154,21 @@ class OutboundCollectionsAssistant(agents.llm.FunctionContext):
         reason: str
     ) -> str:
         """Schedule a callback if customer can't commit now"""
+        when = parse_callback(date, time, customer_now(self.customer_info))
+        if when is None:
+            return (
+                f"Could not schedule a callback for {date} at {time}. Ask the customer for a specific day "
+                f"in the next 30 days and a time between 8 AM and 9 PM their time."
+            )
+        
+        # Durable: the callback runner dials it when due, even after this job has ended
+        callback = build_callback(self.customer_info, when, reason)
+        await shared_callback_log().add(callback)
+        spoken = when.strftime("%A, %B %d at %I:%M %p").replace(" 0", " ")
         self.call_outcome["callback_scheduled"] = True
-        self.call_outcome["notes"].append(f"Callback scheduled: {date} at {time} - {reason}")
+        self.call_outcome["notes"].append(f"Callback {callback['callback_id']} scheduled: {when.isoformat()} - {reason}")
         
-        return f"I've scheduled a callback for {date} at {time}. We'll discuss {reason} then."
+        return f"I've scheduled a callback for {spoken}. We'll discuss {reason} then."
     
     @agents.llm.ai_callable()
     async def handle_dispute(
@@ -118,128 +195,236 @@ class OutboundCollectionsAssistant(agents.llm.FunctionContext):
         return json.dumps(summary)
 
 
-async def entrypoint(ctx: JobContext):
-    """Main entry point for outbound collection calls"""
-    
-    # Connect to the room
-    await ctx.connect(auto_subscribe=agents.AutoSubscribe.AUDIO_ONLY)
-    
-    # Get customer info from room metadata
-    room = ctx.room
-    metadata = json.loads(room.metadata) if room.metadata else {}
+def hydrate_customer_info(room_metadata: str) -> Dict[str, Any]:
+    """Build the customer context for the call from the room metadata set by initiate-call"""
+    metadata = json.loads(room_metadata) if room_metadata else {}
     
     customer_info = {
         "phoneNumber": metadata.get("phoneNumber", "Unknown"),
+        "accountNumber": metadata.get("accountNumber"),
+        # IANA zone set by the dialer; callbacks are scheduled in the customer's local time
+        "timezone": metadata.get("timezone"),
+        # Set by the campaign from `python hardship.py`, so the hardship path can be offered on turn one
+        "hardshipPrescore": metadata.get("hardshipPrescore"),
         "customerName": metadata.get("customerName", "Customer"),
         "amountOwed": float(metadata.get("amountOwed", 0)),
         "paymentDueDate": metadata.get("paymentDueDate", datetime.now().strftime("%Y-%m-%d"))
     }
     
-    logger.info(f"Initiating outbound call to {customer_info['phoneNumber']} for {customer_info['customerName']}")
-    
-    # Create system prompt based on customer info
     # Calculate days until payment due
     due_date = datetime.strptime(customer_info['paymentDueDate'], "%Y-%m-%d")
-    today = datetime.now()
-    days_until_due = (due_date - today).days
-    
-    system_prompt = f"""You are a professional debt collection agent making an outbound call.
-    
-    Customer Information:
-    - Name: {customer_info['customerName']}
-    - Amount Owed: ${customer_info['amountOwed']:.2f}
-    - Payment Due Date: {customer_info['paymentDueDate']} ({days_until_due} days from now)
-    
-    Your objectives:
-    1. Confirm you're speaking with {customer_info['customerName']}
-    2. Remind them about the payment of ${customer_info['amountOwed']:.2f} due on {customer_info['paymentDueDate']}
-    3. Understand their ability to make the payment on time
-    4. If they can't pay by the due date, offer alternative arrangements
-    5. Secure a firm commitment for payment
-    6. If unable to commit, understand why and schedule follow-up
-    
-    Guidelines:
-    - Be professional but empathetic
-    - Focus on the upcoming due date
-    - Never threaten or use aggressive language
-    - Comply with FDCPA regulations
-    - Listen to their situation before offering solutions
-    - Document the outcome of the call
-    
-    Start the conversation by introducing yourself and confirming their identity."""
-    
-    initial_ctx = llm.ChatContext()
-    initial_ctx.messages.append(
-        llm.ChatMessage.create(role="system", text=system_prompt)
+    customer_info["daysUntilDue"] = (due_date - datetime.now()).days
+    
+    return customer_info
+
+
+def build_chat_context(customer_info: Dict[str, Any]) -> llm.ChatContext:
+    """Initial context for a call: the shared static prompt, then this customer's details"""
+    return OUTBOUND.chat_context(
+        name=customer_info['customerName'],
+        amount=f"${customer_info['amountOwed']:.2f}",
+        due_date=customer_info['paymentDueDate'],
+        days_until_due=customer_info['daysUntilDue'],
+        hardship=describe_prescore(customer_info.get('hardshipPrescore')),
     )
+
+
+def build_greeting(customer_info: Dict[str, Any]) -> str:
+    """Opening line spoken as soon as the callee answers"""
+    return GREETING_TEMPLATE.render(
+        amount=f"${customer_info['amountOwed']:.2f}",
+        due_date=customer_info['paymentDueDate'],
+        name=customer_info['customerName'],
+    )
+
+
+def prewarm(proc: JobProcess):
+    """Load the VAD model and plugin clients before the worker accepts jobs"""
+    prewarm_process(proc, {"outbound": PLUGIN_CONFIG}, {"outbound": CACHED_PHRASES})
+
+
+async def entrypoint(ctx: JobContext):
+    """Main entry point for outbound collection calls"""
+    timer = JobTimer("outbound")
+    plugins = get_plugins(ctx.proc, "outbound", PLUGIN_CONFIG)
+    plugins["tts"].populate_missing()
+    timer.mark("plugins")
+    
+    # Connect to the room
+    await ctx.connect(auto_subscribe=agents.AutoSubscribe.AUDIO_ONLY)
+    timer.mark("connect")
+    
+    # Start waiting for the callee right away; everything up to the greeting overlaps with ringing
+    participant_task = asyncio.create_task(ctx.wait_for_participant())
+    
+    # Get customer info from room metadata
+    customer_info = hydrate_customer_info(ctx.room.metadata)
+    timer.mark("hydrate")
+    logger.info(f"Initiating outbound call to {customer_info['phoneNumber']} for {customer_info['customerName']}")
+    
+    # Synthesize the greeting while the phone rings so it plays the moment the callee picks up
+    greeting = build_greeting(customer_info)
+    greeting_task = asyncio.create_task(plugins["tts"].prefetch(greeting))
+    
+    def on_greeting_synthesized(task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception():
+            logger.warning(f"Greeting prefetch failed, it will be synthesized on pickup: {task.exception()}")
+            return
+        timer.mark("greeting_synthesized")
+    
+    greeting_task.add_done_callback(on_greeting_synthesized)
+    
+    initial_ctx = build_chat_context(customer_info)
+    
+    # Per-job plugin wrappers that time each pipeline stage of every turn
+    tracer = TurnTracer("agent_outbound")
+    traced = tracer.wrap(plugins)
+    ctx.add_shutdown_callback(flush_latency_dump)
+    
+    # Transcripts and call outcomes, written in batches off the event loop
+    events = shared_event_sink()
+    session = ctx.room.name
+    ctx.add_shutdown_callback(flush_event_sink)
+    
+    # Live call state for dashboards, pushed to the call state hub
+    call_state = shared_call_state()
+    ctx.add_shutdown_callback(flush_call_state)
+    call_state.update(session, agent="agent_outbound", phase="ringing")
+    
+    # Keeps the prompt of long calls within budget by summarizing older turns
+    chat_window = ChatWindow.from_env()
+    
+    # Answers predictable turns locally, everything else goes to the LLM
+    fnc_ctx = OutboundCollectionsAssistant(customer_info)
+    router = FastPathRouter.from_env(fnc_ctx, customer_info, before_llm=chat_window.before_llm_cb)
     
     # Configure the voice assistant
     assistant = VoiceAssistant(
-        vad=silero.VAD.load(),
-        stt=deepgram.STT(
-            model="nova-2",
-            language="en",
-            smart_format=True,
-        ),
-        llm=openai.LLM(
-            model="gpt-4o-mini",
-            temperature=0.5,
-        ),
-        tts=openai.TTS(
-            model="tts-1",
-            voice="nova",
-            speed=1.0,
-        ),
+        vad=plugins["vad"],
+        stt=traced["stt"],
+        llm=traced["llm"],
+        tts=PipelinedTTS.from_env(traced["tts"], keep_whole=plugins["tts"].has_audio),
         chat_ctx=initial_ctx,
-        fnc_ctx=OutboundCollectionsAssistant(customer_info),
+        before_llm_cb=router.before_llm_cb,
+        fnc_ctx=fnc_ctx,
         interrupt_min_words=2,
     )
+    tracer.attach(assistant)
+    # Waits out the caller's own pauses, and holds the turn while a card number or date is half read
+    endpointing = EndpointPolicy.from_env()
+    attach(assistant, endpointing)
+    timer.mark("assistant")
     
     # Wait for participant (the person being called)
-    participant = await ctx.wait_for_participant()
+    participant = await participant_task
+    timer.mark("participant")
     logger.info(f"Call connected with {participant.identity}")
     
+    # Compliance recording of both legs from pickup, so screening and voicemail drops are kept too
+    recording = shared_recorder().start(session)
+    ctx.add_shutdown_callback(recording.close)
+    
+    async def on_answering_machine():
+        call_state.update(session, phase="voicemail")
+        voicemail = VOICEMAIL_TEMPLATE.render(name=customer_info['customerName']) if AMD_ON_MACHINE == "voicemail" else None
+        outcome = await handle_machine(ctx.room, participant, plugins["vad"], plugins["tts"], voicemail, recording)
+        fnc_ctx.call_outcome["notes"].append(f"Answering machine: {outcome}")
+        events.emit(session, "answering_machine", outcome=outcome)
+        call_state.update(session, phase="ended", outcome=f"answering machine: {outcome}")
+        logger.info(f"Answering machine on {customer_info['phoneNumber']}: {outcome}")
+        ctx.shutdown(reason="answering machine")
+    
+    # Hear how the callee answers before starting the pipeline, so machines cost no LLM or TTS turns
+    if AMD_ON_MACHINE != "off":
+        call_state.update(session, phase="screening", participant=participant.identity)
+        detection = await detect(participant, plugins["vad"], plugins["stt"], recording=recording)
+        timer.mark("amd")
+        logger.info(f"Answering machine detection: {detection}")
+        if detection["label"] == MACHINE:
+            await on_answering_machine()
+            return
+        
+        # A machine that paused like a person gives itself away in the first transcripts
+        async def on_late_machine():
+            await assistant.aclose()
+            await on_answering_machine()
+        
+        watch_for_machine(traced["stt"], lambda cue: asyncio.create_task(on_late_machine()))
+    
     # Start the assistant
+    recording.attach(assistant, traced["stt"])
+    call_state.update(session, phase="in_progress", participant=participant.identity)
     assistant.start(ctx.room, participant)
+    timer.mark("start")
     
     # Track call metrics
     call_start = datetime.now()
+    greeting_started = False
+    
+    @assistant.on("agent_started_speaking")
+    def on_agent_started_speaking():
+        nonlocal greeting_started
+        if not greeting_started:
+            greeting_started = True
+            timer.mark("first_audio")
+            timer.log()
+    
+    def sync_call_state():
+        # Tools and fast-path replies both update the outcome; only changed fields are pushed
+        outcome = fnc_ctx.call_outcome
+        call_state.update(
+            session,
+            identity_confirmed=outcome["identity_confirmed"],
+            payment_secured=outcome["payment_secured"],
+            amount_collected=outcome["amount_collected"],
+            callback_scheduled=outcome["callback_scheduled"],
+        )
     
     @assistant.on("user_speech_committed")
     def on_user_speech(msg: llm.ChatMessage):
-        logger.info(f"Customer: {msg.content}")
+        events.emit(session, "user_speech", text=msg.content)
     
     @assistant.on("agent_speech_committed")  
     def on_agent_speech(msg: llm.ChatMessage):
-        logger.info(f"Agent: {msg.content}")
+        events.emit(session, "agent_speech", text=msg.content)
+        sync_call_state()
     
     @assistant.on("function_calls_finished")
     def on_functions_called(called_functions: list[agents.llm.CalledFunction]):
         for func in called_functions:
-            logger.info(f"Function called: {func.function_info.name}")
-    
-    # Initial greeting
-    await assistant.say(
-        f"Hello, this is Sarah calling from Financial Services regarding your upcoming payment of "
-        f"${customer_info['amountOwed']:.2f} due on {customer_info['paymentDueDate']}. "
-        f"May I please speak with {customer_info['customerName']}?",
-        allow_interruptions=True
-    )
+            events.emit(session, "function_call", name=func.call_info.function_info.name, arguments=func.call_info.arguments, result=func.result)
+        sync_call_state()
+    
+    # Initial greeting, served from the prefetched audio (or synthesized live if prefetch failed)
+    await assistant.say(greeting, allow_interruptions=True)
     
     # Handle call end
     @ctx.room.on("participant_disconnected")
     def on_participant_disconnected(participant: rtc.RemoteParticipant):
         call_duration = (datetime.now() - call_start).total_seconds()
+        # A snapshot, since the event is serialized later and the outcome is a live dict
+        outcome = {**fnc_ctx.call_outcome, "notes": list(fnc_ctx.call_outcome["notes"])}
+        events.emit(session, "call_ended", duration=call_duration, outcome=outcome)
+        sync_call_state()
+        call_state.update(session, phase="ended")
         logger.info(f"Call ended - Duration: {call_duration:.0f}s")
+        logger.info(f"Chat context - {chat_window.stats()}")
+        logger.info(f"Fast path - {router.stats()}")
+        logger.info(f"Call events - {events.stats()}")
+        logger.info(f"Endpointing - {endpointing.stats()}")
+        logger.info(f"Recording - {recording.stats()}")
         
         # Generate final summary
-        assistant.fnc_ctx.end_call_summary()
+        asyncio.create_task(assistant.fnc_ctx.end_call_summary())
 
 
 if __name__ == "__main__":
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,
             api_key=os.getenv("LIVEKIT_API_KEY"),
             api_secret=os.getenv("LIVEKIT_API_SECRET"),
             ws_url=os.getenv("LIVEKIT_URL"),
@@ -0,0 +1,404 @@
+"""Answering machine detection for outbound calls
+
+Runs on the first seconds of the callee's audio, before the voice pipeline starts. People
+answer with a short greeting and then wait for the caller; machines play a long greeting
+without stopping. The cadence comes from the Silero VAD the worker already loads. Plenty of
+people answer at length too, so a long greeting only makes the callee a suspect: a call is
+treated as a machine once a transcript cue such as "leave a message" or a beep confirms it.
+
+On a machine the agent either leaves a limited-content voicemail, once the greeting and
+beep are over, or hangs up. Accuracy and detection latency are measured offline with
+`python benchmarks/amd_eval.py`.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+import numpy as np
+from livekit import api, rtc
+from livekit.agents import stt, vad
+from recorder import CallRecording
+from utterance_templates import UtteranceTemplate
+
+logger = logging.getLogger("amd")
+logger.setLevel(logging.INFO)
+
+HUMAN = "human"
+MACHINE = "machine"
+
+# The VAD model runs at 16kHz, so the callee's audio is resampled once for it
+SAMPLE_RATE = 16000
+FRAME_MS = 20
+
+MACHINE_CUES = re.compile(
+    r"\b(leave (a|your|me a) (message|name)|after the (tone|beep)|at the (tone|beep)|record your message|"
+    r"not available|unavailable|voice ?mail|mailbox|(you have|you've) reached|"
+    r"(can't|cannot|can not|unable to) (take|come to|answer)|press (one|1|pound)|get back to you)\b"
+)
+
+# After a human decision the transcripts are watched this long for a machine that paused like a person.
+# By then the callee is talking to the agent, and a person may well say they are not available or
+# will get back to us, so only phrases a person would not say to a caller count.
+LATE_CUE_WINDOW = 8.0
+LATE_MACHINE_CUES = re.compile(
+    r"\b(beep|leave (a|your|me a) message|after the (tone|beep)|at the (tone|beep)|record your message)\b"
+)
+
+# Limited-content message (Reg F, 12 CFR 1006.2(j)): the consumer's name, a request to reply, the
+# name of the person to contact and a number. Nothing about the debt or the business.
+CALLBACK_NUMBER = os.getenv("COLLECTIONS_CALLBACK_NUMBER", "1-800-555-0100")
+VOICEMAIL_TEMPLATE = UtteranceTemplate(
+    "Hello, this message is for {name}. This is Sarah, please give me a call back at "
+    f"{CALLBACK_NUMBER}. Thank you, and have a good day."
+)
+
+
+def dominant_tone(samples: np.ndarray, sample_rate: int) -> Tuple[float, float]:
+    """Strongest frequency between 400 and 2500 Hz and its share of the frame's energy; close to 1 for a beep"""
+    samples = samples.astype(np.float32)
+    spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples)))) ** 2
+    total = spectrum.sum()
+    if total <= 0:
+        return 0.0, 0.0
+    freqs = np.fft.rfftfreq(len(samples), 1 / sample_rate)
+    peak = int(np.argmax(np.where((freqs >= 400) & (freqs <= 2500), spectrum, 0)))
+    return float(freqs[peak]), float(spectrum[max(0, peak - 2):peak + 3].sum() / total)
+
+
+def steady_tone(samples: np.ndarray, sample_rate: int, previous: Optional[float] = None) -> Optional[float]:
+    """Frequency of the frame if it is a pure tone, and the same tone as `previous` when that is given"""
+    frequency, ratio = dominant_tone(samples, sample_rate) if np.abs(samples).mean() > 300 else (0.0, 0.0)
+    # A beep holds one pitch; voiced speech can be as narrowband for a moment, but its pitch moves
+    if ratio >= 0.9 and (previous is None or abs(frequency - previous) <= 2 * sample_rate / len(samples)):
+        return frequency
+    return None
+
+
+def machine_cue(text: str) -> Optional[str]:
+    """The phrase that gives a machine greeting away, if the text has one"""
+    cue = MACHINE_CUES.search(text.lower())
+    return cue.group(0) if cue else None
+
+
+def late_machine_cue(text: str) -> Optional[str]:
+    """The phrase that gives a machine away once a person has been assumed"""
+    cue = LATE_MACHINE_CUES.search(text.lower())
+    return cue.group(0) if cue else None
+
+
+class AnsweringMachineDetector:
+    """Decides human or machine from VAD speech probabilities and interim transcripts
+
+    Times are seconds of callee audio since it started. A transcript cue or a beep of at least
+    `min_beep` is a machine. A greeting followed by `human_silence` of quiet is a person waiting
+    for the caller, and so is a callee who says nothing for `max_initial_silence`. A greeting that
+    runs longer than `max_greeting`, or has more than `max_greeting_words` words, is only
+    suspected: without a cue or a beep by `timeout` it is taken for a person, and the pipeline's
+    late cue check is left to catch a machine. The result's "suspected" names the suspicion.
+    """
+
+    def __init__(
+        self,
+        activation_threshold: float = 0.5,
+        min_speech: float = 0.1,
+        max_initial_silence: float = 3.0,
+        max_greeting: float = 2.0,
+        human_silence: float = 0.7,
+        max_greeting_words: int = 7,
+        min_beep: float = 0.2,
+        timeout: float = 5.0,
+    ):
+        self.activation_threshold = activation_threshold
+        self.min_speech = min_speech
+        self.max_initial_silence = max_initial_silence
+        self.max_greeting = max_greeting
+        self.human_silence = human_silence
+        self.max_greeting_words = max_greeting_words
+        self.min_beep = min_beep
+        self.timeout = timeout
+        self.result: Optional[Dict[str, Any]] = None
+        self.suspected: Optional[str] = None
+        self._at = 0.0
+        self._voiced = 0.0
+        self._first_speech: Optional[float] = None
+        self._last_speech: Optional[float] = None
+        self._beep = 0.0
+        self._beep_frequency: Optional[float] = None
+
+    def on_vad(self, at: float, probability: float) -> Optional[Dict[str, Any]]:
+        """Feed one VAD inference; returns the decision once there is one"""
+        if self.result is not None:
+            return self.result
+        elapsed, self._at = at - self._at, at
+
+        if probability >= self.activation_threshold:
+            self._voiced += elapsed
+            if self._voiced >= self.min_speech:
+                if self._first_speech is None:
+                    self._first_speech = at - self._voiced
+                self._last_speech = at
+        else:
+            self._voiced = 0.0
+
+        if self._first_speech is None:
+            if at >= self.max_initial_silence:
+                return self._decide(HUMAN, "silent pickup", at)
+        else:
+            if self.suspected is None and self._last_speech - self._first_speech >= self.max_greeting:
+                self.suspected = "long greeting"
+            if at - self._last_speech >= self.human_silence:
+                return self._decide(HUMAN, "short greeting" if self.suspected is None else "waited after a long greeting", at)
+        if at >= self.timeout:
+            return self.finish(at)
+        return None
+
+    def on_transcript(self, at: float, text: str) -> Optional[Dict[str, Any]]:
+        """Feed an interim or final transcript of the greeting so far"""
+        if self.result is not None:
+            return self.result
+        cue = machine_cue(text)
+        if cue:
+            return self._decide(MACHINE, f"said {cue!r}", at)
+        if self.suspected is None and len(text.split()) > self.max_greeting_words:
+            self.suspected = "wordy greeting"
+        return None
+
+    def on_frame(self, at: float, samples: np.ndarray, sample_rate: int) -> Optional[Dict[str, Any]]:
+        """Feed one frame of audio ending at `at`; a beep decides machine"""
+        if self.result is not None:
+            return self.result
+        frequency = steady_tone(samples, sample_rate, self._beep_frequency)
+        if frequency is None:
+            self._beep, self._beep_frequency = 0.0, None
+            return None
+        self._beep += len(samples) / sample_rate
+        self._beep_frequency = frequency
+        if self._beep >= self.min_beep:
+            return self._decide(MACHINE, "beep", at)
+        return None
+
+    def finish(self, at: float) -> Dict[str, Any]:
+        # Talking past the timeout is only cadence; the late cue check gets the last word
+        if self.result is None:
+            self._decide(HUMAN, "timeout" if self.suspected is None else f"unconfirmed {self.suspected}", at)
+        return self.result
+
+    def _decide(self, label: str, reason: str, at: float) -> Dict[str, Any]:
+        self.result = {"label": label, "reason": reason, "at": round(at, 3), "suspected": self.suspected}
+        return self.result
+
+
+class GreetingEndDetector:
+    """Decides when a machine's greeting is over, so the voicemail starts after it
+
+    That is the end of its beep, `silence` of quiet when it has no beep, or `timeout`.
+    """
+
+    def __init__(self, silence: float = 1.5, min_beep: float = 0.2, timeout: float = 20.0, activation_threshold: float = 0.5):
+        self.silence = silence
+        self.min_beep = min_beep
+        self.timeout = timeout
+        self.activation_threshold = activation_threshold
+        self._beep = 0.0
+        self._beep_frequency = 0.0
+        self._quiet_since: Optional[float] = 0.0
+
+    def on_vad(self, at: float, probability: float) -> None:
+        if probability >= self.activation_threshold:
+            self._quiet_since = None
+        elif self._quiet_since is None:
+            self._quiet_since = at
+
+    def on_frame(self, at: float, samples: np.ndarray, sample_rate: int) -> Optional[str]:
+        """Feed one frame of audio ending at `at`; returns why the greeting is over, once it is"""
+        duration = len(samples) / sample_rate
+        frequency = steady_tone(samples, sample_rate, self._beep_frequency if self._beep else None)
+        if frequency is not None:
+            self._beep += duration
+            self._beep_frequency = frequency
+        elif self._beep >= self.min_beep:
+            return "beep"
+        else:
+            self._beep = 0.0
+        if self._quiet_since is not None and self._beep == 0.0 and at - self._quiet_since >= self.silence:
+            return "silence"
+        if at >= self.timeout:
+            return "timeout"
+        return None
+
+
+def callee_audio(participant: rtc.RemoteParticipant) -> rtc.AudioStream:
+    return rtc.AudioStream.from_participant(
+        participant=participant,
+        track_source=rtc.TrackSource.SOURCE_MICROPHONE,
+        sample_rate=SAMPLE_RATE,
+        frame_size_ms=FRAME_MS,
+    )
+
+
+async def detect(
+    participant: rtc.RemoteParticipant,
+    vad_model: vad.VAD,
+    stt_client: Optional[stt.STT] = None,
+    detector: Optional[AnsweringMachineDetector] = None,
+    recording: Optional[CallRecording] = None,
+) -> Dict[str, Any]:
+    """Listen to the callee until the detector decides human or machine"""
+    detector = detector or AnsweringMachineDetector()
+    audio = callee_audio(participant)
+    vad_stream = vad_model.stream()
+    stt_stream = stt_client.stream() if stt_client is not None else None
+    heard = 0.0
+
+    async def read_audio() -> None:
+        nonlocal heard
+        async for event in audio:
+            heard += event.frame.samples_per_channel / event.frame.sample_rate
+            if recording is not None:
+                recording.on_caller_frame(event.frame)
+            vad_stream.push_frame(event.frame)
+            if stt_stream is not None:
+                stt_stream.push_frame(event.frame)
+            if detector.on_frame(heard, np.frombuffer(event.frame.data, dtype=np.int16), event.frame.sample_rate):
+                return
+            if heard >= detector.timeout:
+                return
+
+    async def read_vad() -> None:
+        async for event in vad_stream:
+            if event.type == vad.VADEventType.INFERENCE_DONE and detector.on_vad(event.samples_index / SAMPLE_RATE, event.probability):
+                return
+
+    async def read_transcripts() -> None:
+        async for event in stt_stream:
+            if event.type in (stt.SpeechEventType.INTERIM_TRANSCRIPT, stt.SpeechEventType.FINAL_TRANSCRIPT) and event.alternatives:
+                if detector.on_transcript(heard, event.alternatives[0].text):
+                    return
+
+    reader = asyncio.create_task(read_audio())
+    pending = {reader, asyncio.create_task(read_vad())}
+    if stt_stream is not None:
+        pending.add(asyncio.create_task(read_transcripts()))
+    try:
+        while detector.result is None and reader in pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        # Past the timeout, or the callee hung up: decide on what was heard
+        return detector.finish(heard)
+    finally:
+        for task in pending:
+            task.cancel()
+        await audio.aclose()
+        await vad_stream.aclose()
+        if stt_stream is not None:
+            await stt_stream.aclose()
+
+
+async def wait_for_greeting_end(
+    participant: rtc.RemoteParticipant,
+    vad_model: vad.VAD,
+    detector: Optional[GreetingEndDetector] = None,
+    recording: Optional[CallRecording] = None,
+) -> str:
+    """Listen to a machine until its greeting is over; returns why it is considered over"""
+    detector = detector or GreetingEndDetector()
+    audio = callee_audio(participant)
+    vad_stream = vad_model.stream()
+
+    async def read_vad() -> None:
+        async for event in vad_stream:
+            if event.type == vad.VADEventType.INFERENCE_DONE:
+                detector.on_vad(event.samples_index / SAMPLE_RATE, event.probability)
+
+    vad_task = asyncio.create_task(read_vad())
+    heard = 0.0
+    try:
+        async for event in audio:
+            frame = event.frame
+            heard += frame.samples_per_channel / frame.sample_rate
+            if recording is not None:
+                recording.on_caller_frame(frame)
+            vad_stream.push_frame(frame)
+            reason = detector.on_frame(heard, np.frombuffer(frame.data, dtype=np.int16), frame.sample_rate)
+            if reason is not None:
+                return reason
+        return "hung up"
+    finally:
+        vad_task.cancel()
+        await audio.aclose()
+        await vad_stream.aclose()
+
+
+async def play(room: rtc.Room, tts_client, text: str, recording: Optional[CallRecording] = None) -> None:
+    """Speak text into the room on its own track, without a voice assistant"""
+    source: Optional[rtc.AudioSource] = None
+    async for audio in tts_client.synthesize(text):
+        if source is None:
+            source = rtc.AudioSource(audio.frame.sample_rate, audio.frame.num_channels)
+            track = rtc.LocalAudioTrack.create_audio_track("voicemail", source)
+            if recording is not None:
+                source = recording.source(source)
+            await room.local_participant.publish_track(
+                track, rtc.TrackPublishOptions(source=rtc.TrackSource.SOURCE_MICROPHONE)
+            )
+        await source.capture_frame(audio.frame)
+    if source is not None:
+        await source.wait_for_playout()
+
+
+async def hang_up(room_name: str, identity: str) -> None:
+    """Disconnect the callee; for a SIP participant this ends the phone call"""
+    lkapi = api.LiveKitAPI()
+    try:
+        await lkapi.room.remove_participant(api.RoomParticipantIdentity(room=room_name, identity=identity))
+    finally:
+        await lkapi.aclose()
+
+
+def watch_for_machine(tapped_stt, on_machine: Callable[[str], None], window: float = LATE_CUE_WINDOW) -> None:
+    """Check the first transcripts after a human decision for a machine that paused like a person would"""
+    deadline = time.monotonic() + window
+    done = False
+
+    def listener(event: stt.SpeechEvent) -> None:
+        nonlocal done
+        if done or event.type not in (stt.SpeechEventType.INTERIM_TRANSCRIPT, stt.SpeechEventType.FINAL_TRANSCRIPT):
+            return
+        expired = time.monotonic() > deadline
+        cue = None if expired or not event.alternatives else late_machine_cue(event.alternatives[0].text)
+        if expired or cue:
+            done = True
+            # The tap is iterating its listeners, so remove this one afterwards
+            asyncio.get_running_loop().call_soon(tapped_stt.remove_listener, listener)
+        if cue:
+            on_machine(cue)
+
+    tapped_stt.add_listener(listener)
+
+
+async def handle_machine(
+    room: rtc.Room,
+    participant: rtc.RemoteParticipant,
+    vad_model: vad.VAD,
+    tts_client,
+    voicemail: Optional[str],
+    recording: Optional[CallRecording] = None,
+) -> str:
+    """Leave `voicemail` once the machine's greeting is over, or only hang up when it is None; returns what happened"""
+    outcome = "hung up"
+    if voicemail is not None:
+        # The message's name slot synthesizes while the greeting plays out
+        prefetch = asyncio.create_task(tts_client.prefetch(voicemail))
+        ended = await wait_for_greeting_end(participant, vad_model, recording=recording)
+        if ended == "hung up":
+            prefetch.cancel()
+            return "machine hung up"
+        try:
+            await prefetch
+        except Exception as e:
+            logger.warning(f"Voicemail prefetch failed, synthesizing it live: {e}")
+        await play(room, tts_client, voicemail, recording)
+        outcome = f"voicemail left after {ended}"
+    await hang_up(room.name, participant.identity)
+    return outcome
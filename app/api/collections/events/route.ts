@@ -0,0 +1,35 @@
+import { NextResponse } from 'next/server';
+
+export const dynamic = 'force-dynamic';
+
+// Relays the call state hub's Server-Sent Events: a snapshot of every call, then coalesced deltas
+export async function GET() {
+  const callStateUrl = process.env.CALL_STATE_URL;
+  if (!callStateUrl) {
+    return NextResponse.json(
+      { error: 'CALL_STATE_URL is not configured' },
+      { status: 503 }
+    );
+  }
+
+  try {
+    const upstream = await fetch(`${callStateUrl}/events`, { cache: 'no-store' });
+    if (!upstream.ok || !upstream.body) {
+      throw new Error(`Call state hub returned ${upstream.status}`);
+    }
+
+    return new Response(upstream.body, {
+      headers: {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        Connection: 'keep-alive',
+      },
+    });
+  } catch (error) {
+    console.error('Error connecting to call state hub:', error);
+    return NextResponse.json(
+      { error: 'Call state feed unavailable' },
+      { status: 502 }
+    );
+  }
+}
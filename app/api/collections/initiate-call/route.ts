@@ -3,7 +3,7 @@ import { RoomServiceClient } from 'livekit-server-sdk';
 
 export async function POST(request: NextRequest) {
   try {
-    const { phoneNumber, customerName, amountOwed, paymentDueDate } = await request.json();
+    const { phoneNumber, customerName, amountOwed, paymentDueDate, accountNumber, hardshipPrescore } = await request.json();
 
     // Validate required fields
     if (!phoneNumber || !customerName || !amountOwed || !paymentDueDate) {
@@ -33,6 +33,9 @@ export async function POST(request: NextRequest) {
         customerName,
         amountOwed,
         paymentDueDate,
+        // Optional, from the quote book and `python hardship.py` batch pre-scoring
+        accountNumber,
+        hardshipPrescore,
         callType: 'outbound_collection',
         initiatedAt: new Date().toISOString(),
       }),
@@ -41,7 +44,7 @@ export async function POST(request: NextRequest) {
     // In production, this would trigger:
     // 1. SIP call to the phone number via LiveKit SIP bridge
     // 2. Agent joins the room automatically
-    // 3. Call recording starts
+    // 3. The agent records both legs of the call (recorder.py)
     
     // For now, we'll simulate the call initiation
     const callData = {
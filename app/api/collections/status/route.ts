@@ -1,6 +1,15 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { RoomServiceClient } from 'livekit-server-sdk';
 
+// Dashboard status for each phase the agents report to the call state hub (call_state.py)
+const PHASE_STATUS: Record<string, string> = {
+  ringing: 'waiting',
+  screening: 'connected',
+  in_progress: 'connected',
+  voicemail: 'connected',
+  ended: 'ended',
+};
+
 export async function GET(request: NextRequest) {
   try {
     const { searchParams } = new URL(request.url);
@@ -13,6 +22,24 @@ export async function GET(request: NextRequest) {
       );
     }
 
+    // Agent-side state pushed by the agents; no LiveKit API calls while the agent owns the call
+    const callStateUrl = process.env.CALL_STATE_URL;
+    if (callStateUrl) {
+      try {
+        const response = await fetch(`${callStateUrl}/calls/${encodeURIComponent(roomName)}`, { cache: 'no-store' });
+        if (response.ok) {
+          const callState = await response.json();
+          return NextResponse.json({
+            status: PHASE_STATUS[callState.phase] || 'unknown',
+            callState,
+          });
+        }
+        // Not picked up by an agent yet: fall through to the room listing
+      } catch (error) {
+        console.warn('Call state hub unavailable, falling back to LiveKit:', error);
+      }
+    }
+
     // Initialize LiveKit Room Service
     const roomService = new RoomServiceClient(
       process.env.NEXT_PUBLIC_LIVEKIT_URL!,
@@ -0,0 +1,157 @@
+"""verify_account wait time with and without speculative prefetch from interim transcripts
+
+    python benchmarks/account_prefetch_bench.py --accounts 100000 --sessions 200 --store-latency 0.1
+
+Each session is a caller reading out their SSN last 4 and date of birth, spoken the way STT
+transcribes it, with interim transcripts growing one word at a time. The final transcript
+follows the last word, and the LLM calls verify_account after its time to first token. Some
+callers correct themselves mid-sentence, which is where prefetches are wasted. --store-latency
+adds a fixed delay to every lookup, to model a store that is further away than local SQLite.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from account_prefetch import AccountPrefetcher
+from account_store import AccountStore, SQLiteAccountStore, normalize_date_of_birth
+from account_store_bench import synthetic_accounts
+
+DIGITS = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine"]
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+ORDINALS = [
+    "", "first", "second", "third", "fourth", "fifth", "sixth", "seventh", "eighth", "ninth", "tenth", "eleventh",
+    "twelfth", "thirteenth", "fourteenth", "fifteenth", "sixteenth", "seventeenth", "eighteenth", "nineteenth", "twentieth",
+]
+TENS = {2: "twenty", 3: "thirty", 4: "forty", 5: "fifty", 6: "sixty", 7: "seventy", 8: "eighty", 9: "ninety"}
+TEENS = ["ten", "eleven", "twelve", "thirteen", "fourteen", "fifteen", "sixteen", "seventeen", "eighteen", "nineteen"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else float("nan")
+
+
+def spoken_two_digits(n: int) -> str:
+    if n < 10:
+        return f"oh {DIGITS[n]}"
+    if n < 20:
+        return TEENS[n - 10]
+    return TENS[n // 10] + (f" {DIGITS[n % 10]}" if n % 10 else "")
+
+
+def spoken_day(day: int) -> str:
+    if day <= 20:
+        return ORDINALS[day]
+    return f"{TENS[day // 10]} {ORDINALS[day % 10]}" if day % 10 else {30: "thirtieth"}.get(day, TENS[day // 10] + "tieth")
+
+
+def spoken_date(iso: str, rng: random.Random) -> str:
+    year, month, day = (int(part) for part in iso.split("-"))
+    if rng.random() < 0.3:
+        # Some STT output formats the date itself
+        return f"{month:02d}/{day:02d}/{year}"
+    if year >= 2000:
+        spoken_year = f"two thousand {DIGITS[year - 2000]}" if year < 2010 else f"twenty {spoken_two_digits(year - 2000)}"
+    else:
+        spoken_year = f"nineteen {spoken_two_digits(year - 1900)}"
+    return f"{MONTH_NAMES[month - 1]} {spoken_day(day)} {spoken_year}"
+
+
+def spoken_last4(last4: str, rng: random.Random) -> str:
+    return last4 if rng.random() < 0.3 else " ".join(DIGITS[int(d)] for d in last4)
+
+
+def utterance(account, rng: random.Random) -> str:
+    """What the caller says, including a self-correction in some sessions"""
+    dob = normalize_date_of_birth(account["date_of_birth"])
+    last4, date = spoken_last4(account["ssn_last4"], rng), spoken_date(dob, rng)
+    if rng.random() < 0.15:
+        wrong = dob[:3] + str((int(dob[3]) + 1) % 10) + dob[4:]
+        return f"Last four {last4}, born {spoken_date(wrong, rng)}, sorry, I mean {date}."
+    if rng.random() < 0.5:
+        return f"Sure, the last four are {last4} and my birthday is {date}."
+    return f"My date of birth is {date} and the last four of my social are {last4}."
+
+
+class SlowStore(AccountStore):
+    """Adds a fixed delay to every lookup of the wrapped store"""
+
+    def __init__(self, wrapped: AccountStore, latency: float):
+        self.wrapped = wrapped
+        self.latency = latency
+
+    async def verify(self, identifier, date_of_birth):
+        await asyncio.sleep(self.latency)
+        return await self.wrapped.verify(identifier, date_of_birth)
+
+
+async def session(store: AccountStore, account, text: str, prefetch: bool, args):
+    """Returns how long verify_account waited on the store, and the prefetcher's counters"""
+    prefetcher = AccountPrefetcher(store, ttl=args.ttl, enabled=prefetch)
+    words = text.split()
+    for i in range(1, len(words) + 1):
+        prefetcher.observe(" ".join(words[:i]), final=False)
+        await asyncio.sleep(1 / args.words_per_second)
+    await asyncio.sleep(args.stt_final_delay)
+    prefetcher.observe(text)
+    await asyncio.sleep(args.llm_ttft)
+
+    # The tool is called with the credentials as the LLM formats them
+    dob = normalize_date_of_birth(account["date_of_birth"])
+    year, month, day = dob.split("-")
+    start = time.perf_counter()
+    found = await prefetcher.verify(account["ssn_last4"], f"{month}/{day}/{year}")
+    waited = time.perf_counter() - start
+    prefetcher.close()
+    return waited, found is not None, prefetcher.stats()
+
+
+async def run(args):
+    path = os.path.join(tempfile.mkdtemp(), "accounts.db")
+    sqlite = SQLiteAccountStore(path)
+    await sqlite.open()
+    await sqlite.load_accounts(synthetic_accounts(args.accounts))
+    store = SlowStore(sqlite, args.store_latency) if args.store_latency else sqlite
+
+    rng = random.Random(5)
+    probes = list(synthetic_accounts(args.accounts))
+    sessions = [(account, utterance(account, rng)) for account in (rng.choice(probes) for _ in range(args.sessions))]
+
+    print(f"{args.sessions} sessions, store latency {args.store_latency * 1000:.0f}ms, LLM TTFT {args.llm_ttft * 1000:.0f}ms")
+    for prefetch in (False, True):
+        results = await asyncio.gather(*(session(store, account, text, prefetch, args) for account, text in sessions))
+        waits = [r[0] * 1000 for r in results]
+        totals = {}
+        for _, _, stats in results:
+            for key, value in stats.items():
+                if key != "hit_rate":
+                    totals[key] = totals.get(key, 0) + value
+        lookups = totals["hits"] + totals["misses"]
+        print(
+            f"  prefetch {'on ' if prefetch else 'off'}  verify wait p50 {percentile(waits, 50):.1f}ms  p95 {percentile(waits, 95):.1f}ms  "
+            f"verified {sum(r[1] for r in results)}/{len(results)}"
+        )
+        if prefetch:
+            print(
+                f"    prefetched {totals['prefetched']}, hit rate {totals['hits'] / lookups:.2f} "
+                f"({totals['ready_on_call']} ready when the tool ran), wasted {totals['wasted']}, saved {totals['saved_ms'] / len(results):.0f}ms per call"
+            )
+    await sqlite.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=100_000)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--store-latency", type=float, default=0.1, help="Extra seconds per lookup")
+    parser.add_argument("--words-per-second", type=float, default=2.5)
+    parser.add_argument("--stt-final-delay", type=float, default=0.2)
+    parser.add_argument("--llm-ttft", type=float, default=0.3)
+    parser.add_argument("--ttl", type=float, default=30.0)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,85 @@
+"""Lookup latency of the SQLite account store at production-scale row counts
+
+    python benchmarks/account_store_bench.py --accounts 1000000 --lookups 20000 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from account_store import SQLiteAccountStore
+
+
+def synthetic_accounts(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield {
+            "account_number": f"AC{i:09d}",
+            "ssn_last4": f"{rng.randrange(10000):04d}",
+            "date_of_birth": f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/{rng.randint(1940, 2004)}",
+            "balance": round(rng.uniform(100, 20000), 2),
+            "past_due": round(rng.uniform(0, 2000), 2),
+            "days_overdue": rng.randint(0, 180),
+            "last_payment_date": "2024-06-15",
+            "minimum_payment": round(rng.uniform(25, 300), 2),
+        }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(args):
+    path = args.db or os.path.join(tempfile.mkdtemp(), "accounts.db")
+    store = SQLiteAccountStore(path, pool_size=args.pool_size)
+    await store.open()
+
+    if await store.count_accounts() < args.accounts:
+        start = time.perf_counter()
+        loaded = await store.load_accounts(synthetic_accounts(args.accounts))
+        print(f"Loaded {loaded} accounts in {time.perf_counter() - start:.1f}s ({path})")
+
+    probes = list(synthetic_accounts(args.accounts))
+    rng = random.Random(11)
+    samples = {"account_number": [], "ssn_last4+dob": []}
+    queue = asyncio.Queue()
+    for _ in range(args.lookups):
+        account = rng.choice(probes)
+        by_ssn = rng.random() < 0.5
+        queue.put_nowait((account, by_ssn))
+
+    async def worker():
+        while not queue.empty():
+            account, by_ssn = queue.get_nowait()
+            identifier = account["ssn_last4"] if by_ssn else account["account_number"]
+            start = time.perf_counter()
+            await store.verify(identifier, account["date_of_birth"])
+            samples["ssn_last4+dob" if by_ssn else "account_number"].append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    await store.close()
+
+    print(f"{args.lookups} lookups, concurrency {args.concurrency}: {args.lookups / elapsed:.0f} lookups/s")
+    for kind, values in samples.items():
+        print(
+            f"  {kind:15s} p50 {percentile(values, 50):.2f}ms  p95 {percentile(values, 95):.2f}ms  "
+            f"p99 {percentile(values, 99):.2f}ms  max {max(values):.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--db", help="Reuse an existing database file instead of a temporary one")
+    asyncio.run(run(parser.parse_args()))
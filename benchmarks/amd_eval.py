@@ -0,0 +1,265 @@
+"""Precision, recall and detection latency of answering machine detection on local audio fixtures
+
+Each fixture is a 16kHz mono WAV with a JSON sidecar: {"label": "human"|"machine", "scenario": ...,
+"transcript": [[seconds, text], ...], "greeting_end": seconds}. Transcripts are the interim STT
+results for the greeting and when they arrive; greeting_end is when a machine's beep ends.
+The Silero VAD model runs over the audio exactly as it would on a call.
+
+    python benchmarks/amd_eval.py                          # Generate fixtures into a temporary directory and evaluate them
+    python benchmarks/amd_eval.py --generate fixtures/amd --count 400
+    python benchmarks/amd_eval.py --fixtures fixtures/amd --no-transcripts
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import wave
+from collections import Counter, defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from amd import FRAME_MS, HUMAN, LATE_CUE_WINDOW, MACHINE, SAMPLE_RATE, AnsweringMachineDetector, GreetingEndDetector, late_machine_cue
+
+# First three formants of common English vowels
+VOWELS = [(730, 1090, 2440), (270, 2290, 3010), (530, 1840, 2480), (570, 840, 2410), (300, 870, 2240), (660, 1720, 2410), (490, 1350, 1690)]
+NAMES = ["John", "Maria", "David", "Aisha", "Chen", "Emily", "Carlos", "Priya"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def resonator(frequency: float, bandwidth: float, taps: int = 400) -> np.ndarray:
+    """Impulse response of a two-pole formant resonator"""
+    r = np.exp(-np.pi * bandwidth / SAMPLE_RATE)
+    n = np.arange(taps)
+    return (1 - r) * r ** n * np.sin(2 * np.pi * frequency / SAMPLE_RATE * (n + 1)) / np.sin(2 * np.pi * frequency / SAMPLE_RATE)
+
+
+def speech(seconds: float, rng, pitch: float) -> np.ndarray:
+    """Voiced syllables with a moving pitch and formants; Silero hears them as speech"""
+    out = np.zeros(int(seconds * SAMPLE_RATE))
+    position = 0
+    while position < len(out):
+        length = min(int(rng.uniform(0.12, 0.3) * SAMPLE_RATE), len(out) - position)
+        t = np.arange(length) / SAMPLE_RATE
+        f0 = pitch * (1 + 0.15 * np.sin(2 * np.pi * rng.uniform(0.5, 2) * t + rng.uniform(0, 6)))
+        source = (np.cumsum(f0) / SAMPLE_RATE % 1.0) ** 3 - 0.25 + 0.02 * rng.standard_normal(length)
+        f1, f2, f3 = VOWELS[rng.integers(len(VOWELS))]
+        voiced = sum(gain * np.convolve(source, resonator(f, bw))[:length] for f, bw, gain in ((f1, 90, 1.0), (f2, 110, 0.5), (f3, 170, 0.25)))
+        out[position:position + length] = voiced * np.sin(np.pi * np.arange(length) / length) ** 0.6
+        position += length
+    return out / np.max(np.abs(out)) * rng.uniform(6000, 12000)
+
+
+def beep(seconds: float, rng) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return np.sin(2 * np.pi * rng.choice([440, 850, 1000, 1400]) * t) * 8000
+
+
+def silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * SAMPLE_RATE))
+
+
+SCENARIOS = {
+    # Greeting then waiting for the caller
+    "hello": (HUMAN, lambda rng, name: [("pause", rng.uniform(0.2, 1.2)), ("Hello?", rng.uniform(0.35, 0.8))]),
+    "hello_name": (HUMAN, lambda rng, name: [("pause", rng.uniform(0.2, 1.0)), (f"Hello, this is {name}.", rng.uniform(0.9, 1.5))]),
+    "double_hello": (HUMAN, lambda rng, name: [("pause", rng.uniform(0.2, 0.8)), ("Hello?", 0.5), ("pause", rng.uniform(1.0, 1.5)), ("Hello?", 0.5)]),
+    "long_human": (HUMAN, lambda rng, name: [("pause", rng.uniform(0.2, 0.8)), ("Yeah hello, who's calling please?", rng.uniform(1.4, 2.2))]),
+    "silent": (HUMAN, lambda rng, name: [("pause", 5.0)]),
+    # People who talk past the greeting thresholds, which machine cues must not catch
+    "busy_human": (HUMAN, lambda rng, name: [
+        ("pause", rng.uniform(0.2, 0.8)), ("Hello?", 0.5), ("pause", rng.uniform(1.0, 1.5)),
+        ("Sorry, I'm not available right now, can I get back to you later this afternoon?", rng.uniform(3.0, 4.0)),
+    ]),
+    "rambling_human": (HUMAN, lambda rng, name: [
+        ("pause", rng.uniform(0.2, 0.8)), (f"Hello, yeah, this is {name}, hang on, let me just turn the TV down.", rng.uniform(2.6, 3.4)),
+    ]),
+    # Greetings that run on, then a beep
+    "personal": (MACHINE, lambda rng, name: [
+        ("pause", rng.uniform(0.1, 0.8)), (f"Hi, you've reached {name}.", rng.uniform(1.2, 1.6)), ("pause", rng.uniform(0.2, 0.6)),
+        ("I can't take your call right now.", rng.uniform(1.5, 2.0)), ("pause", rng.uniform(0.2, 0.5)),
+        ("Please leave a message after the tone.", rng.uniform(1.5, 2.0)), ("pause", 0.5), ("beep", rng.uniform(0.4, 0.8)),
+    ]),
+    "personal_pause": (MACHINE, lambda rng, name: [
+        ("pause", rng.uniform(0.1, 0.8)), (f"Hi, this is {name}.", rng.uniform(0.9, 1.3)), ("pause", rng.uniform(0.9, 1.3)),
+        ("Sorry I missed you, leave me a message and I'll get back to you.", rng.uniform(2.5, 3.5)), ("pause", 0.5), ("beep", 0.5),
+    ]),
+    "carrier": (MACHINE, lambda rng, name: [
+        ("pause", rng.uniform(0.1, 0.5)), ("The person you are trying to reach is not available.", rng.uniform(2.5, 3.2)), ("pause", 0.3),
+        ("At the tone, please record your message.", rng.uniform(2.0, 2.6)), ("pause", 0.3), ("beep", 0.6),
+    ]),
+    "short_machine": (MACHINE, lambda rng, name: [("pause", rng.uniform(0.1, 0.5)), ("Leave a message.", rng.uniform(0.9, 1.2)), ("pause", 0.4), ("beep", 0.5)]),
+    "no_beep": (MACHINE, lambda rng, name: [
+        ("pause", rng.uniform(0.1, 0.8)), (f"You have reached {name}, please leave your name and number.", rng.uniform(3.0, 4.0)),
+    ]),
+}
+
+
+def generate_fixture(scenario: str, rng, stt_lag: float = 0.4):
+    label, script = SCENARIOS[scenario]
+    pitch = rng.uniform(95, 220)
+    chunks, transcript, at, greeting_end = [], [], 0.0, None
+    for text, seconds in script(rng, rng.choice(NAMES)):
+        if text == "pause":
+            chunks.append(silence(seconds))
+        elif text == "beep":
+            chunks.append(beep(seconds, rng))
+            greeting_end = at + seconds
+        else:
+            chunks.append(speech(seconds, rng, pitch))
+            # Interim results every 300ms with the words said so far, then a final one
+            words = text.split()
+            for t in list(np.arange(0.3, seconds, 0.3)) + [seconds]:
+                spoken = " ".join(words[:max(1, round(len(words) * t / seconds))])
+                transcript.append([round(at + t + stt_lag, 3), spoken])
+        at += seconds
+    if label == MACHINE and greeting_end is None:
+        greeting_end = at
+    chunks.append(silence(4.0))
+    audio = np.concatenate(chunks) + rng.standard_normal(sum(len(c) for c in chunks)) * rng.uniform(20, 200)
+    return np.clip(audio, -32767, 32767).astype(np.int16), {
+        "label": label, "scenario": scenario, "transcript": transcript, "greeting_end": greeting_end,
+    }
+
+
+def write_fixtures(directory: str, count: int, seed: int = 7):
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    scenarios = list(SCENARIOS)
+    for i in range(count):
+        audio, meta = generate_fixture(scenarios[i % len(scenarios)], rng)
+        path = os.path.join(directory, f"{i:04d}_{meta['scenario']}")
+        with wave.open(path + ".wav", "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(SAMPLE_RATE)
+            f.writeframes(audio.tobytes())
+        with open(path + ".json", "w") as f:
+            json.dump(meta, f)
+
+
+def load_vad_model():
+    from livekit.plugins.silero import onnx_model
+
+    session = onnx_model.new_inference_session(force_cpu=True)
+    return lambda: onnx_model.OnnxModel(onnx_session=session, sample_rate=SAMPLE_RATE)
+
+
+def evaluate(path: str, new_model, use_transcripts: bool):
+    with wave.open(path, "rb") as f:
+        if f.getframerate() != SAMPLE_RATE or f.getnchannels() != 1:
+            raise ValueError(f"{path}: fixtures must be {SAMPLE_RATE}Hz mono")
+        audio = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    with open(os.path.splitext(path)[0] + ".json") as f:
+        meta = json.load(f)
+
+    model = new_model()
+    window = model.window_size_samples
+    frame = SAMPLE_RATE * FRAME_MS // 1000
+    transcript = meta.get("transcript", []) if use_transcripts else []
+    detector = AnsweringMachineDetector()
+    greeting = None
+    decided_at = None
+    message_at = None
+    late_cue = False
+    windows_done = 0
+    for end in range(frame, len(audio) + 1, frame):
+        at = end / SAMPLE_RATE
+        # The VAD runs a window at a time, as soon as enough audio has arrived
+        while (windows_done + 1) * window <= end:
+            samples = audio[windows_done * window:(windows_done + 1) * window]
+            windows_done += 1
+            probability = model(samples.astype(np.float32) / np.iinfo(np.int16).max)
+            window_end = windows_done * window / SAMPLE_RATE
+            if greeting is None:
+                detector.on_vad(window_end, probability)
+            else:
+                greeting.on_vad(window_end - decided_at, probability)
+        while transcript and transcript[0][0] <= at and greeting is None:
+            text = transcript.pop(0)[1]
+            if detector.result is None:
+                detector.on_transcript(at, text)
+            elif at - detector.result["at"] <= LATE_CUE_WINDOW and late_machine_cue(text):
+                # The pipeline has started, and the STT hears the greeting go on
+                late_cue = True
+
+        if detector.result is None:
+            detector.on_frame(at, audio[end - frame:end], SAMPLE_RATE)
+        if greeting is None and detector.result is not None and (detector.result["label"] == MACHINE or late_cue):
+            decided_at = at
+            greeting = GreetingEndDetector()
+        elif greeting is not None:
+            if greeting.on_frame(at - decided_at, audio[end - frame:end], SAMPLE_RATE):
+                message_at = at
+                break
+    result = dict(detector.finish(len(audio) / SAMPLE_RATE))
+    if late_cue:
+        result.update(label=MACHINE, reason="late cue")
+    return meta, result, message_at
+
+
+def report(results, label):
+    print(f"\n{label}")
+    confusion = Counter((meta["label"], result["label"]) for meta, result, _ in results)
+    for positive in (MACHINE, HUMAN):
+        true_positive = confusion[(positive, positive)]
+        predicted = sum(n for (_, got), n in confusion.items() if got == positive)
+        actual = sum(n for (want, _), n in confusion.items() if want == positive)
+        precision = true_positive / predicted if predicted else 0.0
+        recall = true_positive / actual if actual else 0.0
+        print(f"  {positive:8s} precision {precision:.3f}  recall {recall:.3f}  ({actual} fixtures)")
+
+    late = sum(1 for _, result, _ in results if result["reason"] == "late cue")
+    if late:
+        print(f"  {late} machines were caught by the late cue check after the pipeline had started")
+    suspected = Counter(meta["label"] for meta, result, _ in results if result.get("suspected"))
+    if suspected:
+        print(f"  suspected by cadence alone: {suspected[MACHINE]} machines, {suspected[HUMAN]} people")
+    for want in (HUMAN, MACHINE):
+        latencies = [
+            result["at"] for meta, result, _ in results
+            if meta["label"] == want and result["label"] == want and result["reason"] != "late cue"
+        ]
+        if latencies:
+            print(f"  {want:8s} detected after p50 {percentile(latencies, 50):.2f}s  p95 {percentile(latencies, 95):.2f}s of audio")
+
+    by_scenario = defaultdict(Counter)
+    for meta, result, _ in results:
+        by_scenario[meta["scenario"]][result["label"] == meta["label"]] += 1
+    print("  per scenario: " + ", ".join(f"{name} {c[True]}/{c[True] + c[False]}" for name, c in sorted(by_scenario.items())))
+
+    # Voicemails start once the greeting is over; starting before the beep ends cuts the message off
+    offsets = [message_at - meta["greeting_end"] for meta, result, message_at in results if message_at is not None and meta.get("greeting_end")]
+    if offsets:
+        early = sum(1 for offset in offsets if offset < 0)
+        print(
+            f"  voicemail starts {percentile(offsets, 50):+.2f}s (p50) / {percentile(offsets, 95):+.2f}s (p95) "
+            f"after the greeting ends; {early} of {len(offsets)} before it"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", help="Directory of WAV + JSON fixtures to evaluate")
+    parser.add_argument("--generate", help="Write synthetic fixtures to this directory")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--no-transcripts", action="store_true", help="Only the VAD cadence, as when no STT runs during detection")
+    args = parser.parse_args()
+
+    directory = args.fixtures or args.generate or tempfile.mkdtemp(prefix="amd-fixtures-")
+    if not args.fixtures:
+        write_fixtures(directory, args.count)
+        print(f"Wrote {args.count} synthetic fixtures to {directory}")
+
+    new_model = load_vad_model()
+    paths = sorted(glob.glob(os.path.join(directory, "*.wav")))
+    if not args.no_transcripts:
+        report([evaluate(path, new_model, True) for path in paths], "VAD cadence + transcript cues")
+    report([evaluate(path, new_model, False) for path in paths], "VAD cadence only")
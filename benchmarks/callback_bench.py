@@ -0,0 +1,148 @@
+"""Load time, schedule/pop latency and top-of-the-hour burst pacing of the callback scheduler
+
+    python benchmarks/callback_bench.py --pending 300000 --burst 2000 --cps 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from callbacks import CallbackScheduler
+from dialer import FakeRoomService, within_calling_hours
+from journal import encode_record
+
+# One of these is always between 8 AM and 9 PM
+TIMEZONES = ["America/New_York", "Europe/London", "Asia/Kolkata", "Asia/Tokyo", "Pacific/Honolulu"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def synthetic_callback(i: int, due_at: float, timezone: str = "America/New_York"):
+    return {
+        "callback_id": f"CB-{i:012d}",
+        "due_at": due_at,
+        "reason": "payment plan",
+        "scheduled_at": time.time(),
+        "phoneNumber": f"+1555{i:07d}",
+        "customerName": f"Customer {i}",
+        "amountOwed": 1250.0,
+        "paymentDueDate": "2030-01-15",
+        "timezone": timezone,
+    }
+
+
+def write_journal(path: str, count: int, seed: int = 7):
+    """Callbacks spread over the next 30 days, on whole minutes, with most at the top of an hour"""
+    rng = random.Random(seed)
+    base = (int(time.time()) // 3600 + 1) * 3600
+    with open(path, "wb") as f:
+        for i in range(count):
+            minute = 0 if rng.random() < 0.6 else rng.randrange(60)
+            due_at = base + rng.randrange(30 * 24) * 3600 + minute * 60
+            f.write(encode_record({"ts": time.time(), "kind": "scheduled", "data": synthetic_callback(i, due_at)}))
+
+
+async def burst(args, directory: str):
+    """`--burst` callbacks all due this minute, dispatched through the dialer"""
+    journal_path = os.path.join(directory, "burst.journal")
+    # A customer zone inside calling hours right now, so the whole burst is dialed
+    now = datetime.now(timezone.utc)
+    zone = next(tz for tz in TIMEZONES if within_calling_hours({}, now, tz))
+    due_at = time.time()
+    with open(journal_path, "wb") as f:
+        for i in range(args.burst):
+            callback = synthetic_callback(i, due_at, zone)
+            f.write(encode_record({"ts": time.time(), "kind": "scheduled", "data": callback}))
+
+    scheduler = CallbackScheduler(journal_path, os.path.join(directory, "burst_outcomes.journal"))
+    service = FakeRoomService(create_latency=args.create_latency, call_duration=args.call_duration)
+    task = asyncio.create_task(
+        scheduler.run(service, poll_interval=0.1, calls_per_second=args.cps, max_active_calls=args.max_active, concurrency=32)
+    )
+    # Until nothing due now is left; callbacks moved to the next calling window stay pending
+    while not scheduler.stats["batches"] or (scheduler.next_due() or float("inf")) <= time.time():
+        await asyncio.sleep(0.1)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+    created = [room["created_at"] for room in service.created]
+    per_second = {}
+    for at in created:
+        second = int(at - created[0])
+        per_second[second] = per_second.get(second, 0) + 1
+    elapsed = created[-1] - created[0] if len(created) > 1 else 0.0
+    print(
+        f"Burst of {args.burst} due in one minute: {scheduler.stats['batches']} dialer batch(es), "
+        f"{scheduler.stats['dialed']} dialed, {scheduler.stats['rescheduled']} moved to the next calling window"
+    )
+    if created:
+        print(
+            f"  dialed over {elapsed:.1f}s, busiest second {max(per_second.values())} calls "
+            f"(target {args.cps:.0f}/s), peak active {service.peak_active} (cap {args.max_active})"
+        )
+
+
+def run(args):
+    directory = tempfile.mkdtemp(prefix="callbacks-")
+    journal_path = os.path.join(directory, "callbacks.journal")
+    write_journal(journal_path, args.pending)
+
+    scheduler = CallbackScheduler(journal_path, os.path.join(directory, "outcomes.journal"))
+    start = time.perf_counter()
+    scheduler.load()
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Loaded {len(scheduler.pending)} pending callbacks in {elapsed:.2f}s (peak RSS {peak_mb:.0f}MB)")
+
+    rng = random.Random(11)
+    adds = []
+    for i in range(args.operations):
+        callback = synthetic_callback(args.pending + i, time.time() + rng.randrange(30 * 24 * 3600))
+        start = time.perf_counter()
+        scheduler.add(callback)
+        adds.append((time.perf_counter() - start) * 1e6)
+
+    # Pop from the front of the schedule one minute at a time
+    pops = []
+    now = scheduler.next_due()
+    while len(pops) < args.operations and now is not None:
+        start = time.perf_counter()
+        batch = scheduler.pop_due(now)
+        pops.append((time.perf_counter() - start) * 1e6 / max(1, len(batch)))
+        for callback in batch:
+            del scheduler.pending[callback["callback_id"]]
+        now = scheduler.next_due()
+
+    for name, samples in (("schedule", adds), ("pop (per callback)", pops)):
+        print(
+            f"  {name:20s} p50 {percentile(samples, 50):.1f}us  p95 {percentile(samples, 95):.1f}us  "
+            f"p99 {percentile(samples, 99):.1f}us  max {max(samples):.1f}us"
+        )
+
+    if args.burst:
+        asyncio.run(burst(args, directory))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pending", type=int, default=300_000)
+    parser.add_argument("--operations", type=int, default=20_000)
+    parser.add_argument("--burst", type=int, default=2000, help="Callbacks due in the same minute")
+    parser.add_argument("--cps", type=float, default=200)
+    parser.add_argument("--max-active", type=int, default=5000)
+    parser.add_argument("--call-duration", type=float, default=5.0)
+    parser.add_argument("--create-latency", type=float, default=0.02)
+    run(parser.parse_args())
@@ -0,0 +1,79 @@
+"""Throughput, pacing accuracy and capacity backpressure of the campaign dialer against a fake room service
+
+    python benchmarks/dialer_bench.py --accounts 10000 --cps 200 --max-active 300 --call-duration 2
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dialer import Dialer, FakeRoomService, within_calling_hours
+
+TIMEZONES = [
+    "America/New_York", "America/Chicago", "America/Denver", "America/Los_Angeles",
+    "America/Anchorage", "Pacific/Honolulu", "Europe/London", "Asia/Tokyo",
+]
+
+
+def synthetic_call_list(count: int, in_hours_fraction: float, seed: int = 7):
+    """Call list where roughly `in_hours_fraction` of customers are inside calling hours right now"""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    open_zones = [tz for tz in TIMEZONES if within_calling_hours({"timezone": tz}, now, tz)]
+    closed_zones = [tz for tz in TIMEZONES if tz not in open_zones]
+    for i in range(count):
+        in_hours = rng.random() < in_hours_fraction
+        zones = (open_zones if in_hours else closed_zones) or open_zones or closed_zones
+        yield {
+            "phoneNumber": f"+1555{i:07d}",
+            "customerName": f"Customer {i}",
+            "amountOwed": f"{rng.uniform(100, 5000):.2f}",
+            "paymentDueDate": "2030-01-15",
+            "accountNumber": f"AC{i:09d}",
+            "timezone": rng.choice(zones),
+        }
+
+
+async def run(args):
+    service = FakeRoomService(create_latency=args.create_latency, call_duration=args.call_duration)
+    dialer = Dialer(
+        service,
+        max_active_calls=args.max_active,
+        calls_per_second=args.cps,
+        concurrency=args.concurrency,
+        capacity_poll_interval=args.poll_interval,
+    )
+    cpu_start = time.process_time()
+    result = await dialer.run(synthetic_call_list(args.accounts, args.in_hours_fraction))
+    cpu = time.process_time() - cpu_start
+
+    # Pacing is checked over the steady state, once the initial burst allowance is spent
+    created = [room["created_at"] for room in service.created]
+    per_second = {}
+    for at in created:
+        second = int(at - created[0])
+        per_second[second] = per_second.get(second, 0) + 1
+    busiest = max(per_second.values()) if per_second else 0
+
+    print(f"{args.accounts} queued: {result['dialed']} dialed, {result['skipped_outside_hours']} outside calling hours, {result['failed']} failed")
+    print(f"  {result['elapsed_s']:.1f}s, {result['calls_per_second']:.1f} calls/s (target {args.cps}), busiest second {busiest} calls")
+    print(f"  peak active calls {service.peak_active} (cap {args.max_active}), capacity waits {result['capacity_waits']}")
+    print(f"  dialer CPU {cpu:.2f}s, {cpu / max(1, args.accounts) * 1e6:.0f}us per queued account")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=10_000)
+    parser.add_argument("--cps", type=float, default=200)
+    parser.add_argument("--max-active", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--call-duration", type=float, default=2.0, help="Seconds each fake call stays active")
+    parser.add_argument("--create-latency", type=float, default=0.02, help="Seconds per fake create_room request")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--in-hours-fraction", type=float, default=0.9, help="Share of customers inside calling hours")
+    asyncio.run(run(parser.parse_args()))
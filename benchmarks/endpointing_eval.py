@@ -0,0 +1,254 @@
+"""Response latency vs false cut-offs of end-of-turn detection, on whole-call PCM fixtures
+
+Each fixture is one caller's side of a collections call, a 16kHz mono WAV with a JSON sidecar:
+{"style": ..., "turns": [{"prompt": agent text, "prompt_at": s, "start": s, "end": s}], "finals": [[s, text], ...]}.
+`prompt_at` is when the agent finished asking, `start` and `end` when the caller's answer really
+starts and ends, and `finals` the STT final transcripts with when they arrive. Silero VAD runs over the audio with the pipeline's settings; its start and
+end of speech events, the finals and the prompts then drive each endpointing policy in
+simulated time. A false cut-off is a turn the agent took while the caller was still answering.
+
+    python benchmarks/endpointing_eval.py                          # Generate fixtures into a temporary directory and evaluate them
+    python benchmarks/endpointing_eval.py --generate fixtures/endpointing --count 60
+    python benchmarks/endpointing_eval.py --fixtures fixtures/endpointing
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import wave
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from amd import SAMPLE_RATE
+from amd_eval import load_vad_model, silence, speech
+from endpointing import EndpointPolicy
+
+# Silero VAD settings the worker loads (silero.VAD.load() defaults)
+ACTIVATION_THRESHOLD = 0.5
+MIN_SPEECH = 0.05
+MIN_SILENCE = 0.25
+PADDING = 0.1
+
+# The pipeline's default: min_endpointing_delay=0.5, shortened by a quarter after punctuation,
+# and 1s when the final transcript does not end a sentence
+DEFAULT_DELAY, DEFAULT_PUNCTUATED, DEFAULT_UNPUNCTUATED = 0.5, 0.75, 1.0
+LATE_TRANSCRIPT_TOLERANCE = 1.5
+
+GREETING = (
+    "Hello, this is Sarah from the Financial Recovery Department. May I please verify your identity by "
+    "confirming the last four digits of your social security number and your date of birth?"
+)
+
+# Caller styles: seconds of pause between the parts of an answer, and how long the agent talks
+STYLES = {
+    "fast": (0.15, 0.45),
+    "steady": (0.35, 0.9),
+    "reader": (0.8, 1.7),
+}
+
+DIGIT_WORDS = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine"]
+
+
+def digits(rng, count: int, written: bool) -> str:
+    value = "".join(str(rng.integers(10)) for _ in range(count))
+    return value if written else " ".join(DIGIT_WORDS[int(d)] for d in value)
+
+
+def call_script(rng):
+    """(agent prompt, [parts of the caller's answer]) for each turn of a collections call"""
+    written = rng.random() < 0.5  # Smart formatting writes numbers as digits
+    card = [digits(rng, 4, written) for _ in range(4)]
+    return [
+        (GREETING, ["Sure, the last four are", digits(rng, 4, written), "and my date of birth is", "January fifteenth", "nineteen eighty."]),
+        ("Thank you, you're verified. Your balance is one thousand five hundred dollars. How would you like to pay?",
+         ["I'd like to pay the whole thing today by card."]),
+        ("Okay. What's the card number?", card[:3] + [card[3] + "."]),
+        ("And the expiration date?", ["oh nine", "twenty seven."]),
+        ("And the security code on the back?", [digits(rng, 3, written) + "."]),
+        ("Thanks. Should I email the confirmation to the address on file?", ["Yes."]),
+        ("Your payment went through. Is there anything else I can help with?", ["No, that's all.", "Thank you."]),
+    ]
+
+
+def generate_fixture(style: str, rng, stt_lag=(0.15, 0.45)):
+    pause_low, pause_high = STYLES[style]
+    pitch = rng.uniform(95, 220)
+    chunks, turns, finals, at = [], [], [], 0.0
+
+    def add(audio: np.ndarray) -> None:
+        nonlocal at
+        chunks.append(audio)
+        at += len(audio) / SAMPLE_RATE
+
+    for prompt, parts in call_script(rng):
+        # The agent replies and asks while the caller is silent
+        add(silence(rng.uniform(0.8, 1.5) + min(6.0, 0.3 * len(prompt.split()))))
+        prompt_at = at
+        add(silence(rng.uniform(0.3, 0.8)))
+        start = at
+        for i, text in enumerate(parts):
+            if i:
+                add(silence(rng.uniform(pause_low, pause_high)))
+            add(speech(max(0.35, 0.28 * len(text.split()) * rng.uniform(0.8, 1.2)), rng, pitch))
+            finals.append([round(at + rng.uniform(*stt_lag), 3), text])
+        turns.append({"prompt": prompt, "prompt_at": round(prompt_at, 3), "start": round(start, 3), "end": round(at, 3)})
+    add(silence(3.0))
+    audio = np.concatenate(chunks) + rng.standard_normal(sum(len(c) for c in chunks)) * rng.uniform(20, 200)
+    return np.clip(audio, -32767, 32767).astype(np.int16), {"style": style, "turns": turns, "finals": finals}
+
+
+def write_fixtures(directory: str, count: int, seed: int = 11):
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    styles = list(STYLES)
+    for i in range(count):
+        audio, meta = generate_fixture(styles[i % len(styles)], rng)
+        path = os.path.join(directory, f"{i:04d}_{meta['style']}")
+        with wave.open(path + ".wav", "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(SAMPLE_RATE)
+            f.writeframes(audio.tobytes())
+        with open(path + ".json", "w") as f:
+            json.dump(meta, f)
+
+
+def vad_events(audio: np.ndarray, model):
+    """(seconds, "start"|"end") of speech, as the Silero VAD stream reports them"""
+    window = model.window_size_samples
+    seconds = window / SAMPLE_RATE
+    events, speaking, speech_run, silence_run = [], False, 0.0, 0.0
+    for start in range(0, len(audio) - window + 1, window):
+        probability = model(audio[start:start + window].astype(np.float32) / np.iinfo(np.int16).max)
+        at = (start + window) / SAMPLE_RATE
+        if probability >= ACTIVATION_THRESHOLD:
+            speech_run, silence_run = speech_run + seconds, 0.0
+            if not speaking and speech_run >= MIN_SPEECH:
+                speaking = True
+                events.append((at, "start"))
+        else:
+            silence_run, speech_run = silence_run + seconds, 0.0
+            if speaking and silence_run >= MIN_SILENCE + PADDING:
+                speaking = False
+                events.append((at, "end"))
+    return events
+
+
+class DefaultPolicy:
+    """The pipeline's fixed delay, with the same hooks as EndpointPolicy"""
+
+    def delay(self, transcript: str):
+        if transcript.endswith((".", "!", "?")):
+            return DEFAULT_DELAY * DEFAULT_PUNCTUATED, "punctuation"
+        return DEFAULT_UNPUNCTUATED, "default"
+
+    def on_agent_prompt(self, text): pass
+    def on_start_of_speech(self, now): pass
+    def on_end_of_speech(self, now): pass
+    def on_turn_taken(self, now): pass
+
+
+def simulate(meta, events, policy):
+    """Times the agent takes the turn, replaying the pipeline's reply validation in simulated time"""
+    timeline = [(at, 0, kind, None) for at, kind in events]
+    timeline += [(at, 1, "final", text) for at, text in meta["finals"]]
+    timeline += [(turn["prompt_at"], 2, "prompt", turn["prompt"]) for turn in meta["turns"]]
+    timeline.sort()
+
+    taken, transcript, speaking, last_end, due = [], "", False, -1e9, None
+
+    def fire_until(now: float) -> None:
+        nonlocal due, transcript
+        if due is not None and due <= now:
+            taken.append(due)
+            policy.on_turn_taken(due)
+            transcript, due = "", None
+
+    for at, _, kind, text in timeline:
+        fire_until(at)
+        if kind == "prompt":
+            policy.on_agent_prompt(text)
+        elif kind == "start":
+            speaking, due = True, None
+            policy.on_start_of_speech(at)
+        elif kind == "end":
+            speaking, last_end = False, at
+            policy.on_end_of_speech(at)
+            if transcript:
+                due = at + policy.delay(transcript)[0]
+        else:
+            transcript = f"{transcript} {text}".strip()
+            if not speaking:
+                delay = policy.delay(transcript)[0]
+                if at - last_end >= LATE_TRANSCRIPT_TOLERANCE:
+                    delay += 1.0
+                due = at + delay
+    fire_until(float("inf"))
+    return taken
+
+
+def score(meta, taken):
+    """Per turn: (cut off, response latency after the caller really finished, None if never)"""
+    results = []
+    turns = meta["turns"]
+    for i, turn in enumerate(turns):
+        next_start = turns[i + 1]["start"] if i + 1 < len(turns) else float("inf")
+        early = [t for t in taken if turn["start"] <= t < turn["end"]]
+        after = [t for t in taken if turn["end"] <= t < next_start]
+        results.append((bool(early), after[0] - turn["end"] if after else None))
+    return results
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else float("nan")
+
+
+POLICIES = {
+    "default": DefaultPolicy,
+    "learned pauses": lambda: EndpointPolicy(use_cues=False),
+    "adaptive": EndpointPolicy,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", help="Directory of WAV + JSON fixtures to evaluate")
+    parser.add_argument("--generate", help="Write synthetic fixtures to this directory")
+    parser.add_argument("--count", type=int, default=30)
+    args = parser.parse_args()
+
+    directory = args.fixtures or args.generate or tempfile.mkdtemp(prefix="endpointing-fixtures-")
+    if not args.fixtures:
+        write_fixtures(directory, args.count)
+        print(f"Wrote {args.count} synthetic fixtures to {directory}")
+
+    new_model = load_vad_model()
+    calls = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.wav"))):
+        with wave.open(path, "rb") as f:
+            if f.getframerate() != SAMPLE_RATE or f.getnchannels() != 1:
+                raise ValueError(f"{path}: fixtures must be {SAMPLE_RATE}Hz mono")
+            audio = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        with open(os.path.splitext(path)[0] + ".json") as f:
+            meta = json.load(f)
+        calls.append((meta, vad_events(audio, new_model())))
+
+    print(f"{'policy':16s} {'style':8s} {'turns':>6s} {'cut off':>8s} {'latency p50':>12s} {'p95':>7s} {'no reply':>9s}")
+    for name, make_policy in POLICIES.items():
+        by_style = defaultdict(list)
+        for meta, events in calls:
+            # One policy per call, as each job gets its own
+            by_style[meta["style"]] += score(meta, simulate(meta, events, make_policy()))
+        by_style["all"] = [result for style in list(by_style) for result in by_style[style]]
+        for style, results in by_style.items():
+            latencies = [latency for _, latency in results if latency is not None]
+            print(
+                f"{name:16s} {style:8s} {len(results):>6d} {sum(cut for cut, _ in results) / len(results):>8.1%} "
+                f"{percentile(latencies, 50):>11.2f}s {percentile(latencies, 95):>6.2f}s {len(results) - len(latencies):>9d}"
+            )
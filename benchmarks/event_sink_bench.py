@@ -0,0 +1,149 @@
+"""Event-loop stalls from transcript and call-event recording, logger.info vs the batched event sink
+
+    python benchmarks/event_sink_bench.py --sessions 10 50 200 500 --turns 20 --write-delay 0.0005
+
+Every session records a caller transcript, a tool call with its JSON result and an agent
+reply per turn, from one event loop as jobs share a worker. "logging" is what the handlers
+did before: logger.info to a file handler, which writes on the loop. "sink" is EventSink.
+A monitor task sleeps 1ms at a time; a stall is how late it wakes up. --write-delay adds a
+fixed cost to every disk write (per record for logging, per batch for the sink), to model a
+slow or contended disk.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from call_events import EventSink, read_events
+
+CALLER = "Sure, the last four are one two three four and my birthday is January fifteenth nineteen eighty. "
+AGENT = (
+    "Thank you, you're verified. Your balance is one thousand five hundred dollars, three hundred of it past due. "
+    "You can pay in full, set up a three or six month plan, or make a partial payment today. "
+)
+RESULT = json.dumps({
+    "success": True, "transaction_id": "TXN-20240101-ABCDEF12", "amount": 300.0, "method": "card",
+    "processed_at": "2024-10-01T12:00:00", "confirmation_number": "CONF-20240101-1234ABCD",
+})
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+class SlowFileHandler(logging.FileHandler):
+    def __init__(self, path: str, delay: float):
+        super().__init__(path)
+        self.write_delay = delay
+
+    def emit(self, record):
+        if self.write_delay:
+            time.sleep(self.write_delay)
+        super().emit(record)
+
+
+class SlowEventSink(EventSink):
+    def __init__(self, directory: str, delay: float, **kwargs):
+        super().__init__(directory, **kwargs)
+        self.write_delay = delay
+
+    def _write(self, batch):
+        if self.write_delay:
+            time.sleep(self.write_delay)
+        return super()._write(batch)
+
+
+async def monitor(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(max(0.0, time.perf_counter() - start - 0.001) * 1000)
+
+
+async def run_level(mode: str, sessions: int, args, directory: str):
+    rng = random.Random(sessions)
+    handler_ms = []
+    if mode == "logging":
+        logger = logging.getLogger(f"bench-{mode}-{sessions}")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = SlowFileHandler(os.path.join(directory, f"{mode}-{sessions}.log"), args.write_delay)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s - %(message)s"))
+        logger.addHandler(handler)
+
+        def record(session, kind, **data):
+            if kind == "function_call":
+                logger.info(f"Function: {data['name']}, Result: {data['result']}")
+            else:
+                logger.info(f"{'Customer' if kind == 'user_speech' else 'Agent'}: {data['text']}")
+    else:
+        sink = SlowEventSink(os.path.join(directory, f"{mode}-{sessions}"), args.write_delay, max_pending=args.max_pending)
+        sink.start()
+        record = sink.emit
+
+    async def session(index: int):
+        await asyncio.sleep(rng.random() * args.turn_interval)
+        for turn in range(args.turns):
+            for kind, data in (
+                ("user_speech", {"text": CALLER}),
+                ("function_call", {"name": "process_payment", "arguments": {"amount": 300.0}, "result": RESULT}),
+                ("agent_speech", {"text": AGENT}),
+            ):
+                start = time.perf_counter()
+                record(f"room-{index}", kind, **data)
+                handler_ms.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(args.turn_interval * rng.uniform(0.5, 1.5))
+
+    stop, lags = asyncio.Event(), []
+    watcher = asyncio.create_task(monitor(stop, lags))
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    stop.set()
+    await watcher
+
+    if mode == "logging":
+        logger.removeHandler(handler)
+        handler.close()
+        written, dropped, size = len(handler_ms), 0, os.path.getsize(handler.baseFilename)
+    else:
+        await sink.close()
+        stats = sink.stats()
+        written, dropped, size = stats["written"], stats["dropped"], stats["bytes"]
+        # The segments must read back as every event that was not dropped
+        segments = [os.path.join(sink.directory, name) for name in os.listdir(sink.directory)]
+        assert sum(1 for path in segments for _ in read_events(path)) == written
+    return handler_ms, lags, written, dropped, size
+
+
+async def main(args):
+    directory = tempfile.mkdtemp(prefix="event-sink-")
+    print(f"{args.turns} turns per session, 3 events per turn, turn every {args.turn_interval * 1000:.0f}ms, write delay {args.write_delay * 1000:.2f}ms")
+    print(
+        f"{'sessions':>8} {'mode':>8} {'emit p50 us':>11} {'emit p99 us':>11} {'stall p99 ms':>12} "
+        f"{'stall max ms':>12} {'stall total ms':>14} {'written':>8} {'dropped':>8} {'bytes':>10}"
+    )
+    for sessions in args.sessions:
+        for mode in ("logging", "sink"):
+            handler_ms, lags, written, dropped, size = await run_level(mode, sessions, args, directory)
+            print(
+                f"{sessions:>8} {mode:>8} {percentile(handler_ms, 50) * 1000:>11.1f} {percentile(handler_ms, 99) * 1000:>11.1f} "
+                f"{percentile(lags, 99):>12.2f} {max(lags):>12.2f} {sum(lags):>14.0f} {written:>8} {dropped:>8} {size:>10}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10, 50, 200, 500])
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--turn-interval", type=float, default=0.1, help="Seconds between turns of one session")
+    parser.add_argument("--write-delay", type=float, default=0.0, help="Extra seconds per disk write")
+    parser.add_argument("--max-pending", type=int, default=50_000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,464 @@
+"""Deterministic local stand-ins for the LiveKit room and the VAD, STT, LLM and TTS providers
+
+The caller publishes real audio through a local track, so the agent's own audio path runs as
+in production. While the caller is saying an utterance every sample carries that utterance's
+code (see UTTERANCES); ScriptedVAD and ScriptedSTT read the code back instead of running a
+model, and ScriptedLLM answers each transcript from the benchmark's script.
+"""
+import asyncio
+import json
+import os
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from livekit import rtc
+from livekit.agents import llm, stt, tts, utils, vad
+from livekit.agents.llm import _oai_api
+
+SAMPLE_RATE = 48000
+FRAME_MS = 20
+
+
+class ToolErrors:
+    """Exceptions raised by the agent's tools, as "tool: error (file:line)"
+
+    The pipeline drops a failed tool's result without a word, so the turn just goes silent and
+    only shows up as a timeout; `install` records the cause from every tool call in the process.
+    """
+
+    def __init__(self):
+        self.errors: List[str] = []
+
+    def install(self) -> None:
+        execute = llm.FunctionCallInfo.execute
+        errors = self.errors
+
+        def recording_execute(call_info: llm.FunctionCallInfo) -> llm.CalledFunction:
+            called = execute(call_info)
+
+            def on_done(task: asyncio.Task) -> None:
+                if task.cancelled() or task.exception() is None:
+                    return
+                error = task.exception()
+                frame = traceback.extract_tb(error.__traceback__)[-1]
+                errors.append(f"{call_info.function_info.name}: {error!r} ({os.path.basename(frame.filename)}:{frame.lineno})")
+
+            called.task.add_done_callback(on_done)
+            return called
+
+        llm.FunctionCallInfo.execute = recording_execute
+
+
+class UtteranceCodes:
+    """Maps each scripted utterance to the sample value the caller's audio carries while saying it"""
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self._texts: Dict[int, str] = {}
+
+    def code(self, text: str) -> int:
+        if text not in self._codes:
+            code = len(self._codes) + 1
+            self._codes[text] = code
+            self._texts[code] = text
+        return self._codes[text]
+
+    def text(self, code: int) -> str:
+        return self._texts.get(code, "")
+
+
+UTTERANCES = UtteranceCodes()
+
+
+def frame_code(frame: rtc.AudioFrame) -> int:
+    samples = frame.data
+    return samples[len(samples) // 2] if len(samples) else 0
+
+
+class ScriptedVAD(vad.VAD):
+    """Speech is any frame carrying an utterance code; end of speech after min_silence of silence"""
+
+    def __init__(self, min_silence: float = 0.3):
+        super().__init__(capabilities=vad.VADCapabilities(update_interval=FRAME_MS / 1000))
+        self.min_silence = min_silence
+
+    def stream(self) -> "ScriptedVADStream":
+        return ScriptedVADStream(self.min_silence)
+
+
+class ScriptedVADStream(vad.VADStream):
+    def __init__(self, min_silence: float):
+        self._min_silence = min_silence
+        super().__init__()
+
+    async def _main_task(self) -> None:
+        speaking = False
+        speech_duration = silence_duration = 0.0
+        samples_index = 0
+        async for frame in self._input_ch:
+            if not isinstance(frame, rtc.AudioFrame):
+                continue
+            duration = frame.samples_per_channel / frame.sample_rate
+            samples_index += frame.samples_per_channel
+            voiced = frame_code(frame) != 0
+
+            if voiced:
+                silence_duration = 0.0
+                speech_duration += duration
+                if not speaking:
+                    speaking = True
+                    self._event_ch.send_nowait(self._event(vad.VADEventType.START_OF_SPEECH, samples_index, speech_duration, 0.0, True))
+            elif speaking:
+                silence_duration += duration
+                if silence_duration >= self._min_silence:
+                    speaking = False
+                    self._event_ch.send_nowait(self._event(vad.VADEventType.END_OF_SPEECH, samples_index, speech_duration, silence_duration, False))
+                    speech_duration = 0.0
+
+            event = self._event(vad.VADEventType.INFERENCE_DONE, samples_index, speech_duration, silence_duration, speaking)
+            event.probability = 1.0 if voiced else 0.0
+            self._event_ch.send_nowait(event)
+
+    @staticmethod
+    def _event(kind: vad.VADEventType, samples_index: int, speech: float, silence: float, speaking: bool) -> vad.VADEvent:
+        return vad.VADEvent(
+            type=kind,
+            samples_index=samples_index,
+            timestamp=time.time(),
+            speech_duration=speech,
+            silence_duration=silence,
+            speaking=speaking,
+        )
+
+
+class ScriptedSTT(stt.STT):
+    """Streams interim transcripts while an utterance is voiced and the final one final_delay after it ends"""
+
+    def __init__(self, final_delay: float = 0.2, words_per_second: float = 2.5):
+        super().__init__(capabilities=stt.STTCapabilities(streaming=True, interim_results=True))
+        self.final_delay = final_delay
+        self.words_per_second = words_per_second
+
+    async def recognize(self, buffer: utils.AudioBuffer, *, language: Optional[str] = None) -> stt.SpeechEvent:
+        frame = utils.merge_frames(buffer) if isinstance(buffer, list) else buffer
+        return transcript_event(stt.SpeechEventType.FINAL_TRANSCRIPT, UTTERANCES.text(frame_code(frame)))
+
+    def stream(self, *, language: Optional[str] = None) -> "ScriptedSpeechStream":
+        return ScriptedSpeechStream(self.final_delay, self.words_per_second)
+
+
+def transcript_event(kind: stt.SpeechEventType, text: str) -> stt.SpeechEvent:
+    return stt.SpeechEvent(type=kind, alternatives=[stt.SpeechData(language="en", text=text, confidence=1.0)])
+
+
+class ScriptedSpeechStream(stt.SpeechStream):
+    def __init__(self, final_delay: float, words_per_second: float):
+        self._final_delay = final_delay
+        self._words_per_second = words_per_second
+        super().__init__()
+
+    async def _main_task(self) -> None:
+        code = 0
+        spoken = silence = 0.0
+        interim_words = 0
+        async for frame in self._input_ch:
+            if not isinstance(frame, rtc.AudioFrame):
+                continue
+            duration = frame.samples_per_channel / frame.sample_rate
+            current = frame_code(frame)
+
+            if current:
+                if not code:
+                    self._event_ch.send_nowait(stt.SpeechEvent(type=stt.SpeechEventType.START_OF_SPEECH))
+                code, silence = current, 0.0
+                spoken += duration
+                words = UTTERANCES.text(code).split()
+                heard = min(len(words), int(spoken * self._words_per_second))
+                if heard > interim_words:
+                    interim_words = heard
+                    self._event_ch.send_nowait(transcript_event(stt.SpeechEventType.INTERIM_TRANSCRIPT, " ".join(words[:heard])))
+            elif code:
+                silence += duration
+                if silence >= self._final_delay:
+                    self._event_ch.send_nowait(transcript_event(stt.SpeechEventType.FINAL_TRANSCRIPT, UTTERANCES.text(code)))
+                    self._event_ch.send_nowait(stt.SpeechEvent(type=stt.SpeechEventType.END_OF_SPEECH))
+                    code, spoken, interim_words = 0, 0.0, 0
+
+
+class ScriptedLLM(llm.LLM):
+    """Answers each caller line from a script of turns
+
+    A turn is {"caller": text, "agent": text} and may add "tool": {"name", "arguments"}; the
+    tool call is emitted first and "agent" is spoken once its result comes back.
+    """
+
+    def __init__(self, turns: List[Dict[str, Any]], ttft: float = 0.3, token_delay: float = 0.02):
+        self.turns = {turn["caller"]: turn for turn in turns}
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.calls = 0
+
+    def chat(
+        self,
+        *,
+        chat_ctx: llm.ChatContext,
+        fnc_ctx: Optional[llm.FunctionContext] = None,
+        temperature: Optional[float] = None,
+        n: Optional[int] = None,
+        parallel_tool_calls: Optional[bool] = None,
+    ) -> "ScriptedLLMStream":
+        self.calls += 1
+        user_text = next((m.content for m in reversed(chat_ctx.messages) if m.role == "user"), "")
+        turn = self.turns.get(user_text, {"agent": "Sorry, could you say that again?"})
+        if "tool" in turn and chat_ctx.messages[-1].role != "tool":
+            return ScriptedLLMStream(chat_ctx, fnc_ctx, self.ttft, self.token_delay, tool=turn["tool"])
+        return ScriptedLLMStream(chat_ctx, fnc_ctx, self.ttft, self.token_delay, text=turn["agent"])
+
+
+class ScriptedLLMStream(llm.LLMStream):
+    def __init__(
+        self,
+        chat_ctx: llm.ChatContext,
+        fnc_ctx: Optional[llm.FunctionContext],
+        ttft: float,
+        token_delay: float,
+        text: str = "",
+        tool: Optional[Dict[str, Any]] = None,
+    ):
+        super().__init__(chat_ctx=chat_ctx, fnc_ctx=fnc_ctx)
+        self._chunks = self._generate(ttft, token_delay, text, tool)
+
+    async def _generate(self, ttft: float, token_delay: float, text: str, tool: Optional[Dict[str, Any]]):
+        await asyncio.sleep(ttft)
+        if tool is not None:
+            call = _oai_api.create_ai_function_info(
+                self._fnc_ctx, f"call_{utils.shortuuid()}", tool["name"], json.dumps(tool.get("arguments", {}))
+            )
+            self._function_calls_info.append(call)
+            yield llm.ChatChunk(choices=[llm.Choice(delta=llm.ChoiceDelta(role="assistant", tool_calls=[call]))])
+            return
+        for i, word in enumerate(text.split(" ")):
+            if i:
+                await asyncio.sleep(token_delay)
+            token = word if i == 0 else f" {word}"
+            yield llm.ChatChunk(choices=[llm.Choice(delta=llm.ChoiceDelta(role="assistant", content=token))])
+
+    async def __anext__(self) -> llm.ChatChunk:
+        return await self._chunks.__anext__()
+
+
+class SilentTTS(tts.TTS):
+    """Returns silence lasting seconds_per_word per word, first frame after latency seconds
+
+    latency_per_char models providers whose first byte comes later for longer input.
+    """
+
+    def __init__(self, latency: float = 0.2, seconds_per_word: float = 0.3, realtime_factor: float = 10.0, latency_per_char: float = 0.0):
+        super().__init__(capabilities=tts.TTSCapabilities(streaming=False), sample_rate=24000, num_channels=1)
+        self.latency = latency
+        self.seconds_per_word = seconds_per_word
+        self.realtime_factor = realtime_factor
+        self.latency_per_char = latency_per_char
+        self.requests = 0
+
+    def synthesize(self, text: str) -> "SilentChunkedStream":
+        self.requests += 1
+        return SilentChunkedStream(self, text)
+
+
+class SilentChunkedStream(tts.ChunkedStream):
+    def __init__(self, silent_tts: SilentTTS, text: str):
+        self._tts = silent_tts
+        self._text = text
+        super().__init__()
+
+    async def _main_task(self) -> None:
+        await asyncio.sleep(self._tts.latency + self._tts.latency_per_char * len(self._text))
+        request_id = utils.shortuuid()
+        samples_per_frame = self._tts.sample_rate // 10
+        frames = max(1, int(len(self._text.split()) * self._tts.seconds_per_word * 10))
+        silence = bytes(samples_per_frame * 2)
+        for i in range(frames):
+            if i:
+                await asyncio.sleep(0.1 / self._tts.realtime_factor)
+            frame = rtc.AudioFrame(silence, self._tts.sample_rate, 1, samples_per_frame)
+            self._event_ch.send_nowait(tts.SynthesizedAudio(request_id=request_id, segment_id="", frame=frame))
+
+
+class FakePublication:
+    def __init__(self, track: Any, source: rtc.TrackSource.ValueType):
+        self.track = track
+        self.sid = f"TR_{utils.shortuuid()}"
+        self.source = source
+        self.subscribed = True
+
+    def set_subscribed(self, subscribed: bool) -> None:
+        self.subscribed = subscribed
+
+    async def wait_for_subscription(self) -> None:
+        pass
+
+
+class FakeLocalParticipant:
+    """The agent's side of the room; records the agent state attribute the pipeline publishes"""
+
+    def __init__(self, identity: str = "agent"):
+        self.identity = identity
+        self.sid = f"PA_{utils.shortuuid()}"
+        self.track_publications: Dict[str, FakePublication] = {}
+        self.attributes: Dict[str, str] = {}
+        self.transcriptions = 0
+        self.states: "asyncio.Queue[Tuple[str, float]]" = asyncio.Queue()
+
+    async def publish_track(self, track: Any, options: Any = None) -> FakePublication:
+        publication = FakePublication(track, rtc.TrackSource.SOURCE_MICROPHONE)
+        self.track_publications[publication.sid] = publication
+        return publication
+
+    async def set_attributes(self, attributes: Dict[str, str]) -> None:
+        self.attributes.update(attributes)
+        if "lk.agent.state" in attributes:
+            self.states.put_nowait((attributes["lk.agent.state"], time.perf_counter()))
+
+    async def publish_transcription(self, transcription: Any) -> None:
+        self.transcriptions += 1
+
+    async def publish_data(self, payload: Any, **kwargs: Any) -> None:
+        pass
+
+    async def wait_for_state(self, state: str, timeout: float) -> float:
+        """Time at which the agent next entered the given state"""
+        deadline = time.perf_counter() + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"agent did not become {state}")
+            current, at = await asyncio.wait_for(self.states.get(), remaining)
+            if current == state:
+                return at
+
+
+class FakeCaller(rtc.RemoteParticipant):
+    """Remote participant whose microphone is a local audio source driven by the benchmark"""
+
+    def __init__(self, identity: str, seconds_per_word: float = 0.3):
+        self._identity = identity
+        self._sid = f"PA_{utils.shortuuid()}"
+        self.seconds_per_word = seconds_per_word
+        self.source = rtc.AudioSource(SAMPLE_RATE, 1, queue_size_ms=200)
+        self.track = rtc.LocalAudioTrack.create_audio_track(f"{identity}-mic", self.source)
+        self.publication = FakePublication(self.track, rtc.TrackSource.SOURCE_MICROPHONE)
+        self._code = 0
+        self._last_voiced = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def identity(self) -> str:
+        return self._identity
+
+    @property
+    def sid(self) -> str:
+        return self._sid
+
+    @property
+    def name(self) -> str:
+        return self._identity
+
+    @property
+    def metadata(self) -> str:
+        return ""
+
+    @property
+    def attributes(self) -> Dict[str, str]:
+        return {}
+
+    @property
+    def track_publications(self) -> Dict[str, FakePublication]:
+        return {self.publication.sid: self.publication}
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._audio_loop())
+
+    async def _audio_loop(self) -> None:
+        samples = SAMPLE_RATE * FRAME_MS // 1000
+        frames = {}
+        start = time.perf_counter()
+        sent = 0
+        while True:
+            code = self._code
+            if code not in frames:
+                frames[code] = (code.to_bytes(2, "little", signed=True)) * samples
+            await self.source.capture_frame(rtc.AudioFrame(frames[code], SAMPLE_RATE, 1, samples))
+            if code:
+                self._last_voiced = time.perf_counter()
+            sent += 1
+            await asyncio.sleep(max(0.0, start + sent * FRAME_MS / 1000 - time.perf_counter()))
+
+    async def say(self, text: str) -> float:
+        """Speak a line and return when its last voiced frame was sent"""
+        self._code = UTTERANCES.code(text)
+        await asyncio.sleep(len(text.split()) * self.seconds_per_word)
+        self._code = 0
+        await asyncio.sleep(FRAME_MS / 1000)
+        return self._last_voiced
+
+    async def hang_up(self) -> None:
+        if self._task is not None:
+            await utils.aio.gracefully_cancel(self._task)
+            self._task = None
+        await self.source.aclose()
+
+
+class FakeRoom(rtc.EventEmitter):
+    def __init__(self, name: str, metadata: str = ""):
+        super().__init__()
+        self.name = name
+        self.metadata = metadata
+        self.local_participant = FakeLocalParticipant()
+        self.remote_participants: Dict[str, rtc.RemoteParticipant] = {}
+
+    def isconnected(self) -> bool:
+        return True
+
+    def add_participant(self, participant: rtc.RemoteParticipant) -> None:
+        self.remote_participants[participant.identity] = participant
+        self.emit("participant_connected", participant)
+
+    def remove_participant(self, participant: rtc.RemoteParticipant) -> None:
+        self.remote_participants.pop(participant.identity, None)
+        self.emit("participant_disconnected", participant)
+
+
+class FakeProcess:
+    """Stands in for JobProcess; userdata is filled the way prewarm() fills it"""
+
+    def __init__(self, userdata: Dict[str, Any]):
+        self.userdata = userdata
+
+
+class FakeJob:
+    def __init__(self, room: FakeRoom):
+        self.id = f"AJ_{utils.shortuuid()}"
+        self.room = room
+
+
+class FakeJobContext:
+    def __init__(self, proc: FakeProcess, room: FakeRoom, caller: FakeCaller):
+        self.proc = proc
+        self.room = room
+        self.job = FakeJob(room)
+        self._caller = caller
+        self._shutdown_callbacks: List[Callable[[], Any]] = []
+
+    async def connect(self, **kwargs: Any) -> None:
+        pass
+
+    async def wait_for_participant(self, **kwargs: Any) -> rtc.RemoteParticipant:
+        return self._caller
+
+    def add_shutdown_callback(self, callback: Callable[[], Any]) -> None:
+        self._shutdown_callbacks.append(callback)
+
+    async def shutdown(self) -> None:
+        for callback in self._shutdown_callbacks:
+            await callback()
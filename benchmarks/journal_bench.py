@@ -0,0 +1,67 @@
+"""Journal append throughput as concurrent appenders in one process grow, group commit vs fsync per record
+
+    python benchmarks/journal_bench.py --sessions 1 2 5 10 20 50 --appends 200
+
+Every session appends through one TransactionJournal, so this measures several calls sharing a
+process. The agents run each job in a process of its own, with a journal segment of its own;
+there, only appends made concurrently by the same call share an fsync, which is the 1-session row.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import TransactionJournal
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_sessions(path: str, sessions: int, appends: int, max_batch: int):
+    journal = TransactionJournal(path, max_batch=max_batch)
+    journal.open()
+    latencies = []
+
+    async def session(index: int):
+        for i in range(appends):
+            start = time.perf_counter()
+            await journal.append("transaction", {
+                "transaction_id": f"TXN-{index}-{i}",
+                "amount": 150.0,
+                "method": "card",
+                "processed_at": "2024-10-01T12:00:00",
+            })
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    stats = dict(journal.stats)
+    await journal.close()
+    return sessions * appends / elapsed, percentile(latencies, 50), percentile(latencies, 99), stats
+
+
+async def main(args):
+    directory = tempfile.mkdtemp()
+    print(f"{'sessions':>8} {'mode':>13} {'records/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'recs/fsync':>10}")
+    for sessions in args.sessions:
+        for mode, max_batch in (("group-commit", 1024), ("fsync-each", 1)):
+            path = os.path.join(directory, f"{mode}-{sessions}.journal")
+            rate, p50, p99, stats = await run_sessions(path, sessions, args.appends, max_batch)
+            print(
+                f"{sessions:>8} {mode:>13} {rate:>10.0f} {p50:>8.2f} {p99:>8.2f} "
+                f"{stats['records'] / max(stats['commits'], 1):>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 5, 10, 20, 50])
+    parser.add_argument("--appends", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,337 @@
+"""Agent overhead and per-worker capacity, driving the real entrypoints with local fake providers
+
+    python benchmarks/pipeline_bench.py --agent agent_collections --sessions 1 2 5 10 20
+
+Each session runs the agent's entrypoint against a FakeRoom and talks to it through a
+scripted caller (see benchmarks/fakes.py). Turn latency runs from the caller's last voiced
+frame to the agent starting to speak; overhead is what remains after subtracting the
+simulated VAD silence, LLM time to first token and TTS first byte. All sessions share one
+process, as jobs share one worker's CPU, and the fakes do no model inference, so the CPU
+figures are the agent's own cost on top of the VAD model.
+"""
+import argparse
+import asyncio
+import gc
+import importlib
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import FakeCaller, FakeJobContext, FakeProcess, FakeRoom, ScriptedLLM, ScriptedSTT, ScriptedVAD, SilentTTS, ToolErrors
+
+TOOL_ERRORS = ToolErrors()
+
+# Agent module -> plugin set name used by get_plugins(), scripted conversation
+AGENTS = {
+    "agent": {
+        "plugins": "general",
+        "turns": [
+            {"caller": "What's the weather like in Boston today?", "tool": {"name": "get_weather", "arguments": {"location": "Boston"}},
+             "agent": "It's sunny and seventy two degrees in Boston right now."},
+            {"caller": "Can you book me a dentist appointment on Friday at three?",
+             "tool": {"name": "schedule_appointment", "arguments": {"date": "Friday", "time": "3 PM", "description": "Dentist"}},
+             "agent": "Done. Your dentist appointment is booked for Friday at three."},
+            {"caller": "Great, thanks, that's all.", "agent": "You're welcome. Have a great day!"},
+        ],
+    },
+    "agent_collections": {
+        "plugins": "collections",
+        "turns": [
+            {"caller": "Sure, the last four are one two three four and my birthday is January fifteenth nineteen eighty.",
+             "tool": {"name": "verify_account", "arguments": {"account_number": "1234", "date_of_birth": "01/15/1980"}},
+             "agent": "Thank you, you're verified. Your balance is one thousand five hundred dollars, three hundred of it past due."},
+            {"caller": "What are my options?", "tool": {"name": "get_payment_options", "arguments": {"balance": 1500.0}},
+             "agent": "You can pay in full, set up a three or six month plan, or make a partial payment today."},
+            {"caller": "I'll pay three hundred dollars today with my card.",
+             "tool": {"name": "process_payment", "arguments": {"amount": 300.0, "payment_method": "card", "payment_details": "card ending 4242"}},
+             "agent": "Your payment of three hundred dollars went through. Your confirmation number is on its way."},
+            {"caller": "Please email the confirmation to jane at example dot com.",
+             "tool": {"name": "send_payment_confirmation", "arguments": {"email": "jane@example.com"}},
+             "agent": "Done, the confirmation is on its way to your email."},
+            {"caller": "Thank you, goodbye.", "agent": "Thank you for your payment. Have a good day."},
+        ],
+    },
+    "agent_outbound": {
+        "plugins": "outbound",
+        "metadata": {"phoneNumber": "+15555550100", "customerName": "John Smith", "amountOwed": 450.0, "paymentDueDate": "2030-01-15"},
+        "turns": [
+            {"caller": "Yes, this is John.", "tool": {"name": "confirm_speaking_with_customer", "arguments": {"confirmed": True}},
+             "agent": "Thanks John. I'm calling about your payment of four hundred fifty dollars due on January fifteenth. Will you be able to make it?"},
+            {"caller": "Money is tight, what can I do?", "tool": {"name": "offer_payment_options", "arguments": {}},
+             "agent": "You could pay in full with a discount, or split it into three or six monthly payments."},
+            {"caller": "I'll pay the full amount on Friday with my card.",
+             "tool": {"name": "process_payment_commitment", "arguments": {"payment_type": "full", "amount": 450.0, "payment_date": "Friday", "payment_method": "card"}},
+             "agent": "Perfect, I've recorded your commitment to pay four hundred fifty dollars on Friday."},
+            {"caller": "Okay, bye.", "agent": "Thank you John, have a good day."},
+        ],
+    },
+}
+
+SEED_ACCOUNT = {
+    "account_number": "ACC-0001",
+    "ssn_last4": "1234",
+    "date_of_birth": "1980-01-15",
+    "balance": 1500.0,
+    "past_due": 300.0,
+    "days_overdue": 45,
+    "last_payment_date": "2024-08-15",
+    "minimum_payment": 150.0,
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else float("nan")
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def build_process(module, spec, args) -> FakeProcess:
+    """Shared plugins for one worker, laid out the way prewarm_process() lays them out"""
+    from prewarm import get_tts_cache
+    from tts_cache import CachedTTS, load_phrases
+
+    proc = FakeProcess({"vad": ScriptedVAD(min_silence=args.vad_silence)})
+    cache = get_tts_cache(proc)
+    tts_client = CachedTTS(SilentTTS(args.tts_latency, args.seconds_per_word), cache, module.PLUGIN_CONFIG["tts"])
+    phrases = getattr(module, "CACHED_PHRASES", None)
+    if phrases is None and hasattr(module, "GREETING_TEMPLATE"):
+        phrases = [module.GREETING_TEMPLATE]
+    tts_client.warm(load_phrases(phrases or []))
+    proc.userdata["plugins"] = {
+        spec["plugins"]: {
+            "stt": ScriptedSTT(final_delay=args.stt_final_delay),
+            "llm": ScriptedLLM(spec["turns"], ttft=args.llm_ttft, token_delay=args.token_delay),
+            "tts": tts_client,
+        }
+    }
+    return proc
+
+
+async def run_session(module, spec, proc, index: int, args):
+    """One call: wait for the greeting, play every scripted turn, then hang up"""
+    await asyncio.sleep(index * args.stagger)
+    room = FakeRoom(f"bench-{index}", json.dumps(spec.get("metadata", {})))
+    caller = FakeCaller(f"caller-{index}", seconds_per_word=args.caller_seconds_per_word)
+    room.add_participant(caller)
+    caller.start()
+    ctx = FakeJobContext(proc, room, caller)
+    agent = room.local_participant
+
+    entrypoint = asyncio.create_task(module.entrypoint(ctx))
+    latencies, overheads, failures = [], [], 0
+    try:
+        await agent.wait_for_state("speaking", args.turn_timeout)
+        await agent.wait_for_state("listening", args.turn_timeout)
+        for turn in spec["turns"]:
+            ended = await caller.say(turn["caller"])
+            try:
+                started = await agent.wait_for_state("speaking", args.turn_timeout)
+                await agent.wait_for_state("listening", args.turn_timeout)
+            except asyncio.TimeoutError:
+                failures += 1
+                continue
+            llm_calls = 2 if "tool" in turn else 1
+            floor = args.vad_silence + llm_calls * args.llm_ttft + args.tts_latency
+            latencies.append(started - ended)
+            overheads.append(started - ended - floor)
+    except asyncio.TimeoutError:
+        failures += len(spec["turns"]) + 1
+    finally:
+        room.remove_participant(caller)
+        await caller.hang_up()
+        await entrypoint
+        await ctx.shutdown()
+    return latencies, overheads, failures
+
+
+async def run_level(module, spec, proc, sessions: int, args):
+    from latency import shared_latency_registry
+
+    registry = shared_latency_registry()
+    registry.histograms.clear()
+    TOOL_ERRORS.errors.clear()
+    existing = asyncio.all_tasks()
+    peak_rss = baseline_rss = rss_bytes()
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, rss_bytes())
+            await asyncio.sleep(0.2)
+
+    sampler = asyncio.create_task(sample_rss())
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    results = await asyncio.gather(*(run_session(module, spec, proc, i, args) for i in range(sessions)))
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    sampler.cancel()
+
+    # The pipelines keep their own tasks after the call ends; stop them before the next level
+    leftover = [t for t in asyncio.all_tasks() if t not in existing and t is not asyncio.current_task()]
+    for task in leftover:
+        task.cancel()
+    await asyncio.gather(*leftover, return_exceptions=True)
+    gc.collect()
+
+    latencies = [x for r in results for x in r[0]]
+    overheads = [x for r in results for x in r[1]]
+    return {
+        "sessions": sessions,
+        "turns": len(latencies),
+        "failures": sum(r[2] for r in results),
+        "turns_per_s": len(latencies) / wall,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p95_ms": percentile(latencies, 95) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "overhead_p50_ms": percentile(overheads, 50) * 1000,
+        "overhead_p95_ms": percentile(overheads, 95) * 1000,
+        "cpu_cores": cpu / wall,
+        "cpu_per_session_pct": cpu / wall / sessions * 100,
+        "rss_per_session_mb": (peak_rss - baseline_rss) / sessions / 2**20,
+        "stages": registry.summary(),
+        "tool_errors": list(TOOL_ERRORS.errors),
+    }
+
+
+async def start_worker_services(agent: str):
+    """Start the per-process singletons up front so their loops outlive each level's cleanup"""
+    from call_events import shared_event_sink
+    from call_state import shared_call_state
+    from latency import shared_latency_registry
+
+    shared_latency_registry()
+    shared_event_sink()
+    shared_call_state()
+    if agent == "agent_collections":
+        from account_store import shared_account_store
+        from journal import shared_journal
+        from outbox import shared_outbox
+
+        store = await shared_account_store()
+        await store.load_accounts([SEED_ACCOUNT])
+        shared_journal()
+        shared_outbox()
+
+
+async def measure_level(args, sessions: int):
+    """Measure one concurrency level in this process, after one unreported warm-up call"""
+    work_dir = tempfile.mkdtemp(prefix="pipeline-bench-")
+    for name, value in (
+        ("ACCOUNT_DB_PATH", "accounts.db"),
+        ("JOURNAL_PATH", "transactions.journal"),
+        ("OUTBOX_SPOOL_PATH", "outbox.spool"),
+        ("TTS_CACHE_DIR", "tts_cache"),
+        ("LATENCY_DUMP_DIR", "latency"),
+        ("EVENT_LOG_DIR", "events"),
+        ("RECORDING_DIR", "recordings"),
+    ):
+        os.environ[name] = os.path.join(work_dir, value)
+    # Overhead is measured against the LLM path, so fast-path turns show up as negative overhead
+    os.environ["FAST_PATH_ROUTER"] = "1" if args.fast_path else "0"
+    # The fake caller has no native audio track for answering machine detection to listen to
+    os.environ["AMD_ON_MACHINE"] = "off"
+
+    module = importlib.import_module(args.agent)
+    spec = AGENTS[args.agent]
+    TOOL_ERRORS.install()
+    await start_worker_services(args.agent)
+    proc = build_process(module, spec, args)
+
+    # The warm-up keeps one-time costs (FFI start-up, greeting synthesis) out of the measurement
+    await run_level(module, spec, proc, 1, args)
+    row = await run_level(module, spec, proc, sessions, args)
+
+    if args.agent == "agent_collections":
+        from account_store import shared_account_store
+        await (await shared_account_store()).close()
+    return row
+
+
+def main(args):
+    if args.child:
+        row = asyncio.run(measure_level(args, args.child))
+        print(f"RESULT {json.dumps(row)}", flush=True)
+        # Skip interpreter teardown: late FFI callbacks into the closed loop can abort the process
+        os._exit(0)
+
+    print(f"{args.agent}: {len(AGENTS[args.agent]['turns'])} turns per session")
+    print(
+        f"{'sessions':>8} {'turns/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'ovh p50':>8} {'ovh p95':>8} {'cpu/sess':>9} {'rss/sess':>9} {'failed':>6}"
+    )
+    rows = []
+    for sessions in args.sessions:
+        # A fresh process per level, so CPU and memory baselines do not carry over between levels
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--child", str(sessions)],
+            stdout=subprocess.PIPE, text=True,
+        )
+        result = next((line for line in child.stdout.splitlines() if line.startswith("RESULT ")), None)
+        if result is None:
+            print(f"{sessions:>8} level did not complete (exit code {child.returncode})")
+            continue
+        row = json.loads(result[len("RESULT "):])
+        rows.append(row)
+        print(
+            f"{sessions:>8} {row['turns_per_s']:>8.2f} {row['latency_p50_ms']:>8.0f} {row['latency_p95_ms']:>8.0f} "
+            f"{row['latency_p99_ms']:>8.0f} {row['overhead_p50_ms']:>8.0f} {row['overhead_p95_ms']:>8.0f} "
+            f"{row['cpu_per_session_pct']:>8.1f}% {row['rss_per_session_mb']:>7.1f}MB {row['failures']:>6}"
+        )
+        for error, count in Counter(row["tool_errors"]).most_common():
+            print(f"{'':>8} tool error x{count}: {error}")
+
+    # Largest level that keeps overhead within budget and leaves CPU headroom for the VAD model
+    baseline = rows[0]["overhead_p95_ms"]
+    fits = [
+        r["sessions"] for r in rows
+        if not r["failures"] and r["overhead_p95_ms"] <= baseline + args.overhead_budget_ms and r["cpu_cores"] <= args.cpu_budget
+    ]
+    if fits:
+        print(f"Suggested scaling.target_concurrent_sessions (<= {args.cpu_budget:.0%} of a core, p95 overhead within {args.overhead_budget_ms:.0f}ms of 1 session): {max(fits)}")
+    else:
+        print("No level ran every turn within budget, so there is no suggested target")
+    print(f"Stage latency at {rows[-1]['sessions']} sessions: {json.dumps(rows[-1]['stages'])}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"agent": args.agent, "args": vars(args), "levels": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--agent", choices=sorted(AGENTS), default="agent_collections")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 5, 10, 20])
+    parser.add_argument("--stagger", type=float, default=0.1, help="Seconds between session starts")
+    parser.add_argument("--vad-silence", type=float, default=0.3, help="Silence before VAD ends speech")
+    parser.add_argument("--stt-final-delay", type=float, default=0.2, help="Silence before the final transcript")
+    parser.add_argument("--llm-ttft", type=float, default=0.3, help="LLM time to first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between LLM tokens")
+    parser.add_argument("--tts-latency", type=float, default=0.2, help="TTS time to first byte")
+    parser.add_argument("--seconds-per-word", type=float, default=0.3, help="Length of synthesized speech per word")
+    parser.add_argument("--caller-seconds-per-word", type=float, default=0.3)
+    parser.add_argument("--turn-timeout", type=float, default=30.0)
+    parser.add_argument("--overhead-budget-ms", type=float, default=100.0)
+    parser.add_argument("--cpu-budget", type=float, default=0.7, help="Cores the agents may use, leaving the rest for VAD")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--fast-path", action="store_true", help="Enable the outbound fast-path intent router")
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    main(args)
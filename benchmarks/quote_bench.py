@@ -0,0 +1,67 @@
+"""Batch pricing throughput and live lookup latency of the quote book
+
+    python benchmarks/quote_bench.py --accounts 5000000 --lookups 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quotes import QuoteBook, build_quote_book, payment_options, quote_balance
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def synthetic_portfolio(count: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    account_numbers = np.char.add(b"AC", np.char.zfill(np.arange(count).astype("S9"), 9))
+    balances = np.round(rng.uniform(100, 20000, count), 2)
+    return account_numbers, balances
+
+
+def run(args):
+    directory = args.dir or tempfile.mkdtemp(prefix="quote-book-")
+    account_numbers, balances = synthetic_portfolio(args.accounts)
+
+    start = time.perf_counter()
+    build_quote_book(account_numbers, balances, directory)
+    elapsed = time.perf_counter() - start
+    print(f"Priced and indexed {args.accounts} accounts in {elapsed:.2f}s ({args.accounts / elapsed:,.0f} accounts/s) into {directory}")
+
+    book = QuoteBook(directory)
+    rng = np.random.default_rng(11)
+    probes = [account_numbers[i].decode() for i in rng.integers(0, args.accounts, args.lookups)]
+    lookups = []
+    for account_number in probes:
+        start = time.perf_counter()
+        payment_options(book.get(account_number))
+        lookups.append((time.perf_counter() - start) * 1e6)
+
+    # The same tool output priced live, for comparison
+    live = []
+    for balance in balances[:args.lookups]:
+        start = time.perf_counter()
+        payment_options(quote_balance(float(balance)))
+        live.append((time.perf_counter() - start) * 1e6)
+
+    for name, samples in (("quote book", lookups), ("priced live", live)):
+        print(
+            f"  {name:12s} p50 {percentile(samples, 50):.1f}us  p95 {percentile(samples, 95):.1f}us  "
+            f"p99 {percentile(samples, 99):.1f}us  max {max(samples):.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--dir", help="Write the quote book here instead of a temporary directory")
+    run(parser.parse_args())
@@ -0,0 +1,194 @@
+"""CPU, memory and event-loop cost of recording concurrent calls
+
+    python benchmarks/recorder_bench.py --calls 1 10 25 50 --seconds 20
+
+Every call reproduces the audio a voice pipeline moves: the caller's 48kHz track, read through
+an AudioStream as the pipeline reads it, and the agent's 24kHz audio source, fed reply by reply
+at the pace its queue allows, with some replies interrupted and their queued audio cleared.
+Each level runs in a fresh process per mode:
+
+    off        the calls alone
+    streams    plus an AudioStream per leg, discarding the frames (tapping the tracks directly)
+    recorder   plus CallRecorder, copying the frames the call already moves
+
+and reports CPU per call (the writer thread's share separately), peak RSS per call, event-loop
+stalls (a monitor task sleeps 1ms at a time; a stall is how late it wakes up) and the size of
+the recordings.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from livekit import rtc
+from recorder import CallRecorder
+
+CALLER_RATE = 48000
+AGENT_RATE = 24000
+FRAME_MS = 20
+MODES = ("off", "streams", "recorder")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def thread_cpu_seconds(native_id: int) -> float:
+    with open(f"/proc/self/task/{native_id}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def tone(rate: int, hz: float) -> bytes:
+    samples = rate * FRAME_MS // 1000
+    return (np.sin(np.arange(samples) * 2 * np.pi * hz / rate) * 6000).astype(np.int16).tobytes()
+
+
+async def monitor(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(max(0.0, time.perf_counter() - start - 0.001) * 1000)
+
+
+async def caller_talks(source: rtc.AudioSource, seconds: float):
+    """Real-time frames, as a remote participant's track delivers them"""
+    data, samples = tone(CALLER_RATE, 250), CALLER_RATE * FRAME_MS // 1000
+    start, sent = time.perf_counter(), 0
+    while sent * FRAME_MS / 1000 < seconds:
+        await source.capture_frame(rtc.AudioFrame(data, CALLER_RATE, 1, samples))
+        sent += 1
+        await asyncio.sleep(max(0.0, start + sent * FRAME_MS / 1000 - time.perf_counter()))
+
+
+async def agent_replies(source, seconds: float, rng: random.Random):
+    """Replies of a few seconds pushed as fast as the source's queue takes them, some cut short"""
+    data, samples = tone(AGENT_RATE, 500), AGENT_RATE * FRAME_MS // 1000
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(rng.uniform(1.0, 4.0))
+        frames = int(rng.uniform(1.0, 5.0) * 1000 / FRAME_MS)
+        interrupt_at = frames // 2 if rng.random() < 0.25 else frames
+        for i in range(frames):
+            if i == interrupt_at or time.perf_counter() >= deadline:
+                source.clear_queue()
+                break
+            await source.capture_frame(rtc.AudioFrame(data, AGENT_RATE, 1, samples))
+        else:
+            await source.wait_for_playout()
+
+
+async def pipeline_reads(track: rtc.LocalAudioTrack, on_frame=None):
+    """The pipeline's own stream of the caller's track"""
+    stream = rtc.AudioStream(track)
+    try:
+        async for event in stream:
+            if on_frame is not None:
+                on_frame(event.frame)
+    finally:
+        await stream.aclose()
+
+
+async def discard(track: rtc.LocalAudioTrack):
+    stream = rtc.AudioStream(track, sample_rate=16000)
+    try:
+        async for _ in stream:
+            pass
+    finally:
+        await stream.aclose()
+
+
+async def run_level(calls: int, mode: str, args, directory: str):
+    recorder = CallRecorder(directory, sample_rate=args.sample_rate, stereo=not args.mono)
+    rng = random.Random(calls)
+    readers, drivers, sources, recordings = [], [], [], []
+    for i in range(calls):
+        caller = rtc.AudioSource(CALLER_RATE, 1, queue_size_ms=200)
+        caller_track = rtc.LocalAudioTrack.create_audio_track(f"caller-{i}", caller)
+        agent = rtc.AudioSource(AGENT_RATE, 1)
+        agent_track = rtc.LocalAudioTrack.create_audio_track(f"agent-{i}", agent)
+        sources += [caller, agent]
+        on_frame, agent_source = None, agent
+        if mode == "recorder":
+            recording = recorder.start(f"call-{i}")
+            recordings.append(recording)
+            on_frame, agent_source = recording.on_caller_frame, recording.source(agent)
+        elif mode == "streams":
+            readers += [asyncio.create_task(discard(caller_track)), asyncio.create_task(discard(agent_track))]
+        readers.append(asyncio.create_task(pipeline_reads(caller_track, on_frame)))
+        drivers += [caller_talks(caller, args.seconds), agent_replies(agent_source, args.seconds, rng)]
+
+    stop, lags = asyncio.Event(), []
+    monitor_task = asyncio.create_task(monitor(stop, lags))
+    baseline_rss = peak_rss_bytes()
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    await asyncio.gather(*drivers)
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    writer_cpu = thread_cpu_seconds(recorder._thread.native_id) if recorder._thread is not None else 0.0
+    stop.set()
+    await monitor_task
+    for task in readers:
+        task.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+    for source in sources:
+        await source.aclose()
+
+    for recording in recordings:
+        await recording.close()
+    stats = [recording.stats() for recording in recordings]
+    return {
+        "calls": calls,
+        "cpu_per_call_pct": cpu / wall / calls * 100,
+        "writer_per_call_pct": writer_cpu / wall / calls * 100,
+        "rss_per_call_mb": (peak_rss_bytes() - baseline_rss) / calls / 2**20,
+        "stall_p99_ms": percentile(lags, 99),
+        "stall_max_ms": max(lags, default=0.0),
+        "kb_per_min": sum(s["bytes"] for s in stats) / max(1, len(stats)) / wall * 60 / 1024,
+        "dropped": sum(s["caller_dropped"] + s["agent_dropped"] for s in stats),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, nargs="+", default=[1, 10, 25, 50])
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--sample-rate", type=int, default=16000, help="Recording sample rate")
+    parser.add_argument("--mono", action="store_true", help="Mix the legs instead of interleaving them")
+    parser.add_argument("--level", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.level:
+        calls, mode = args.level.split(":")
+        directory = tempfile.mkdtemp(prefix="recorder-bench-")
+        print(json.dumps(asyncio.run(run_level(int(calls), mode, args, directory))))
+        sys.exit(0)
+
+    print(f"{'calls':>5s} {'mode':>8s} {'cpu/call':>9s} {'writer':>7s} {'rss/call':>9s} {'stall p99':>10s} {'max':>8s} {'KB/min':>7s} {'dropped':>8s}")
+    for calls in args.calls:
+        for mode in MODES:
+            child = subprocess.run(
+                [sys.executable, __file__, "--level", f"{calls}:{mode}", "--seconds", str(args.seconds),
+                 "--sample-rate", str(args.sample_rate)] + (["--mono"] if args.mono else []),
+                stdout=subprocess.PIPE, text=True, check=True,
+            )
+            r = json.loads(child.stdout.strip().splitlines()[-1])
+            print(
+                f"{calls:>5d} {mode:>8s} {r['cpu_per_call_pct']:>8.2f}% {r['writer_per_call_pct']:>6.2f}% "
+                f"{r['rss_per_call_mb']:>7.2f}MB {r['stall_p99_ms']:>8.2f}ms {r['stall_max_ms']:>6.1f}ms "
+                f"{r['kb_per_min']:>7.0f} {r['dropped']:>8d}"
+            )
@@ -0,0 +1,140 @@
+"""First-audio latency and playback stalls on long agent turns, with and without pipelined chunking
+
+    python benchmarks/speech_chunk_bench.py --trials 20 --tts-latency 0.2 --latency-per-char 0.002
+
+Speaks the outbound agent's long tool results two ways: streamed from the LLM a few characters
+at a time, and whole (a say() call). "before" is the pipeline's default for a non-streaming TTS
+(sentence-by-sentence StreamAdapter, and one synthesis of the whole text); "after" is
+PipelinedTTS. First audio is measured from the first text in; a stall is time the listener
+hears nothing after playback has started, because the next frame was not there yet.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from livekit.agents import tokenize, tts
+from fakes import SilentTTS
+from speech_chunker import PipelinedTTS, SentenceChunker
+
+CUSTOMER = {"customerName": "John Smith", "amountOwed": 1234.56, "paymentDueDate": "2030-06-15", "phoneNumber": "+15555550100"}
+
+# Amounts, dates and times that must come out of the chunker in one piece
+KEEP_TOGETHER = ["$1,234.56", "$1234.56", "06/15", "June 15, 2024", "3:30 p.m.", "Dr. Smith", "Jan. 15"]
+TRICKY = (
+    "Your balance is $1,234.56. I can set up payments on 06/15 and 07/15, or on June 15, 2024. "
+    "Dr. Smith asked us to call at 3:30 p.m. tomorrow, so the first draft goes out Jan. 15 at 4 p.m. Thanks!"
+)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def tool_results():
+    """The long replies the outbound tools hand to the agent"""
+    from agent_outbound import OutboundCollectionsAssistant, hydrate_customer_info
+
+    import json
+    assistant = OutboundCollectionsAssistant(hydrate_customer_info(json.dumps(CUSTOMER)))
+    return {
+        "offer_payment_options": await assistant.offer_payment_options(),
+        "process_payment_commitment": await assistant.process_payment_commitment("full", 1234.56, "06/15", "card"),
+        "handle_dispute": await assistant.handle_dispute("not my debt"),
+    }
+
+
+async def play(audio_stream, started: float):
+    """First-frame latency, total stall and finish time of an audio stream played back in real time"""
+    first, clock, stalled = None, None, 0.0
+    async for audio in audio_stream:
+        now = time.perf_counter()
+        duration = audio.frame.samples_per_channel / audio.frame.sample_rate
+        if first is None:
+            first, clock = now - started, now
+        elif now > clock:
+            stalled += now - clock
+            clock = now
+        clock += duration
+    return first, stalled, clock - started
+
+
+async def speak_streamed(engine: tts.TTS, text: str, token_chars: int, token_delay: float):
+    stream = engine.stream()
+    started = time.perf_counter()
+
+    async def feed():
+        for i in range(0, len(text), token_chars):
+            stream.push_text(text[i:i + token_chars])
+            await asyncio.sleep(token_delay)
+        stream.end_input()
+
+    feeder = asyncio.create_task(feed())
+    result = await play(stream, started)
+    await feeder
+    return result
+
+
+async def speak_whole(engine: tts.TTS, text: str):
+    return await play(engine.synthesize(text), time.perf_counter())
+
+
+async def run(args):
+    texts = await tool_results()
+    chunker = SentenceChunker(first_chunk_chars=args.first_chunk_chars)
+
+    print("Chunk boundaries:")
+    for name, text in [*texts.items(), ("tricky", TRICKY)]:
+        chunks = chunker.tokenize(text)
+        print(f"  {name}:")
+        for chunk in chunks:
+            print(f"    | {chunk}")
+        broken = [piece for piece in KEEP_TOGETHER if piece in " ".join(text.split()) and not any(piece in c for c in chunks)]
+        if broken:
+            print(f"    !! split inside {broken}")
+
+    print()
+    print(f"{'turn':28s} {'mode':9s} {'':7s} {'first p50':>10s} {'first p95':>10s} {'stall p50':>10s} {'done p50':>9s} {'requests':>9s}")
+    for name, text in texts.items():
+        for mode in ("streamed", "whole"):
+            for label in ("before", "after"):
+                firsts, stalls, dones, requests = [], [], [], 0
+                for _ in range(args.trials):
+                    silent = SilentTTS(args.tts_latency, args.seconds_per_word, args.realtime_factor, args.latency_per_char)
+                    if label == "before":
+                        engine = tts.StreamAdapter(tts=silent, sentence_tokenizer=tokenize.basic.SentenceTokenizer())
+                    else:
+                        engine = PipelinedTTS(silent, chunker, lookahead=args.lookahead)
+                    if mode == "streamed":
+                        first, stalled, done = await speak_streamed(engine, text, args.token_chars, args.token_delay)
+                    else:
+                        first, stalled, done = await speak_whole(engine, text)
+                    firsts.append(first)
+                    stalls.append(stalled)
+                    dones.append(done)
+                    requests += silent.requests
+                print(
+                    f"{name:28s} {mode:9s} {label:7s} {percentile(firsts, 50) * 1000:>8.0f}ms {percentile(firsts, 95) * 1000:>8.0f}ms "
+                    f"{percentile(stalls, 50) * 1000:>8.0f}ms {percentile(dones, 50):>8.1f}s {requests / args.trials:>9.1f}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trials", type=int, default=20)
+    parser.add_argument("--tts-latency", type=float, default=0.2, help="TTS time to first byte for an empty input")
+    parser.add_argument("--latency-per-char", type=float, default=0.002, help="Extra time to first byte per input character")
+    parser.add_argument("--seconds-per-word", type=float, default=0.3, help="Length of synthesized speech per word")
+    parser.add_argument("--realtime-factor", type=float, default=10.0, help="How much faster than real time audio is produced")
+    parser.add_argument("--token-chars", type=int, default=4, help="Characters per streamed LLM token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between LLM tokens")
+    parser.add_argument("--first-chunk-chars", type=int, default=30)
+    parser.add_argument("--lookahead", type=int, default=2)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
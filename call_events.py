@@ -0,0 +1,204 @@
+"""Structured transcript and call-event log, written off the event loop
+
+Handlers enqueue events without serializing them; a background task hands batches to a thread
+that encodes them as JSON lines and appends each batch to the current segment as one gzip
+member, so a crash loses at most the batch being written. Segments rotate by size and age.
+
+    python call_events.py cat events/
+    python call_events.py cat events/ --session room-123 --kind function_call
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, NamedTuple, Optional
+
+logger = logging.getLogger("call-events")
+logger.setLevel(logging.INFO)
+
+
+class CallEvent(NamedTuple):
+    ts: float
+    session: str
+    kind: str
+    data: Dict[str, Any]
+
+
+def encode_batch(batch: List[CallEvent]) -> bytes:
+    lines = (
+        json.dumps({"ts": event.ts, "session": event.session, "kind": event.kind, **event.data}, separators=(",", ":"), default=str)
+        for event in batch
+    )
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def read_events(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield the events of one segment, stopping at a torn final batch"""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+    except (EOFError, gzip.BadGzipFile, ValueError) as e:
+        logger.warning(f"Stopped reading {path} at a damaged batch: {e}")
+
+
+class EventSink:
+    """Bounded in-memory queue of call events, drained in batches to rotated gzip JSONL segments
+
+    `emit` never blocks and never touches the disk. When writes fall behind and `max_pending`
+    events are queued, new events are dropped and counted rather than growing memory. Encoding
+    holds the GIL, so batches are kept small enough that the loop never waits long for it.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_pending: int = 50_000,
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+        rotate_bytes: int = 64 * 1024 * 1024,
+        rotate_seconds: float = 3600.0,
+        compresslevel: int = 6,
+    ):
+        self.directory = directory
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compresslevel = compresslevel
+        self._pending: Deque[CallEvent] = deque()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._segment: Optional[str] = None
+        self._segment_started = 0.0
+        self._segment_bytes = 0
+        self._segments = 0
+        self.counters = {"emitted": 0, "written": 0, "dropped": 0, "batches": 0, "bytes": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "EventSink":
+        """Configured by EVENT_LOG_DIR, EVENT_LOG_MAX_PENDING and EVENT_LOG_ROTATE_MB"""
+        return cls(
+            os.getenv("EVENT_LOG_DIR", "events"),
+            max_pending=int(os.getenv("EVENT_LOG_MAX_PENDING", "50000")),
+            rotate_bytes=int(float(os.getenv("EVENT_LOG_ROTATE_MB", "64")) * 1024 * 1024),
+        )
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._flush_loop())
+
+    def emit(self, session: str, kind: str, **data: Any) -> bool:
+        """Queue an event; returns False if it was dropped because the queue is full
+
+        Values are kept by reference and serialized later, so they must not be mutated afterwards.
+        """
+        if len(self._pending) >= self.max_pending:
+            self.counters["dropped"] += 1
+            return False
+        self._pending.append(CallEvent(time.time(), session, kind, data))
+        self.counters["emitted"] += 1
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def _take_batch(self) -> List[CallEvent]:
+        count = min(self.batch_size, len(self._pending))
+        return [self._pending.popleft() for _ in range(count)]
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write everything queued so far"""
+        # Loop and shutdown flushes can overlap; batches go to the segment one at a time, in order
+        async with self._lock:
+            dropped = self.counters["dropped"]
+            while self._pending:
+                batch = self._take_batch()
+                try:
+                    written = await asyncio.to_thread(self._write, batch)
+                except OSError as e:
+                    # The events are lost, but the queue keeps draining so memory stays bounded
+                    self.counters["dropped"] += len(batch)
+                    logger.error(f"Writing {len(batch)} call events failed: {e}")
+                    continue
+                self.counters["written"] += len(batch)
+                self.counters["batches"] += 1
+                self.counters["bytes"] += written
+            if self.counters["dropped"] > dropped:
+                logger.warning(f"Dropped {self.counters['dropped'] - dropped} call events, the write queue was full")
+
+    def _write(self, batch: List[CallEvent]) -> int:
+        now = time.time()
+        if self._segment is None or self._segment_bytes >= self.rotate_bytes or now - self._segment_started >= self.rotate_seconds:
+            self._segments += 1
+            self._segment = os.path.join(self.directory, f"events-{os.getpid()}-{int(now)}-{self._segments}.jsonl.gz")
+            self._segment_started = now
+            self._segment_bytes = 0
+
+        data = gzip.compress(encode_batch(batch), compresslevel=self.compresslevel)
+        with open(self._segment, "ab") as f:
+            f.write(data)
+        self._segment_bytes += len(data)
+        return len(data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "pending": len(self._pending), "segments": self._segments}
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+
+_shared_sink: Optional[EventSink] = None
+
+
+def shared_event_sink() -> EventSink:
+    """Event sink shared by every job in this worker process, started on first use"""
+    global _shared_sink
+    if _shared_sink is None:
+        sink = EventSink.from_env()
+        sink.start()
+        _shared_sink = sink
+    return _shared_sink
+
+
+async def flush_event_sink() -> None:
+    """Write the queued events now, e.g. when a job shuts down"""
+    if _shared_sink is not None:
+        await _shared_sink.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print call events from a directory of segments")
+    parser.add_argument("command", choices=["cat"])
+    parser.add_argument("directory")
+    parser.add_argument("--session")
+    parser.add_argument("--kind")
+    args = parser.parse_args()
+
+    count = 0
+    for path in sorted(glob.glob(os.path.join(args.directory, "events-*.jsonl.gz")), key=os.path.getmtime):
+        for event in read_events(path):
+            if (args.session and event["session"] != args.session) or (args.kind and event["kind"] != args.kind):
+                continue
+            count += 1
+            sys.stdout.write(json.dumps(event) + "\n")
+    sys.stderr.write(f"{count} events\n")
@@ -0,0 +1,304 @@
+"""Live call state pushed from the agents to dashboards
+
+Each job process keeps a registry of its calls (phase, identity confirmed, payment secured,
+callback scheduled, ...) and pushes coalesced changes over one WebSocket to the hub at
+CALL_STATE_URL. The hub merges every process's calls and serves them:
+
+    python call_state.py serve --port 9470
+
+    GET /calls          all live and recently ended calls
+    GET /calls/{room}   one call, 404 if unknown
+    GET /events         Server-Sent Events: a snapshot, then the changed fields of changed calls
+
+Changes are batched every CALL_STATE_INTERVAL seconds, so a call that changes five times in a
+batch costs one delta, and one connection can watch every call without polling LiveKit. When a
+job ends, its last batch is sent before the connection closes; the hub marks calls that were not
+ended by then as "agent disconnected".
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("call-state")
+logger.setLevel(logging.INFO)
+
+class CallStateRegistry:
+    """Current state of each call, with the fields changed since the last publish
+
+    `update` only records fields whose value changed. Every `interval` the pending changes go
+    out as one {room: delta} batch to each subscriber; a delta of None means the call was
+    dropped. Subscribers that fall `max_backlog` batches behind are closed, and reconnect to a
+    fresh snapshot. Ended calls are kept for `retain` seconds so their outcome can be read.
+    """
+
+    def __init__(self, interval: float = 0.25, retain: float = 300.0, max_backlog: int = 100):
+        self.interval = interval
+        self.retain = retain
+        self.max_backlog = max_backlog
+        self.calls: Dict[str, Dict[str, Any]] = {}
+        self.seq = 0
+        self._pending: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._subscribers: List[asyncio.Queue] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._publish_loop())
+
+    def update(self, room: str, **fields: Any) -> None:
+        state = self.calls.get(room)
+        if state is None:
+            state = self.calls[room] = {"room": room, "started_at": time.time()}
+            changed = dict(state, **fields)
+        else:
+            changed = {key: value for key, value in fields.items() if state.get(key) != value}
+            if not changed:
+                return
+        if changed.get("phase") == "ended":
+            changed["ended_at"] = time.time()
+        changed["updated_at"] = time.time()
+        state.update(changed)
+        self._mark(room, changed)
+
+    def apply(self, deltas: Dict[str, Optional[Dict[str, Any]]]) -> None:
+        """Merge a batch published by another registry"""
+        for room, delta in deltas.items():
+            if delta is None:
+                self.drop(room)
+            else:
+                self.calls.setdefault(room, {"room": room}).update(delta)
+                self._mark(room, delta)
+
+    def _mark(self, room: str, changed: Dict[str, Any]) -> None:
+        pending = self._pending.get(room)
+        if pending is not None:
+            pending.update(changed)
+        elif room in self._pending:
+            # Dropped earlier in this batch and back again, so subscribers need all of it
+            self._pending[room] = dict(self.calls[room])
+        else:
+            self._pending[room] = dict(changed)
+
+    def drop(self, room: str) -> None:
+        if self.calls.pop(room, None) is not None:
+            self._pending[room] = None
+
+    def get(self, room: str) -> Optional[Dict[str, Any]]:
+        return self.calls.get(room)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {room: dict(state) for room, state in self.calls.items()}
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue of {"seq", "calls"} batches; None means the subscriber fell behind and was closed"""
+        queue: asyncio.Queue = asyncio.Queue(self.max_backlog + 1)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    async def _publish_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self._evict_ended()
+            self.publish()
+
+    def publish(self) -> None:
+        if not self._pending:
+            return
+        self.seq += 1
+        batch = {"seq": self.seq, "calls": self._pending}
+        self._pending = {}
+        for queue in list(self._subscribers):
+            if queue.qsize() >= self.max_backlog:
+                self.unsubscribe(queue)
+                queue.put_nowait(None)
+            else:
+                queue.put_nowait(batch)
+
+    def _evict_ended(self) -> None:
+        cutoff = time.time() - self.retain
+        for room in [room for room, state in self.calls.items() if state.get("ended_at", cutoff + 1) <= cutoff]:
+            self.drop(room)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": len(self.calls), "subscribers": len(self._subscribers), "seq": self.seq}
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.publish()
+
+
+class CallStatePublisher:
+    """Forwards a job process's registry to the hub, resending a snapshot after every reconnect"""
+
+    def __init__(self, registry: CallStateRegistry, url: str, max_backoff: float = 10.0):
+        self.registry = registry
+        self.url = url.rstrip("/") + "/publish"
+        self.max_backoff = max_backoff
+        self._task: Optional[asyncio.Task] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._sending = False
+        self.counters = {"connects": 0, "batches": 0, "resyncs": 0}
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        import aiohttp
+
+        backoff = 0.5
+        async with aiohttp.ClientSession() as session:
+            while True:
+                queue = self.registry.subscribe()
+                try:
+                    async with session.ws_connect(self.url, heartbeat=30) as ws:
+                        self.counters["connects"] += 1
+                        backoff = 0.5
+                        await ws.send_json({"seq": self.registry.seq, "calls": self.registry.snapshot()})
+                        # Connected and in sync: from here on the queue is all that is left to send
+                        self._queue = queue
+                        while (batch := await queue.get()) is not None:
+                            self._sending = True
+                            await ws.send_json(batch)
+                            self._sending = False
+                            self.counters["batches"] += 1
+                        self.counters["resyncs"] += 1
+                except (aiohttp.ClientError, OSError) as e:
+                    logger.warning(f"Call state hub at {self.url} unavailable, retrying in {backoff:.1f}s: {e}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(self.max_backoff, backoff * 2)
+                finally:
+                    self._queue = None
+                    self._sending = False
+                    self.registry.unsubscribe(queue)
+
+    def synced(self) -> bool:
+        """Whether the hub has been sent every batch published so far"""
+        return self._queue is not None and self._queue.empty() and not self._sending
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for the hub to be sent every published batch"""
+        deadline = time.monotonic() + timeout
+        while not self.synced():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def close(self) -> None:
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            # Let the connection close cleanly, so the hub sees the worker leave
+            await asyncio.wait([task])
+
+
+_shared_registry: Optional[CallStateRegistry] = None
+_shared_publisher: Optional[CallStatePublisher] = None
+
+
+def shared_call_state() -> CallStateRegistry:
+    """Registry of this job process; publishes to CALL_STATE_URL when set"""
+    global _shared_registry, _shared_publisher
+    if _shared_registry is None:
+        _shared_registry = CallStateRegistry(float(os.getenv("CALL_STATE_INTERVAL", "0.25")))
+        _shared_registry.start()
+        url = os.getenv("CALL_STATE_URL")
+        if url:
+            _shared_publisher = CallStatePublisher(_shared_registry, url)
+            _shared_publisher.start()
+    return _shared_registry
+
+
+async def flush_call_state() -> None:
+    """Publish the last changes and wait up to CALL_STATE_DRAIN_TIMEOUT seconds for the hub to get them
+
+    Registered as a job shutdown callback, so a call's final phase and outcome reach the hub
+    before the connection closes. A later job in the process starts a new registry and publisher.
+    """
+    global _shared_registry, _shared_publisher
+    registry, publisher = _shared_registry, _shared_publisher
+    if registry is None:
+        return
+    _shared_registry = _shared_publisher = None
+    await registry.close()
+    if publisher is not None:
+        if not await publisher.drain(float(os.getenv("CALL_STATE_DRAIN_TIMEOUT", "2"))):
+            logger.warning(f"Call state hub at {publisher.url} did not get the last changes before shutdown")
+        await publisher.close()
+
+
+async def serve(port: int, interval: float) -> None:
+    from aiohttp import WSMsgType, web
+
+    registry = CallStateRegistry(interval)
+    registry.start()
+
+    async def publish(request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        rooms: set = set()
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            batch = json.loads(message.data)
+            registry.apply(batch["calls"])
+            rooms.update(room for room, delta in batch["calls"].items() if delta is not None)
+        # A worker that went away takes its calls with it, unless they already ended
+        for room in rooms:
+            state = registry.get(room)
+            if state is not None and state.get("phase") != "ended":
+                registry.update(room, phase="ended", outcome="agent disconnected")
+        return ws
+
+    async def calls(request: web.Request) -> web.Response:
+        return web.json_response(registry.snapshot())
+
+    async def call(request: web.Request) -> web.Response:
+        state = registry.get(request.match_info["room"])
+        if state is None:
+            return web.json_response({"error": "unknown call"}, status=404)
+        return web.json_response(state)
+
+    async def events(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        queue = registry.subscribe()
+        try:
+            await response.write(f"event: snapshot\nid: {registry.seq}\ndata: {json.dumps(registry.snapshot())}\n\n".encode())
+            while (batch := await queue.get()) is not None:
+                await response.write(f"event: delta\nid: {batch['seq']}\ndata: {json.dumps(batch['calls'])}\n\n".encode())
+        except ConnectionResetError:
+            pass
+        finally:
+            registry.unsubscribe(queue)
+        return response
+
+    app = web.Application()
+    app.router.add_get("/publish", publish)
+    app.router.add_get("/calls", calls)
+    app.router.add_get("/calls/{room}", call)
+    app.router.add_get("/events", events)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    logger.info(f"Serving call state on http://127.0.0.1:{port}/events")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Live call state hub")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--port", type=int, default=int(os.getenv("CALL_STATE_PORT", "9470")))
+    parser.add_argument("--interval", type=float, default=float(os.getenv("CALL_STATE_INTERVAL", "0.25")))
+    args = parser.parse_args()
+    asyncio.run(serve(args.port, args.interval))
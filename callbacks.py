@@ -0,0 +1,464 @@
+"""Durable callback scheduling for outbound collections
+
+The agents append each requested callback to a shared journal (same line format as journal.py).
+A single runner process replays it into a heap ordered by due time, follows new appends, and
+dials the callbacks that come due through the campaign dialer. Callbacks due in the same minute
+are handed to the dialer as one batch, which paces them instead of ringing them all at once.
+What became of each callback is recorded in an outcomes journal so a restart does not call twice,
+and so are its retries and reschedules, so a restart keeps their new due times and attempt counts.
+
+    python callbacks.py run
+    python callbacks.py pending
+    python callbacks.py compact
+"""
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from dialer import CALLING_HOURS, Dialer, LiveKitRoomService, RoomService, within_calling_hours
+from ids import new_id
+from journal import TransactionJournal, decode_record, encode_record, read_journal, segment_paths
+
+logger = logging.getLogger("callbacks")
+logger.setLevel(logging.INFO)
+
+# Callbacks further out than this are more likely a misheard date than a real request
+MAX_CALLBACK_DAYS = 30
+
+# Outcome statuses that move a callback to a new due time rather than finishing it
+RESCHEDULED = ("retry", "rescheduled")
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+MONTHS = [
+    "january", "february", "march", "april", "may", "june",
+    "july", "august", "september", "october", "november", "december",
+]
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+
+ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+NUMERIC_DATE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+MONTH_DAY = re.compile(r"\b(" + "|".join(m[:3] for m in MONTHS) + r")[a-z]*\.? (\d{1,2})(?:st|nd|rd|th)?(?:,? (\d{4}))?\b")
+DAY_MONTH = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)? (?:of )?(" + "|".join(m[:3] for m in MONTHS) + r")[a-z]*\b")
+CLOCK = re.compile(
+    r"\b(\d{1,2}|" + "|".join(NUMBER_WORDS) + r")(?::(\d{2}))?\s*(am|pm|a\.m\.|p\.m\.|o'clock)?(?![\d/-])"
+    r"|\b(noon|midday)\b"
+)
+# A time inside the date argument, as in "tomorrow at 3pm"
+CLOCK_IN_DATE = re.compile(r"\b(?:at|around|after) (.+)")
+
+
+def parse_day(text: str, today: date) -> Optional[date]:
+    """Calendar day of a spoken or written date: ISO, month name, m/d, today, tomorrow or a weekday"""
+    text = text.strip().lower()
+    match = ISO_DATE.search(text)
+    if match:
+        year, month, day = (int(g) for g in match.groups())
+        return _valid_date(year, month, day)
+
+    explicit_year = None
+    match = MONTH_DAY.search(text)
+    if match:
+        month, day, explicit_year = [m[:3] for m in MONTHS].index(match.group(1)) + 1, int(match.group(2)), match.group(3)
+    else:
+        match = DAY_MONTH.search(text)
+        if match:
+            month, day = [m[:3] for m in MONTHS].index(match.group(2)) + 1, int(match.group(1))
+        else:
+            match = NUMERIC_DATE.search(text)
+            if match:
+                month, day, explicit_year = int(match.group(1)), int(match.group(2)), match.group(3)
+    if match:
+        if explicit_year:
+            year = int(explicit_year)
+            return _valid_date(year + 2000 if year < 100 else year, month, day)
+        # No year given: the next time that day comes round
+        found = _valid_date(today.year, month, day)
+        if found is not None and found < today:
+            found = _valid_date(today.year + 1, month, day)
+        return found
+
+    if re.search(r"\b(today|tonight|this (morning|afternoon|evening))\b", text):
+        return today
+    if re.search(r"\btomorrow\b", text):
+        return today + timedelta(days=1)
+    for index, weekday in enumerate(WEEKDAYS):
+        if re.search(rf"\b({weekday}|{weekday[:3]})\b", text):
+            return today + timedelta(days=(index - today.weekday() - 1) % 7 + 1)
+    return None
+
+
+def parse_clock(text: str) -> Optional[Tuple[int, int]]:
+    """Hour and minute of a spoken or written time such as "3pm", "15:30" or "noon" """
+    match = CLOCK.search(text.strip().lower())
+    if not match:
+        return None
+    if match.group(4):
+        return 12, 0
+    hour = NUMBER_WORDS.get(match.group(1)) or int(match.group(1))
+    minute = int(match.group(2) or 0)
+    meridiem = (match.group(3) or "").replace(".", "")
+    if hour > 23 or minute > 59 or (meridiem in ("am", "pm") and not 1 <= hour <= 12):
+        return None
+    if meridiem == "pm" and hour < 12:
+        hour += 12
+    elif meridiem == "am" and hour == 12:
+        hour = 0
+    elif meridiem not in ("am", "pm") and 1 <= hour < CALLING_HOURS[0]:
+        # "at 3" on a collections call means the afternoon
+        hour += 12
+    return hour, minute
+
+
+def parse_callback(date_text: str, time_text: str, now: datetime) -> Optional[datetime]:
+    """Local due time of a requested callback, or None unless it is a future time within calling hours
+
+    `now` must be timezone-aware in the customer's zone. Either argument may carry both parts,
+    as in date="tomorrow at 3pm".
+    """
+    day = parse_day(date_text, now.date()) or parse_day(time_text, now.date())
+    clock = parse_clock(time_text)
+    if clock is None:
+        in_date = CLOCK_IN_DATE.search(date_text.lower())
+        clock = parse_clock(in_date.group(1)) if in_date else None
+    if day is None or clock is None:
+        return None
+    hour, minute = clock
+    if not CALLING_HOURS[0] <= hour < CALLING_HOURS[1]:
+        return None
+    when = datetime(day.year, day.month, day.day, hour, minute, tzinfo=now.tzinfo)
+    if when <= now or when - now > timedelta(days=MAX_CALLBACK_DAYS):
+        return None
+    return when
+
+
+def _valid_date(year: int, month: int, day: int) -> Optional[date]:
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def customer_now(customer_info: Dict[str, Any], default_timezone: Optional[str] = None) -> datetime:
+    """Current time where the customer is, by the zone the dialer put in the room metadata"""
+    default_timezone = default_timezone or os.getenv("DIALER_DEFAULT_TIMEZONE", "America/New_York")
+    try:
+        zone = ZoneInfo(customer_info.get("timezone") or default_timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        zone = ZoneInfo(default_timezone)
+    return datetime.now(zone)
+
+
+def next_calling_window(callback: Dict[str, Any], now: float, default_timezone: str) -> Optional[float]:
+    """When calling hours next open for the customer, or None if their time zone is unknown"""
+    try:
+        local = datetime.fromtimestamp(now, ZoneInfo(callback.get("timezone") or default_timezone))
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+    if within_calling_hours(callback, local, default_timezone):
+        return now
+    if local.hour >= CALLING_HOURS[1]:
+        local += timedelta(days=1)
+    return local.replace(hour=CALLING_HOURS[0], minute=0, second=0, microsecond=0).timestamp()
+
+
+def build_callback(customer_info: Dict[str, Any], when: datetime, reason: str) -> Dict[str, Any]:
+    """Journal record for a callback; it carries everything the dialer needs to place the call"""
+    return {
+        "callback_id": new_id("CB"),
+        "due_at": when.timestamp(),
+        "requested_for": when.isoformat(),
+        "reason": reason,
+        "scheduled_at": time.time(),
+        "phoneNumber": customer_info["phoneNumber"],
+        "customerName": customer_info["customerName"],
+        "amountOwed": customer_info["amountOwed"],
+        "paymentDueDate": customer_info["paymentDueDate"],
+        "accountNumber": customer_info.get("accountNumber"),
+        "hardshipPrescore": customer_info.get("hardshipPrescore"),
+        "timezone": str(when.tzinfo),
+    }
+
+
+class CallbackLog:
+    """Append side of the callback journal, opened by every agent worker process
+
+    Each record is written with a single O_APPEND write and fsynced, so appends from
+    concurrent processes never interleave within a line.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def open(self) -> None:
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+
+    async def add(self, callback: Dict[str, Any]) -> None:
+        """Append a callback and wait until it is on disk"""
+        line = encode_record({"ts": time.time(), "kind": "scheduled", "data": callback})
+        await asyncio.to_thread(self._write_and_sync, line)
+
+    def _write_and_sync(self, line: bytes) -> None:
+        written = os.write(self._fd, line)
+        if written != len(line):
+            raise OSError(f"Short write to {self.path}: {written} of {len(line)} bytes")
+        os.fsync(self._fd)
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def read_new_records(path: str, offset: int) -> Tuple[int, List[Dict[str, Any]]]:
+    """Records appended since `offset`, and the offset to continue from
+
+    A partial last line is left for the next read, since another process may still be
+    writing it. Complete lines that fail their checksum are skipped rather than ending the read.
+    """
+    if not os.path.exists(path):
+        return offset, []
+    records = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            record = decode_record(line)
+            if record is None:
+                logger.warning(f"Skipping a corrupt callback record in {path}")
+                continue
+            records.append(record)
+    return offset, records
+
+
+class CallbackScheduler:
+    """Pending callbacks in a heap keyed by due time, with an index of one callback per customer
+
+    Scheduling and taking the next due callback are O(log n). When a customer asks for a new
+    time, the newer request replaces the earlier one; the replaced heap entry is skipped
+    when it surfaces.
+    """
+
+    def __init__(self, journal_path: str, outcomes_path: str, max_attempts: int = 3, retry_delay: float = 300.0):
+        self.journal_path = journal_path
+        self.outcomes_path = outcomes_path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.by_phone: Dict[str, str] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._order = itertools.count()
+        self._offset = 0
+        self._finished: set = set()
+        self._rescheduled: Dict[str, Dict[str, Any]] = {}
+        self._outcomes: Optional[TransactionJournal] = None
+        self.stats = Counter()
+
+    def load(self) -> int:
+        """Replay the journals: every callback not yet finished is pending again; returns the records read"""
+        for record in read_journal(self.outcomes_path):
+            outcome = record["data"]
+            if outcome["status"] in RESCHEDULED:
+                self._rescheduled[outcome["callback_id"]] = {"due_at": outcome["due_at"], "attempts": outcome["attempts"]}
+            else:
+                self._finished.add(outcome["callback_id"])
+        count = self.poll()
+        # Outcomes only matter for records written before they were recorded
+        self._finished = set()
+        self._rescheduled = {}
+        logger.info(f"Loaded {len(self.pending)} pending callbacks from {self.journal_path}")
+        return count
+
+    def poll(self) -> int:
+        """Pick up callbacks the agents appended since the last poll; returns how many"""
+        self._offset, records = read_new_records(self.journal_path, self._offset)
+        for record in records:
+            if record["kind"] == "scheduled":
+                self.add(record["data"])
+        return len(records)
+
+    def add(self, callback: Dict[str, Any]) -> None:
+        callback_id = callback["callback_id"]
+        previous = self.by_phone.get(callback["phoneNumber"])
+        if previous is not None and self.pending.pop(previous, None) is not None:
+            self.stats["superseded"] += 1
+        if callback_id in self._finished:
+            # Still replaces what it superseded when first scheduled
+            self.by_phone.pop(callback["phoneNumber"], None)
+            return
+        callback.update(self._rescheduled.get(callback_id, {}))
+        self.pending[callback_id] = callback
+        self.by_phone[callback["phoneNumber"]] = callback_id
+        heapq.heappush(self._heap, (callback["due_at"], next(self._order), callback_id))
+        self.stats["scheduled"] += 1
+
+    def next_due(self) -> Optional[float]:
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> List[Dict[str, Any]]:
+        """Every pending callback due by `now`, as one batch"""
+        batch = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._is_current(entry):
+                batch.append(self.pending[entry[2]])
+        return batch
+
+    def _is_current(self, entry: Tuple[float, int, str]) -> bool:
+        callback = self.pending.get(entry[2])
+        return callback is not None and callback["due_at"] == entry[0]
+
+    async def run(self, room_service: RoomService, poll_interval: float = 1.0, **dialer_options) -> None:
+        """Dial callbacks as they come due until cancelled"""
+        self._outcomes = TransactionJournal(self.outcomes_path)
+        self._outcomes.open()
+        self.load()
+        try:
+            while True:
+                self.poll()
+                batch = self.pop_due(time.time())
+                if batch:
+                    await self._dispatch(batch, room_service, dialer_options)
+                    continue
+                next_due = self.next_due()
+                delay = poll_interval if next_due is None else min(poll_interval, next_due - time.time())
+                await asyncio.sleep(max(0.0, delay))
+        finally:
+            await self._outcomes.close()
+
+    async def _dispatch(self, batch: List[Dict[str, Any]], room_service: RoomService, dialer_options: Dict[str, Any]) -> None:
+        # Everything due in the same minute (the resolution callbacks are requested at) is one campaign,
+        # so a top-of-the-hour burst is paced by the dialer instead of arriving all at once
+        minute = datetime.fromtimestamp(batch[0]["due_at"]).strftime("%Y%m%d%H%M")
+        dialer = Dialer(room_service, campaign_id=f"CALLBACKS-{minute}", **dialer_options)
+        await dialer.run(batch)
+        self.stats["batches"] += 1
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+
+        skipped = {call["callback_id"] for call in dialer.skipped}
+        failed = {call["callback_id"] for call in dialer.failed}
+        outcomes = []
+        for callback in batch:
+            callback_id = callback["callback_id"]
+            due_at = None
+            if callback_id in failed:
+                callback["attempts"] = callback.get("attempts", 0) + 1
+                if callback["attempts"] < self.max_attempts:
+                    status, due_at = "retry", time.time() + self.retry_delay
+                else:
+                    status = "failed"
+            elif callback_id in skipped:
+                # Pacing or a backlog carried it past the end of calling hours: call when they open again
+                due_at = next_calling_window(callback, time.time(), dialer.default_timezone)
+                status = "rescheduled" if due_at is not None else "missed"
+                if due_at is None:
+                    logger.warning(f"Callback {callback_id} to {callback['phoneNumber']} has an unknown time zone")
+            else:
+                status = "dialed"
+            if status in RESCHEDULED:
+                callback["due_at"] = due_at
+                heapq.heappush(self._heap, (due_at, next(self._order), callback_id))
+                self.stats["retried" if status == "retry" else "rescheduled"] += 1
+                outcomes.append(self._outcomes.append("callback", {
+                    "callback_id": callback_id, "status": status, "due_at": due_at, "attempts": callback.get("attempts", 0),
+                }))
+                continue
+            self.stats[status] += 1
+            self.pending.pop(callback_id, None)
+            if self.by_phone.get(callback["phoneNumber"]) == callback_id:
+                del self.by_phone[callback["phoneNumber"]]
+            outcomes.append(self._outcomes.append("callback", {"callback_id": callback_id, "status": status}))
+        await asyncio.gather(*outcomes)
+
+
+def compact(journal_path: str, outcomes_path: str) -> Tuple[int, int]:
+    """Rewrite the callback journal with only the pending callbacks and clear the outcomes; returns the records before and after
+
+    Rewrites both files in place, so run it only while neither the runner nor any agent worker is running.
+    """
+    scheduler = CallbackScheduler(journal_path, outcomes_path)
+    total = scheduler.load()
+    tmp_path = f"{journal_path}.compact"
+    with open(tmp_path, "wb") as f:
+        for callback in sorted(scheduler.pending.values(), key=lambda c: c["due_at"]):
+            f.write(encode_record({"ts": callback["scheduled_at"], "kind": "scheduled", "data": callback}))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, journal_path)
+    for segment in segment_paths(outcomes_path):
+        os.remove(segment)
+    return total, len(scheduler.pending)
+
+
+_shared_callback_log: Optional[CallbackLog] = None
+
+
+def shared_callback_log() -> CallbackLog:
+    """Callback journal shared by every job in this worker process, opened on first use"""
+    global _shared_callback_log
+    if _shared_callback_log is None:
+        log = CallbackLog(os.getenv("CALLBACK_JOURNAL_PATH", "callbacks.journal"))
+        log.open()
+        _shared_callback_log = log
+    return _shared_callback_log
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Run, inspect or compact the callback schedule")
+    parser.add_argument("command", choices=["run", "pending", "compact"])
+    parser.add_argument("--journal", default=os.getenv("CALLBACK_JOURNAL_PATH", "callbacks.journal"))
+    parser.add_argument("--outcomes", default=os.getenv("CALLBACK_OUTCOMES_PATH", "callback_outcomes.journal"))
+    parser.add_argument("--max-active", type=int, default=int(os.getenv("DIALER_MAX_ACTIVE_CALLS", "50")))
+    parser.add_argument("--cps", type=float, default=float(os.getenv("DIALER_CALLS_PER_SECOND", "5")))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timezone", default=os.getenv("DIALER_DEFAULT_TIMEZONE", "America/New_York"))
+    args = parser.parse_args()
+
+    if args.command == "run":
+        async def main():
+            service = LiveKitRoomService()
+            scheduler = CallbackScheduler(args.journal, args.outcomes)
+            try:
+                await scheduler.run(
+                    service,
+                    max_active_calls=args.max_active,
+                    calls_per_second=args.cps,
+                    concurrency=args.concurrency,
+                    default_timezone=args.timezone,
+                )
+            finally:
+                await service.close()
+
+        asyncio.run(main())
+    elif args.command == "pending":
+        scheduler = CallbackScheduler(args.journal, args.outcomes)
+        scheduler.load()
+        per_minute = Counter(
+            datetime.fromtimestamp(c["due_at"]).strftime("%Y-%m-%d %H:%M") for c in scheduler.pending.values()
+        )
+        print(json.dumps({
+            "pending": len(scheduler.pending),
+            "superseded": scheduler.stats["superseded"],
+            "next_due": min(per_minute) if per_minute else None,
+            "busiest_minutes": per_minute.most_common(5),
+        }, indent=2))
+    else:
+        before, after = compact(args.journal, args.outcomes)
+        print(f"Compacted {args.journal}: {before} -> {after} callbacks")
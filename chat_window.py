@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+from livekit.agents import llm
+
+logger = logging.getLogger("chat-window")
+logger.setLevel(logging.INFO)
+
+# Rough per-message cost of role and separator tokens in the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Tool results and utterances are clipped to this many characters in the summary
+SUMMARY_CLIP_CHARS = 160
+
+SUMMARY_HEADER = "Summary of the earlier part of this call (older turns were condensed):"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate: English text averages about four characters per token"""
+    return (len(text) + 3) // 4
+
+
+def message_text(message: llm.ChatMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(part for part in content if isinstance(part, str))
+    return ""
+
+
+def message_tokens(message: llm.ChatMessage) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message_text(message))
+    for call in message.tool_calls or []:
+        tokens += MESSAGE_OVERHEAD_TOKENS + estimate_tokens(call.function_info.name + call.raw_arguments)
+    return tokens
+
+
+def context_tokens(messages: List[llm.ChatMessage]) -> int:
+    return sum(message_tokens(message) for message in messages)
+
+
+def clip(text: str, limit: int = SUMMARY_CLIP_CHARS) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def condense_result(content: str) -> str:
+    """Keep the scalar facts of a JSON tool result and drop the bulk"""
+    try:
+        value = json.loads(content)
+    except (TypeError, ValueError):
+        return clip(content)
+
+    if isinstance(value, dict):
+        facts = [f"{k}={v}" for k, v in value.items() if isinstance(v, (str, int, float, bool)) and v != ""]
+        return clip(", ".join(facts)) if facts else clip(content)
+    if isinstance(value, list):
+        items = []
+        for item in value:
+            if isinstance(item, dict):
+                scalars = [str(v) for v in item.values() if isinstance(v, (str, int, float)) and v != ""]
+                items.append(" ".join(scalars[:2]))
+            else:
+                items.append(str(item))
+        return clip(f"{len(value)} items: " + "; ".join(items))
+    return clip(content)
+
+
+def summarize_messages(messages: List[llm.ChatMessage]) -> List[str]:
+    """Extractive summary, one line per utterance, tool call and tool result"""
+    lines = []
+    for message in messages:
+        text = message_text(message)
+        if message.role == "user" and text:
+            lines.append(f"Caller said: {clip(text)}")
+        elif message.role == "assistant":
+            if text:
+                lines.append(f"Agent said: {clip(text)}")
+            for call in message.tool_calls or []:
+                lines.append(f"Agent called {call.function_info.name}({clip(call.raw_arguments, 80)})")
+        elif message.role == "tool":
+            lines.append(f"{message.name or 'tool'} returned: {condense_result(text)}")
+    return lines
+
+
+class ChatWindow:
+    """Keeps the prompt of a long call within a token budget
+
+    System messages and the most recent turns stay verbatim. When the history exceeds
+    `max_tokens`, the oldest turns (with their tool calls and results) are folded into a
+    running summary message until it is back under `target_tokens`. Compacting well below
+    the budget means it happens rarely, so the prompt prefix stays stable between compactions.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 3000,
+        target_tokens: Optional[int] = None,
+        keep_recent_turns: int = 4,
+        max_summary_tokens: Optional[int] = None,
+        summarize: Callable[[List[llm.ChatMessage]], List[str]] = summarize_messages,
+    ):
+        self.max_tokens = max_tokens
+        self.target_tokens = target_tokens or int(max_tokens * 0.6)
+        self.keep_recent_turns = keep_recent_turns
+        self.max_summary_tokens = max_summary_tokens or max_tokens // 6
+        self.summarize = summarize
+        self.summary_lines: List[str] = []
+        self.summary_message: Optional[llm.ChatMessage] = None
+        self.prompt_tokens: List[int] = []
+        self.compactions = 0
+        self.compacted_messages = 0
+
+    @classmethod
+    def from_env(cls) -> "ChatWindow":
+        return cls(
+            max_tokens=int(os.getenv("CHAT_CONTEXT_MAX_TOKENS", "3000")),
+            keep_recent_turns=int(os.getenv("CHAT_CONTEXT_RECENT_TURNS", "4")),
+        )
+
+    def before_llm_cb(self, assistant, chat_ctx: llm.ChatContext) -> None:
+        """`before_llm_cb` hook: bound the stored history, then this turn's prompt"""
+        history = assistant.chat_ctx
+        # The prompt is a copy of the history taken just before this hook, plus the new user message
+        pending = chat_ctx.messages[len(history.messages):]
+        if self.compact(history):
+            chat_ctx.messages[:] = [message.copy() for message in history.messages] + pending
+
+        tokens = context_tokens(chat_ctx.messages)
+        self.prompt_tokens.append(tokens)
+        logger.info(f"Prompt turn {len(self.prompt_tokens)}: ~{tokens} tokens in {len(chat_ctx.messages)} messages")
+
+    def compact(self, history: llm.ChatContext) -> bool:
+        """Fold the oldest turns into the summary when over budget; returns True if anything changed"""
+        messages = history.messages
+        if context_tokens(messages) <= self.max_tokens:
+            return False
+
+        head = [m for m in messages if m.role == "system" and m is not self.summary_message]
+        turns = self._split_turns([m for m in messages if m.role != "system"])
+
+        folded: List[llm.ChatMessage] = []
+        while len(turns) > self.keep_recent_turns:
+            folded.extend(turns.pop(0))
+            body = [m for turn in turns for m in turn]
+            if context_tokens(head + body) + estimate_tokens("\n".join(self.summary_lines)) <= self.target_tokens:
+                break
+        if not folded:
+            return False
+
+        self.summary_lines.extend(self.summarize(folded))
+        self._trim_summary()
+        self.summary_message = llm.ChatMessage.create(
+            role="system", text="\n".join([SUMMARY_HEADER] + [f"- {line}" for line in self.summary_lines])
+        )
+        messages[:] = head + [self.summary_message] + [m for turn in turns for m in turn]
+
+        self.compactions += 1
+        self.compacted_messages += len(folded)
+        logger.info(f"Compacted {len(folded)} messages into the call summary, history now ~{context_tokens(messages)} tokens")
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        ordered = sorted(self.prompt_tokens)
+        return {
+            "turns": len(ordered),
+            "prompt_tokens_p50": ordered[len(ordered) // 2] if ordered else 0,
+            "prompt_tokens_max": ordered[-1] if ordered else 0,
+            "prompt_tokens_last": self.prompt_tokens[-1] if ordered else 0,
+            "compactions": self.compactions,
+            "compacted_messages": self.compacted_messages,
+        }
+
+    def _split_turns(self, messages: List[llm.ChatMessage]) -> List[List[llm.ChatMessage]]:
+        # A turn starts at a caller message, so tool calls always stay with their results
+        turns: List[List[llm.ChatMessage]] = []
+        for message in messages:
+            if message.role == "user" or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def _trim_summary(self) -> None:
+        # Oldest summary lines go first; the latest facts matter most to the next reply
+        dropped = 0
+        while len(self.summary_lines) > 1 and estimate_tokens("\n".join(self.summary_lines)) > self.max_summary_tokens:
+            self.summary_lines.pop(0)
+            dropped += 1
+        if dropped and not self.summary_lines[0].startswith("("):
+            self.summary_lines.insert(0, "(earliest details omitted)")
@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import csv
+import heapq
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from hardship import prescore_metadata
+from ids import new_id
+
+logger = logging.getLogger("dialer")
+logger.setLevel(logging.INFO)
+
+# FDCPA: calls only between 8 AM and 9 PM in the customer's local time
+CALLING_HOURS = (8, 21)
+
+# Rooms that nobody joins are closed by the server after this long
+EMPTY_ROOM_TIMEOUT = 60
+
+
+class RoomService:
+    """Creates call rooms and reports how many are still running"""
+
+    async def create_room(self, name: str, metadata: str) -> None:
+        raise NotImplementedError
+
+    async def active_calls(self) -> int:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class LiveKitRoomService(RoomService):
+    """Rooms on a LiveKit server; the outbound agent is dispatched to each new `call-` room"""
+
+    def __init__(self, url: Optional[str] = None, api_key: Optional[str] = None, api_secret: Optional[str] = None):
+        from livekit import api
+
+        self._api_module = api
+        self._api = api.LiveKitAPI(url, api_key, api_secret)
+
+    async def create_room(self, name: str, metadata: str) -> None:
+        await self._api.room.create_room(
+            self._api_module.CreateRoomRequest(name=name, metadata=metadata, empty_timeout=EMPTY_ROOM_TIMEOUT)
+        )
+
+    async def active_calls(self) -> int:
+        response = await self._api.room.list_rooms(self._api_module.ListRoomsRequest())
+        return sum(1 for room in response.rooms if room.name.startswith("call-"))
+
+    async def close(self) -> None:
+        await self._api.aclose()
+
+
+class FakeRoomService(RoomService):
+    """Local stand-in for the LiveKit room service: each room stays active for `call_duration` seconds"""
+
+    def __init__(self, create_latency: float = 0.02, call_duration: float = 5.0):
+        self.create_latency = create_latency
+        self.call_duration = call_duration
+        self.created: List[Dict[str, Any]] = []
+        self.peak_active = 0
+        self._ends: List[float] = []
+
+    async def create_room(self, name: str, metadata: str) -> None:
+        await asyncio.sleep(self.create_latency)
+        self.created.append({"name": name, "metadata": metadata, "created_at": time.monotonic()})
+        heapq.heappush(self._ends, time.monotonic() + self.call_duration)
+        self.peak_active = max(self.peak_active, self._count())
+
+    async def active_calls(self) -> int:
+        return self._count()
+
+    def _count(self) -> int:
+        now = time.monotonic()
+        while self._ends and self._ends[0] <= now:
+            heapq.heappop(self._ends)
+        return len(self._ends)
+
+
+class TokenBucket:
+    """Paces calls to `rate` per second, allowing bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def within_calling_hours(call: Dict[str, Any], now: datetime, default_timezone: str) -> bool:
+    """Whether it is between 8 AM and 9 PM where the customer is; unknown time zones are never called"""
+    try:
+        local = now.astimezone(ZoneInfo(call.get("timezone") or default_timezone))
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return CALLING_HOURS[0] <= local.hour < CALLING_HOURS[1]
+
+
+def room_metadata(call: Dict[str, Any], call_id: str, campaign_id: str) -> Dict[str, Any]:
+    """The metadata agent_outbound reads, matching what the initiate-call API sets"""
+    metadata = {
+        "callId": call_id,
+        "campaignId": campaign_id,
+        "phoneNumber": call["phoneNumber"],
+        "customerName": call["customerName"],
+        "amountOwed": float(call["amountOwed"]),
+        "paymentDueDate": call["paymentDueDate"],
+        "callType": "outbound_collection",
+        "initiatedAt": datetime.now(timezone.utc).isoformat(),
+    }
+    if call.get("accountNumber"):
+        metadata["accountNumber"] = call["accountNumber"]
+    if call.get("hardshipPrescore"):
+        metadata["hardshipPrescore"] = call["hardshipPrescore"]
+    if call.get("timezone"):
+        metadata["timezone"] = call["timezone"]
+    if call.get("callback_id"):
+        metadata["callbackId"] = call["callback_id"]
+        metadata["callbackReason"] = call.get("reason")
+    return metadata
+
+
+class Dialer:
+    """Opens outbound call rooms from a call list at a controlled pace
+
+    Calls per second are paced by a token bucket and at most `concurrency` room requests are in
+    flight. Dialing pauses while the number of running calls is at `max_active_calls`, the
+    capacity of the agent workers. That count is refreshed from the room service every
+    `capacity_poll_interval` seconds and incremented locally for every room opened in between;
+    rooms still being created hold a slot until the server counts them.
+    Calls outside the customer's calling hours are skipped, and they are kept in `skipped`
+    together with `failed` for the caller to retry.
+    """
+
+    def __init__(
+        self,
+        room_service: RoomService,
+        max_active_calls: int = 50,
+        calls_per_second: float = 5.0,
+        concurrency: int = 8,
+        capacity_poll_interval: float = 2.0,
+        default_timezone: str = "America/New_York",
+        campaign_id: Optional[str] = None,
+    ):
+        self.room_service = room_service
+        self.max_active_calls = max_active_calls
+        # Bursts are capped at a tenth of a second's worth of calls
+        self.bucket = TokenBucket(calls_per_second, burst=max(1, int(calls_per_second / 10)))
+        self.concurrency = concurrency
+        self.capacity_poll_interval = capacity_poll_interval
+        self.default_timezone = default_timezone
+        self.campaign_id = campaign_id or new_id("CAMP")
+        self.active = 0
+        self.in_flight = 0
+        self.stats = {"dialed": 0, "skipped_outside_hours": 0, "failed": 0, "capacity_waits": 0}
+        self.skipped: List[Dict[str, Any]] = []
+        self.failed: List[Dict[str, Any]] = []
+        self._capacity = asyncio.Condition()
+
+    async def run(self, calls: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        start = time.monotonic()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        await self._refresh_capacity()
+        poller = asyncio.create_task(self._poll_capacity())
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        try:
+            # The bounded queue keeps only a few calls in memory, however long the list is
+            for call in calls:
+                await queue.put(call)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            poller.cancel()
+            for worker in workers:
+                worker.cancel()
+
+        elapsed = time.monotonic() - start
+        result = dict(self.stats, campaign_id=self.campaign_id, elapsed_s=round(elapsed, 2))
+        result["calls_per_second"] = round(self.stats["dialed"] / elapsed, 2) if elapsed else 0.0
+        logger.info(f"Campaign {self.campaign_id} finished: {json.dumps(result)}")
+        return result
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            call = await queue.get()
+            if call is None:
+                return
+            if not self._within_calling_hours(call):
+                self._skip(call)
+                continue
+            await self._wait_for_capacity()
+            await self.bucket.acquire()
+            # Waiting for a slot or for pacing can carry the call past the end of calling hours
+            if not self._within_calling_hours(call):
+                await self._release(created=False)
+                self._skip(call)
+                continue
+            await self._dial(call)
+
+    def _within_calling_hours(self, call: Dict[str, Any]) -> bool:
+        return within_calling_hours(call, datetime.now(timezone.utc), self.default_timezone)
+
+    def _skip(self, call: Dict[str, Any]) -> None:
+        self.stats["skipped_outside_hours"] += 1
+        self.skipped.append(call)
+
+    async def _dial(self, call: Dict[str, Any]) -> None:
+        call_id = new_id("CALL")
+        try:
+            # A row missing a field fails here, as a failed call, rather than taking the worker down
+            name = f"call-{int(time.time() * 1000)}-{call['phoneNumber']}"
+            await self.room_service.create_room(name, json.dumps(room_metadata(call, call_id, self.campaign_id)))
+        except Exception as e:
+            self.stats["failed"] += 1
+            self.failed.append(call)
+            logger.warning(f"Could not open a room for {call.get('phoneNumber')}: {e}")
+            created = False
+        else:
+            self.stats["dialed"] += 1
+            created = True
+        await self._release(created)
+
+    async def _release(self, created: bool) -> None:
+        """Give back the slot taken in _wait_for_capacity; an opened room holds on to it as an active call"""
+        async with self._capacity:
+            self.in_flight -= 1
+            if created:
+                self.active += 1
+            self._capacity.notify()
+
+    async def _wait_for_capacity(self) -> None:
+        # Rooms still being created are not in the server's count yet, so they hold a slot of their own
+        async with self._capacity:
+            if self.active + self.in_flight >= self.max_active_calls:
+                self.stats["capacity_waits"] += 1
+            await self._capacity.wait_for(lambda: self.active + self.in_flight < self.max_active_calls)
+            self.in_flight += 1
+
+    async def _refresh_capacity(self) -> None:
+        try:
+            active = await self.room_service.active_calls()
+        except Exception as e:
+            logger.warning(f"Could not read active calls, keeping the local count: {e}")
+            return
+        async with self._capacity:
+            self.active = active
+            self._capacity.notify_all()
+
+    async def _poll_capacity(self) -> None:
+        while True:
+            await asyncio.sleep(self.capacity_poll_interval)
+            await self._refresh_capacity()
+
+
+def read_call_list(path: str, prescores_path: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Rows of a call list CSV, joined with `python hardship.py` pre-scores by account number"""
+    prescores: Dict[str, Dict[str, Any]] = {}
+    if prescores_path:
+        with open(prescores_path, newline="") as f:
+            prescores = {row["account_number"]: prescore_metadata(row) for row in csv.DictReader(f)}
+
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            prescore = prescores.get(row.get("accountNumber") or "")
+            if prescore is not None:
+                row["hardshipPrescore"] = prescore
+            yield row
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Dial an outbound collections campaign")
+    parser.add_argument(
+        "calls", help="CSV with phoneNumber, customerName, amountOwed, paymentDueDate and optional timezone, accountNumber"
+    )
+    parser.add_argument("--prescores", help="Pre-score CSV from hardship.py, joined on accountNumber")
+    parser.add_argument("--max-active", type=int, default=int(os.getenv("DIALER_MAX_ACTIVE_CALLS", "50")))
+    parser.add_argument("--cps", type=float, default=float(os.getenv("DIALER_CALLS_PER_SECOND", "5")))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timezone", default=os.getenv("DIALER_DEFAULT_TIMEZONE", "America/New_York"))
+    args = parser.parse_args()
+
+    async def main():
+        service = LiveKitRoomService()
+        dialer = Dialer(service, args.max_active, args.cps, args.concurrency, default_timezone=args.timezone)
+        try:
+            await dialer.run(read_call_list(args.calls, args.prescores))
+        finally:
+            await service.close()
+
+    asyncio.run(main())
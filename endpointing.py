@@ -0,0 +1,282 @@
+"""End-of-turn delay adapted to each caller and to what they are in the middle of saying
+
+The pipeline waits a fixed delay after the VAD reports end of speech before it replies. That
+cuts off callers who pause while reading out a card number or a date, and makes fast talkers
+wait. `EndpointPolicy` learns the caller's own pauses during the call, and holds the turn open
+while the transcript ends in a partial digit string the agent just asked for ("four two four
+two" after "what's the card number?") or on a hesitation ("and my date of birth is").
+"""
+import logging
+import os
+import re
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from livekit.agents import vad
+from account_prefetch import MONTHS, spoken_digits
+
+logger = logging.getLogger("endpointing")
+logger.setLevel(logging.INFO)
+
+# What an agent prompt asks for: digit counts, or "date" for a date of birth
+EXPECTED_INPUTS = [
+    (re.compile(r"\blast (?:four|4)\b|\bssn\b|social security"), 4),
+    (re.compile(r"\bdate of birth\b|\bbirth ?day\b|\bborn\b"), "date"),
+    (re.compile(r"\bcard number\b|\bcard\b.*\bnumber\b"), 15),
+    (re.compile(r"\bexpir"), 4),
+    (re.compile(r"\bcvv\b|\bsecurity code\b"), 3),
+    (re.compile(r"\brouting number\b"), 9),
+    (re.compile(r"\bzip(?: code)?\b"), 5),
+    (re.compile(r"\bphone number\b|\bcallback number\b"), 10),
+]
+
+# Words a sentence does not end on
+HESITATIONS = {
+    "um", "uh", "er", "hmm", "and", "or", "but", "so", "the", "a", "my", "is", "are", "was", "it's", "its",
+    "of", "to", "for", "with", "on", "at", "like", "because", "then", "that", "if", "your",
+}
+
+# Answers that are complete as soon as they are said
+SHORT_ANSWERS = re.compile(
+    r"^(?:yes|yeah|yep|no|nope|correct|right|that's right|that's correct|okay|ok|sure|speaking|"
+    r"this is (?:he|she|me)|bye|goodbye|thank you|thanks)[.!?]?$"
+)
+
+DIGIT_TOKEN = re.compile(r"^\d+$")
+ORDINAL_TOKEN = re.compile(r"^\d+(?:st|nd|rd|th)$")
+
+
+def expected_inputs(prompt: str) -> List[Any]:
+    """What the agent's prompt asks the caller to read out"""
+    text = prompt.lower()
+    return [expected for pattern, expected in EXPECTED_INPUTS if pattern.search(text)]
+
+
+def trailing_digits(text: str) -> int:
+    """How many digits the transcript ends on, spoken or written ("4242 4242 42" -> 10)"""
+    count = 0
+    for token in reversed(spoken_digits(text.replace("/", " ")).split()):
+        if not DIGIT_TOKEN.match(token):
+            break
+        count += len(token)
+    return count
+
+
+def partial_date(text: str) -> bool:
+    """The transcript ends partway through a date: a month or day with no year after it yet"""
+    tokens = spoken_digits(text.replace("/", " ")).split()
+    if not tokens:
+        return False
+    last = tokens[-1]
+    if last in MONTHS or ORDINAL_TOKEN.match(last):
+        return True
+    if DIGIT_TOKEN.match(last) and len(last) <= 2:
+        # "January 15" or "1 15", still waiting on the year
+        return True
+    return False
+
+
+def answered(text: str, item: Any) -> bool:
+    """The transcript already holds an answer to one expected input"""
+    tokens = spoken_digits(text.replace("/", " ")).split()
+    if item == "date":
+        return "/" in text or any(token in MONTHS or ORDINAL_TOKEN.match(token) for token in tokens)
+    return sum(len(token) for token in tokens if DIGIT_TOKEN.match(token)) >= item
+
+
+def incomplete(transcript: str, expected: List[Any]) -> Optional[str]:
+    """Why the transcript looks like the caller is partway through an answer, if it does"""
+    text = transcript.strip().rstrip(".?!,").lower()
+    if not text:
+        return None
+    digits = trailing_digits(text)
+    for item in expected:
+        if item == "date":
+            if partial_date(text):
+                return "partial date"
+        elif 0 < digits < item:
+            return f"{digits} of {item} digits"
+    missing = [item for item in expected if not answered(text, item)]
+    if 0 < len(missing) < len(expected):
+        # "the last four are 1234", the date of birth asked for alongside them is still to come
+        return f"{len(expected) - len(missing)} of {len(expected)} answers"
+    words = text.split()
+    if words and words[-1] in HESITATIONS:
+        return "hesitation"
+    return None
+
+
+class PauseModel:
+    """Online estimate of how long one caller pauses in the middle of a turn
+
+    A high quantile of the caller's recent pauses, pulled toward `prior` until `prior_weight`
+    pauses have been seen.
+    """
+
+    def __init__(self, prior: float = 0.35, prior_weight: int = 4, window: int = 32, quantile: float = 0.9):
+        self.prior = prior
+        self.prior_weight = prior_weight
+        self.quantile = quantile
+        self.pauses: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.pauses.append(seconds)
+
+    def estimate(self) -> float:
+        samples = sorted(list(self.pauses) + [self.prior] * max(0, self.prior_weight - len(self.pauses)))
+        return samples[min(len(samples) - 1, int(len(samples) * self.quantile))]
+
+
+class EndpointPolicy:
+    """How long to wait after end of speech before taking the turn
+
+    The caller's pause quantile plus `margin`, clamped to [min_delay, max_delay]. A transcript
+    ending in a partial answer to the agent's last prompt waits at least `digit_hold`, one
+    ending on a hesitation at least `hesitation_hold`, and one that completes everything the
+prompt asked for only `min_delay` plus the margin. A false cut-off, the caller speaking
+    again within `cutoff_window` of the turn being taken, widens the margin for this caller.
+    """
+
+    def __init__(
+        self,
+        min_delay: float = 0.2,
+        max_delay: float = 2.5,
+        margin: float = 0.15,
+        digit_hold: float = 1.6,
+        hesitation_hold: float = 1.4,
+        cutoff_window: float = 1.0,
+        punctuation_factor: float = 0.75,
+        use_cues: bool = True,
+        pauses: Optional[PauseModel] = None,
+    ):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.margin = margin
+        self.digit_hold = digit_hold
+        self.hesitation_hold = hesitation_hold
+        self.cutoff_window = cutoff_window
+        self.punctuation_factor = punctuation_factor
+        self.use_cues = use_cues
+        self.pauses = pauses or PauseModel()
+        self.expected: List[Any] = []
+        self._taken_at: Optional[float] = None
+        self._end_of_speech_at: Optional[float] = None
+        self.counters = {"turns": 0, "pauses": 0, "cutoffs": 0, "held": 0}
+        self._delays: Deque[float] = deque(maxlen=200)
+
+    @classmethod
+    def from_env(cls) -> "EndpointPolicy":
+        """Configured by ENDPOINTING_MIN_DELAY, ENDPOINTING_MAX_DELAY and ENDPOINTING_DIGIT_HOLD"""
+        return cls(
+            min_delay=float(os.getenv("ENDPOINTING_MIN_DELAY", "0.2")),
+            max_delay=float(os.getenv("ENDPOINTING_MAX_DELAY", "2.5")),
+            digit_hold=float(os.getenv("ENDPOINTING_DIGIT_HOLD", "1.6")),
+        )
+
+    def on_agent_prompt(self, text: str) -> None:
+        """The agent finished saying something; the caller's next turn answers it"""
+        self.expected = expected_inputs(text)
+
+    def on_start_of_speech(self, now: float) -> None:
+        if self._taken_at is not None and now - self._taken_at <= self.cutoff_window and self._end_of_speech_at is not None:
+            # The caller was only pausing: learn the pause, and leave more room from now on
+            self.counters["cutoffs"] += 1
+            self.pauses.observe(now - self._end_of_speech_at)
+            self.margin = min(self.margin + 0.1, 0.6)
+        elif self._taken_at is None and self._end_of_speech_at is not None:
+            self.counters["pauses"] += 1
+            self.pauses.observe(now - self._end_of_speech_at)
+        self._taken_at = None
+        self._end_of_speech_at = None
+
+    def on_end_of_speech(self, now: float) -> None:
+        self._end_of_speech_at = now
+
+    def on_turn_taken(self, now: float) -> None:
+        self.counters["turns"] += 1
+        self._taken_at = now
+
+    def delay(self, transcript: str) -> Tuple[float, str]:
+        """Seconds to wait after end of speech, and why"""
+        text = transcript.strip()
+        base = min(self.max_delay, max(self.min_delay, self.pauses.estimate() + self.margin))
+        reason = incomplete(text, self.expected) if self.use_cues else None
+        if reason is not None:
+            self.counters["held"] += 1
+            hold = self.digit_hold if reason != "hesitation" else self.hesitation_hold
+            delay = min(self.max_delay, max(base, hold))
+        elif self.use_cues and SHORT_ANSWERS.match(text.lower()):
+            delay, reason = self.min_delay, "short answer"
+        elif self.use_cues and self.expected and all(answered(text.lower(), item) for item in self.expected):
+            delay, reason = min(base, self.min_delay + self.margin), "complete answer"
+        elif text.endswith((".", "!", "?")):
+            delay, reason = max(self.min_delay, base * self.punctuation_factor), "punctuation"
+        else:
+            delay, reason = base, "caller pauses"
+        self._delays.append(delay)
+        return delay, reason
+
+    def stats(self) -> Dict[str, Any]:
+        delays = sorted(self._delays)
+        return {
+            **self.counters,
+            "pause_estimate": round(self.pauses.estimate(), 3),
+            "margin": round(self.margin, 3),
+            "delay_p50": round(delays[len(delays) // 2], 3) if delays else None,
+        }
+
+
+def attach(assistant: Any, policy: EndpointPolicy) -> bool:
+    """Have a VoicePipelineAgent take turns by `policy`; call before `assistant.start()`
+
+    The pipeline has no public hook for its end-of-turn delay, so this replaces its internal
+    reply validator. Returns False, keeping the default, if this livekit-agents version differs.
+    """
+    try:
+        from livekit.agents.pipeline.pipeline_agent import _DeferredReplyValidation
+    except ImportError:
+        logger.warning("Adaptive endpointing is not supported by this livekit-agents version")
+        return False
+
+    class AdaptiveReplyValidation(_DeferredReplyValidation):
+        # The default keeps only the latest final; cues need the whole turn ("4242" then "4242")
+        _turn_transcript = ""
+
+        def on_human_final_transcript(self, transcript: str) -> None:
+            self._last_final_transcript = transcript.strip()
+            self._turn_transcript = f"{self._turn_transcript} {self._last_final_transcript}".strip()
+            if self._speaking:
+                return
+            delay, _ = policy.delay(self._turn_transcript)
+            if time.time() - self._last_recv_end_of_speech_time >= self.LATE_TRANSCRIPT_TOLERANCE:
+                # A final transcript without a recent end of speech, as the default validator allows for
+                delay += 1.0
+            self._run(delay)
+
+        def on_human_start_of_speech(self, ev: vad.VADEvent) -> None:
+            policy.on_start_of_speech(time.time())
+            super().on_human_start_of_speech(ev)
+
+        def on_human_end_of_speech(self, ev: vad.VADEvent) -> None:
+            self._speaking = False
+            self._last_recv_end_of_speech_time = time.time()
+            policy.on_end_of_speech(self._last_recv_end_of_speech_time)
+            if self._last_final_transcript:
+                self._run(policy.delay(self._turn_transcript)[0])
+
+        def _reset_states(self) -> None:
+            super()._reset_states()
+            self._turn_transcript = ""
+
+    validator = getattr(assistant, "_deferred_validation", None)
+    if not isinstance(validator, _DeferredReplyValidation):
+        logger.warning("Adaptive endpointing is not supported by this livekit-agents version")
+        return False
+
+    def validate() -> None:
+        policy.on_turn_taken(time.time())
+        validator._validate_fnc()
+
+    assistant._deferred_validation = AdaptiveReplyValidation(validate, policy.min_delay, loop=getattr(assistant, "_loop", None))
+    assistant.on("agent_speech_committed", lambda msg: policy.on_agent_prompt(msg.content if isinstance(msg.content, str) else ""))
+    return True
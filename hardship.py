@@ -0,0 +1,141 @@
+import argparse
+import csv
+import json
+import logging
+import resource
+import time
+from typing import Any, Dict, Iterable, Iterator, List
+import numpy as np
+
+logger = logging.getLogger("hardship")
+logger.setLevel(logging.INFO)
+
+# Eligibility rules shared by the live tool and the batch pre-scoring
+DEBT_TO_INCOME_THRESHOLD = 0.8
+HARDSHIP_KEYWORDS = ("medical", "unemployment")
+HARDSHIP_PROGRAM = "hardship_payment_plan"
+STANDARD_PROGRAM = "standard_payment_plan"
+HARDSHIP_DISCOUNT = 0.25
+STANDARD_DISCOUNT = 0.10
+
+INPUT_COLUMNS = ("account_number", "monthly_income", "monthly_expenses", "hardship_reason")
+OUTPUT_COLUMNS = ("account_number", "eligible", "debt_to_income_ratio", "recommended_program", "discount_available")
+
+
+def score(incomes: np.ndarray, expenses: np.ndarray, reasons: np.ndarray) -> Dict[str, np.ndarray]:
+    """Eligibility, ratio, program and discount for a batch of accounts"""
+    incomes = np.asarray(incomes, dtype=np.float64)
+    expenses = np.asarray(expenses, dtype=np.float64)
+    has_income = incomes > 0
+    debt_to_income = np.where(has_income, expenses / np.where(has_income, incomes, 1.0), 1.0)
+
+    lowered = np.char.lower(np.asarray(reasons, dtype=str))
+    eligible = debt_to_income > DEBT_TO_INCOME_THRESHOLD
+    for keyword in HARDSHIP_KEYWORDS:
+        eligible |= np.char.find(lowered, keyword) >= 0
+
+    return {
+        "eligible": eligible,
+        "debt_to_income_ratio": debt_to_income,
+        "recommended_program": np.where(eligible, HARDSHIP_PROGRAM, STANDARD_PROGRAM),
+        "discount_available": np.where(eligible, HARDSHIP_DISCOUNT, STANDARD_DISCOUNT),
+    }
+
+
+def assess(income: float, expenses: float, hardship_reason: str) -> Dict[str, Any]:
+    """Eligibility for one caller, by the same rules as the batch path"""
+    result = score(np.array([income]), np.array([expenses]), np.array([hardship_reason or ""]))
+    return {
+        "eligible": bool(result["eligible"][0]),
+        "debt_to_income_ratio": float(result["debt_to_income_ratio"][0]),
+        "recommended_program": str(result["recommended_program"][0]),
+        "discount_available": float(result["discount_available"][0]),
+    }
+
+
+def read_chunks(path: str, chunk_rows: int) -> Iterator[List[Dict[str, str]]]:
+    """Rows of a CSV account file in chunks, so memory stays bounded whatever the file size"""
+    with open(path, newline="") as f:
+        chunk: List[Dict[str, str]] = []
+        for row in csv.DictReader(f):
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def score_chunk(rows: List[Dict[str, str]]) -> Iterable[List[Any]]:
+    incomes = np.array([float(row.get("monthly_income") or 0) for row in rows])
+    expenses = np.array([float(row.get("monthly_expenses") or 0) for row in rows])
+    reasons = np.array([row.get("hardship_reason") or "" for row in rows])
+    result = score(incomes, expenses, reasons)
+    return zip(
+        (row["account_number"] for row in rows),
+        result["eligible"].astype(int),
+        np.round(result["debt_to_income_ratio"], 4),
+        result["recommended_program"],
+        result["discount_available"],
+    )
+
+
+def score_file(path: str, out: str, chunk_rows: int = 100_000) -> int:
+    """Stream an account file through the scorer into a pre-score CSV; returns the row count"""
+    count = 0
+    with open(out, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(OUTPUT_COLUMNS)
+        for rows in read_chunks(path, chunk_rows):
+            writer.writerows(score_chunk(rows))
+            count += len(rows)
+    return count
+
+
+def prescore_metadata(row: Dict[str, str]) -> Dict[str, Any]:
+    """The `hardshipPrescore` room metadata value for one row of a pre-score file"""
+    return {
+        "eligible": row["eligible"] in ("1", "true", "True"),
+        "debtToIncomeRatio": float(row["debt_to_income_ratio"]),
+        "recommendedProgram": row["recommended_program"],
+        "discountAvailable": float(row["discount_available"]),
+    }
+
+
+def describe_prescore(prescore: Any) -> str:
+    """One line for the agent's call details"""
+    # Room metadata comes from outside the agent; anything but the expected object is ignored
+    if not prescore or not isinstance(prescore, dict):
+        return "not pre-screened"
+    if prescore.get("eligible"):
+        try:
+            discount = float(prescore.get("discountAvailable", HARDSHIP_DISCOUNT))
+        except (TypeError, ValueError):
+            discount = HARDSHIP_DISCOUNT
+        return (
+            f"pre-qualified for the hardship payment plan ({discount:.0%} discount); "
+            f"offer it as soon as they mention difficulty paying"
+        )
+    return "not eligible for the hardship program; offer the standard options"
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Pre-score hardship eligibility for an account file")
+    parser.add_argument("accounts", help=f"CSV with columns {', '.join(INPUT_COLUMNS)}")
+    parser.add_argument("--out", default="hardship_prescores.csv")
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--example", action="store_true", help="Print the room metadata for the first scored row")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = score_file(args.accounts, args.out, args.chunk_rows)
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    logger.info(f"Scored {count} accounts into {args.out} in {elapsed:.1f}s ({count / elapsed:,.0f}/s, peak RSS {peak_mb:.0f}MB)")
+
+    if args.example:
+        with open(args.out, newline="") as f:
+            first = next(csv.DictReader(f), None)
+        if first:
+            print(json.dumps({"accountNumber": first["account_number"], "hardshipPrescore": prescore_metadata(first)}))
@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Snowflake-style layout: 42 bits of milliseconds since EPOCH_MS, 10 bits of node (host) id,
+# 22 bits of process id and 6 bits of sequence, 80 bits in all. Every job runs in a process of
+# its own, so the process id keeps the concurrent calls on one host apart.
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+PROCESS_BITS = 22  # Linux pid_max is at most 2**22
+SEQUENCE_BITS = 6
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_PROCESS = (1 << PROCESS_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+ID_CHARS = 16
+
+# Crockford base32 avoids I, L, O and U so IDs are easy to read out over the phone
+CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def default_node_id() -> int:
+    """Node id of this host: WORKER_NODE_ID, otherwise derived from the hostname"""
+    configured = os.getenv("WORKER_NODE_ID")
+    if configured is not None:
+        return int(configured) & MAX_NODE
+    return zlib.crc32(socket.gethostname().encode()) & MAX_NODE
+
+
+def encode_base32(value: int, length: int = ID_CHARS) -> str:
+    chars = []
+    for _ in range(length):
+        chars.append(CROCKFORD[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+class IdGenerator:
+    """Monotonic 80-bit IDs that need no coordination between processes or hosts
+
+    IDs are unique across a fleet as long as every host has its own WORKER_NODE_ID: the
+    (node, pid) pair is then unique among live processes, and each process never repeats a
+    (millisecond, sequence) pair. A recycled pid could only repeat an ID if the clock stepped
+    back past the previous owner's last one. Without WORKER_NODE_ID the node id is a 10-bit
+    hash of the hostname, and two hosts that hash alike can collide if the same pid issues an
+    ID in the same millisecond.
+    """
+
+    def __init__(self, node_id: Optional[int] = None, process_id: Optional[int] = None):
+        self.node_id = default_node_id() if node_id is None else node_id & MAX_NODE
+        self._process_id = process_id
+        self._last_ms = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    @property
+    def process_id(self) -> int:
+        # Read on every ID, so a generator created before a fork stays correct in the child
+        return (os.getpid() if self._process_id is None else self._process_id) & MAX_PROCESS
+
+    def next_int(self) -> int:
+        process_id = self.process_id
+        with self._lock:
+            now_ms = int(time.time() * 1000) - EPOCH_MS
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                # Same millisecond, or the clock stepped back: keep counting from the last timestamp
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    self._last_ms += 1
+                    self._sequence = 0
+            return (
+                (self._last_ms << (NODE_BITS + PROCESS_BITS + SEQUENCE_BITS))
+                | (self.node_id << (PROCESS_BITS + SEQUENCE_BITS))
+                | (process_id << SEQUENCE_BITS)
+                | self._sequence
+            )
+
+    def new_id(self, prefix: str) -> str:
+        """A sortable ID such as TXN-0J9ZQ4T7M1B8K2XW"""
+        return f"{prefix}-{encode_base32(self.next_int())}"
+
+
+_generator = IdGenerator()
+
+
+def new_id(prefix: str) -> str:
+    """Generate an ID from this process's generator"""
+    return _generator.new_id(prefix)
+
+
+def idempotency_key(tool: str, **arguments: Any) -> str:
+    """Digest of a tool call's name and arguments; raw arguments such as card details are not retained"""
+    canonical = json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{tool}\x00{canonical}".encode("utf-8")).hexdigest()
+
+
+class IdempotencyIndex:
+    """Remembers tool results by idempotency key so a repeated call returns the original result
+
+    Entries expire after ttl seconds and the oldest are evicted beyond max_entries. A call that
+    repeats while the original is still running waits for it instead of running twice.
+    """
+
+    def __init__(self, ttl: float = 900.0, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._results: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key: str) -> Optional[str]:
+        self._expire()
+        entry = self._results.get(key)
+        return entry[1] if entry else None
+
+    def put(self, key: str, result: str) -> None:
+        self._results[key] = (time.monotonic() + self.ttl, result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._results:
+            key, (expires_at, _) = next(iter(self._results.items()))
+            if expires_at > now:
+                break
+            self._results.popitem(last=False)
+
+    async def run(self, key: str, call: Callable[[], Awaitable[str]]) -> str:
+        """Return the stored result for key, or run call once and store what it returns"""
+        cached = self.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+        if key in self._in_flight:
+            self.stats["hits"] += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved when no duplicate is waiting
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+        self.put(key, result)
+        future.set_result(result)
+        return result
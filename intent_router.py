@@ -0,0 +1,340 @@
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from livekit.agents import llm
+from callbacks import customer_now
+from latency import TracedLLMStream
+
+logger = logging.getLogger("intent-router")
+logger.setLevel(logging.INFO)
+
+# Anything hedged, negated or asked back goes to the LLM
+UNCERTAIN = re.compile(
+    r"\?|\b(not|no|nope|can't|cannot|couldn't|don't|won't|wouldn't|never|unable|but|if|maybe|"
+    r"who|what|why|how|wrong|dispute|already)\b"
+)
+
+IDENTITY = re.compile(
+    r"^(yes|yeah|yep|yup|speaking|that's me|that is me|it's me|it is me|this is (he|she|him|her|me|they)|"
+    r"you got (him|her|me)|you've got (him|her|me))\b"
+)
+PAY_IN_FULL = re.compile(
+    r"\b(pay|paying|settle|clear)( it| the| that)? (in full|off|(the )?(whole|full|entire) (amount|balance|thing)|(it )?all)\b"
+)
+CALLBACK = re.compile(r"\b(call|ring|phone) (me )?back\b|\bcall me (later|tomorrow|on)\b|\btry (me )?again\b")
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+DAY = re.compile(r"\b(today|tonight|tomorrow|" + "|".join(WEEKDAYS) + r")\b")
+TIME = re.compile(
+    r"\b(?:at|around|after) (\d{1,2}|" + "|".join(NUMBER_WORDS) + r")(?::(\d{2}))?\s*(am|pm|a\.m\.|p\.m\.|o'clock)?"
+    r"|\b(noon|midday)\b"
+)
+
+# FDCPA calling hours
+CALL_HOURS = (8, 21)
+
+# An intent handled on the LLM path costs a tool-call round trip plus the reply round trip
+ROUND_TRIPS_AVOIDED = 2
+
+# Examples for the fallback classifier; "other" is everything that needs the LLM
+TRAINING_EXAMPLES = {
+    "confirm_identity": [
+        "yes this is me", "yeah speaking", "this is she", "this is he", "that's me", "yep that's me",
+        "yes it is", "you got him", "you've got her", "yes speaking", "uh huh that's me", "sure this is me",
+    ],
+    "pay_in_full": [
+        "i'll pay in full", "i will pay the full amount", "i can pay it all", "let's just pay the whole thing",
+        "i want to pay off the balance", "i'll pay the entire balance", "put me down for the full amount",
+        "i'll settle it in full", "i'll take care of the whole balance",
+    ],
+    "schedule_callback": [
+        "call me back tomorrow at 3", "can you call me back later", "try me again on friday at 10",
+        "call me tomorrow at noon", "ring me back monday at 2", "please call back tomorrow afternoon at 4",
+        "give me a call back on thursday at 11",
+    ],
+    "other": [
+        "who is this", "how much do i owe", "i can't pay right now", "i lost my job", "what is this about",
+        "i already paid that", "this is not my debt", "can i split it into payments", "how about half now",
+        "i need to think about it", "stop calling me", "what are my options", "i don't recognize this",
+        "can i get a discount", "i get paid on the fifteenth", "i'm driving right now",
+    ],
+}
+
+
+def words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def normalize_speech(text: str) -> str:
+    return " ".join(text.split())
+
+
+class IntentClassifier:
+    """Multinomial naive Bayes over word unigrams and bigrams, trained in-process from a few examples"""
+
+    def __init__(self, examples: Dict[str, List[str]], alpha: float = 0.5):
+        self.alpha = alpha
+        self.counts: Dict[str, Counter] = {}
+        self.totals: Dict[str, int] = {}
+        self.priors: Dict[str, float] = {}
+        vocabulary = set()
+        total_examples = sum(len(texts) for texts in examples.values())
+        for label, texts in examples.items():
+            counter = Counter()
+            for text in texts:
+                counter.update(self._features(text))
+            self.counts[label] = counter
+            self.totals[label] = sum(counter.values())
+            self.priors[label] = math.log(len(texts) / total_examples)
+            vocabulary.update(counter)
+        self.vocabulary_size = len(vocabulary)
+
+    def _features(self, text: str) -> List[str]:
+        tokens = words(text)
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Most likely label and its posterior probability"""
+        features = self._features(text)
+        scores = {}
+        for label, counter in self.counts.items():
+            denominator = self.totals[label] + self.alpha * self.vocabulary_size
+            scores[label] = self.priors[label] + sum(
+                math.log((counter[f] + self.alpha) / denominator) for f in features
+            )
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / norm
+
+
+# Trained once per worker process
+CLASSIFIER = IntentClassifier(TRAINING_EXAMPLES)
+
+
+def parse_callback_time(text: str, now: datetime) -> Optional[Tuple[datetime, str]]:
+    """Day and time of a requested callback, or None unless both are stated and within calling hours"""
+    day = DAY.search(text)
+    at = TIME.search(text)
+    if not day or not at:
+        return None
+
+    word = day.group(1)
+    if word in ("today", "tonight"):
+        date = now.date()
+    elif word == "tomorrow":
+        date = now.date() + timedelta(days=1)
+    else:
+        date = now.date() + timedelta(days=(WEEKDAYS.index(word) - now.weekday() - 1) % 7 + 1)
+
+    if at.group(4):
+        hour, minute = 12, 0
+    else:
+        hour = NUMBER_WORDS.get(at.group(1)) or int(at.group(1))
+        minute = int(at.group(2) or 0)
+        meridiem = (at.group(3) or "").replace(".", "")
+        if meridiem == "pm" and hour < 12:
+            hour += 12
+        elif meridiem == "am" and hour == 12:
+            hour = 0
+        elif meridiem not in ("am", "pm") and hour < 8:
+            # "at 3" on a collections call means the afternoon
+            hour += 12
+    if minute > 59 or not CALL_HOURS[0] <= hour < CALL_HOURS[1]:
+        return None
+
+    when = datetime(date.year, date.month, date.day, hour, minute)
+    if when <= now:
+        return None
+    return when, when.strftime("%I:%M %p").lstrip("0")
+
+
+def llm_user_text(chat_ctx: llm.ChatContext) -> str:
+    """Text of the caller turn that is about to be answered"""
+    message = chat_ctx.messages[-1] if chat_ctx.messages else None
+    if message is None or message.role != "user" or not isinstance(message.content, str):
+        return ""
+    return message.content
+
+
+class StaticLLMStream(llm.LLMStream):
+    """An LLM stream that yields a prepared reply, so the pipeline speaks and commits it like any other"""
+
+    def __init__(self, text: str, chat_ctx: llm.ChatContext):
+        super().__init__(chat_ctx=chat_ctx, fnc_ctx=None)
+        self._text: Optional[str] = text
+
+    async def __anext__(self) -> llm.ChatChunk:
+        if self._text is None:
+            raise StopAsyncIteration
+        text, self._text = self._text, None
+        return llm.ChatChunk(choices=[llm.Choice(delta=llm.ChoiceDelta(role="assistant", content=text))])
+
+
+class RoundTripEstimate:
+    """Worker-wide moving average of the LLM time to first chunk, used to report the time saved"""
+
+    def __init__(self, initial: float = 0.8, weight: float = 0.2):
+        self.seconds = initial
+        self.weight = weight
+
+    def observe(self, seconds: float) -> None:
+        self.seconds += self.weight * (seconds - self.seconds)
+
+
+LLM_ROUND_TRIP = RoundTripEstimate()
+
+
+class FastPathRouter:
+    """Answers predictable outbound turns locally instead of waiting on the LLM
+
+    Runs as `before_llm_cb`. Keyword rules decide first and the classifier only catches
+    paraphrases at high confidence. A matched intent calls the same tool method the LLM would
+    have called and speaks a templated reply. Hedged, negated or out-of-state turns, and
+    anything else, go to the LLM unchanged.
+    """
+
+    def __init__(
+        self,
+        fnc_ctx: Any,
+        customer_info: Dict[str, Any],
+        before_llm: Optional[Callable[[Any, llm.ChatContext], Any]] = None,
+        threshold: float = 0.9,
+        max_words: int = 16,
+        enabled: bool = True,
+    ):
+        self.fnc_ctx = fnc_ctx
+        self.customer_info = customer_info
+        self.before_llm = before_llm
+        self.threshold = threshold
+        self.max_words = max_words
+        self.enabled = enabled
+        self.turns = 0
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.saved_seconds = 0.0
+        self.router_seconds = 0.0
+
+    @classmethod
+    def from_env(cls, fnc_ctx: Any, customer_info: Dict[str, Any], before_llm=None) -> "FastPathRouter":
+        return cls(
+            fnc_ctx,
+            customer_info,
+            before_llm=before_llm,
+            threshold=float(os.getenv("FAST_PATH_THRESHOLD", "0.9")),
+            enabled=os.getenv("FAST_PATH_ROUTER", "1") != "0",
+        )
+
+    @property
+    def identity_confirmed(self) -> bool:
+        # Read from the call's outcome, so a confirmation made by the LLM's tool call counts too
+        return bool(self.fnc_ctx.call_outcome["identity_confirmed"])
+
+    def before_llm_cb(self, assistant, chat_ctx: llm.ChatContext):
+        if self.before_llm is not None:
+            self.before_llm(assistant, chat_ctx)
+        self.turns += 1
+
+        started = time.perf_counter()
+        text = normalize_speech(llm_user_text(chat_ctx)).lower()
+        intent = self.classify(text) if self.enabled else None
+        self.router_seconds += time.perf_counter() - started
+
+        if intent is None:
+            return self._llm_stream(assistant, chat_ctx, started)
+        return self._dispatch(intent, text, chat_ctx, started)
+
+    def classify(self, text: str) -> Optional[str]:
+        """Intent name when confident and valid in the current call state, otherwise None"""
+        if not text or len(text.split()) > self.max_words or UNCERTAIN.search(text):
+            return None
+
+        # Confirming only happens once; paying and scheduling need a confirmed identity
+        if not self.identity_confirmed:
+            # "Yes, I'll pay it all" is more than a confirmation, so leave it to the LLM
+            if PAY_IN_FULL.search(text) or CALLBACK.search(text):
+                return None
+            rules = {"confirm_identity": IDENTITY.search(text) or self._names_customer(text)}
+        else:
+            rules = {"pay_in_full": PAY_IN_FULL.search(text), "schedule_callback": CALLBACK.search(text)}
+        matched = [name for name, match in rules.items() if match]
+        if matched:
+            intent = matched[0]
+        else:
+            intent, confidence = CLASSIFIER.predict(text)
+            if intent not in rules or confidence < self.threshold:
+                return None
+
+        # A commitment for any date other than the due date needs the LLM to work out the date
+        if intent == "pay_in_full" and (DAY.search(text) or re.search(r"\d", text)):
+            return None
+        if intent == "schedule_callback" and parse_callback_time(text, self._local_now()) is None:
+            return None
+        return intent
+
+    def stats(self) -> Dict[str, Any]:
+        hits = sum(self.hits.values())
+        return {
+            "turns": self.turns,
+            "fast_path_hits": hits,
+            "hit_rate": round(hits / self.turns, 3) if self.turns else 0.0,
+            "by_intent": dict(self.hits),
+            "saved_ms": round(self.saved_seconds * 1000),
+            "router_ms": round(self.router_seconds * 1000, 2),
+        }
+
+    async def _dispatch(self, intent: str, text: str, chat_ctx: llm.ChatContext, started: float) -> llm.LLMStream:
+        if intent == "confirm_identity":
+            await self.fnc_ctx.confirm_speaking_with_customer(confirmed=True)
+            reply = (
+                f"Thank you. I'm calling about your payment of ${self.customer_info['amountOwed']:.2f} "
+                f"due on {self.customer_info['paymentDueDate']}. This is an attempt to collect a debt, and any "
+                f"information obtained will be used for that purpose. Will you be able to make that payment by the due date?"
+            )
+        elif intent == "pay_in_full":
+            confirmation = await self.fnc_ctx.process_payment_commitment(
+                payment_type="full",
+                amount=float(self.customer_info["amountOwed"]),
+                payment_date=self.customer_info["paymentDueDate"],
+            )
+            reply = f"{normalize_speech(confirmation)} Is there anything else I can help you with today?"
+        else:
+            when, spoken_time = parse_callback_time(text, self._local_now())
+            scheduled = await self.fnc_ctx.schedule_callback(
+                date=when.strftime("%A, %B %d").replace(" 0", " "), time=spoken_time, reason="your payment"
+            )
+            reply = f"{scheduled} Thank you for your time."
+
+        self.hits[intent] += 1
+        self.saved_seconds += max(0.0, ROUND_TRIPS_AVOIDED * LLM_ROUND_TRIP.seconds - (time.perf_counter() - started))
+        logger.info(f"Fast path {intent}: {text!r}")
+        return StaticLLMStream(reply, chat_ctx)
+
+    def _local_now(self) -> datetime:
+        # Callback times are meant in the customer's time zone
+        return customer_now(self.customer_info).replace(tzinfo=None)
+
+    def _llm_stream(self, assistant, chat_ctx: llm.ChatContext, started: float) -> llm.LLMStream:
+        first_chunk = []
+
+        def on_chunk(chunk: llm.ChatChunk) -> None:
+            if not first_chunk:
+                first_chunk.append(chunk)
+                LLM_ROUND_TRIP.observe(time.perf_counter() - started)
+
+        stream = assistant.llm.chat(chat_ctx=chat_ctx, fnc_ctx=assistant.fnc_ctx)
+        return TracedLLMStream(stream, on_chunk)
+
+    def _names_customer(self, text: str) -> bool:
+        # "this is John" or "John speaking"
+        first_name = words(str(self.customer_info.get("customerName", "")))[:1]
+        if not first_name:
+            return False
+        return bool(re.match(rf"^(yes |yeah )?(this is {first_name[0]}|{first_name[0]} (speaking|here))\b", text))
@@ -0,0 +1,257 @@
+"""Append-only, crash-safe journal for payments and payment plans
+
+Each record is one line: an 8 hex digit CRC32 of the JSON payload, a space, then the payload.
+Jobs run in processes of their own, so each process appends to a segment it holds an exclusive
+flock on: the journal path itself, or the first of PATH.1, PATH.2, ... that no live process
+holds. Only the owner ever writes to or truncates a segment, so the torn or corrupt tail a
+crash leaves is detected by the checksum and truncated when the segment is next claimed, and
+sequence numbers are unique within a segment. Replay and compaction read every segment;
+compaction merges them back into the journal path and refuses to run while any is held.
+
+    python journal.py replay transactions.journal
+    python journal.py compact transactions.journal
+"""
+import argparse
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("journal")
+logger.setLevel(logging.INFO)
+
+# The id field that identifies each kind of record, used when compacting
+RECORD_IDS = {
+    "transaction": "transaction_id",
+    "payment_plan": "plan_id",
+}
+
+
+def encode_record(record: Dict[str, Any]) -> bytes:
+    payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+    return b"%08x " % zlib.crc32(payload) + payload + b"\n"
+
+
+def decode_record(line: bytes) -> Optional[Dict[str, Any]]:
+    """Parse one journal line, or return None if it is torn or fails its checksum"""
+    if not line.endswith(b"\n") or len(line) < 10 or line[8:9] != b" ":
+        return None
+    payload = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def read_records(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Yield (end offset, record) for every valid record, stopping at the first bad one"""
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            record = decode_record(line)
+            if record is None:
+                return
+            offset += len(line)
+            yield offset, record
+
+
+def segment_paths(path: str) -> List[str]:
+    """The journal path and its numbered segments that exist on disk, in order"""
+    numbered = []
+    for candidate in glob.glob(glob.escape(path) + ".*"):
+        suffix = candidate[len(path) + 1:]
+        if suffix.isdigit():
+            numbered.append((int(suffix), candidate))
+    return ([path] if os.path.exists(path) else []) + [candidate for _, candidate in sorted(numbered)]
+
+
+def read_journal(path: str) -> List[Dict[str, Any]]:
+    """Every valid record of every segment, in the order they were appended"""
+    records = [record for segment in segment_paths(path) for _, record in read_records(segment)]
+    return sorted(records, key=lambda record: record["ts"])
+
+
+def claim_segment(path: str) -> Tuple[str, int]:
+    """Open the first segment of the journal at `path` that no live process holds, and hold it"""
+    index = 0
+    while True:
+        segment = path if index == 0 else f"{path}.{index}"
+        fd = os.open(segment, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            index += 1
+            continue
+        try:
+            current = os.stat(segment).st_ino == os.fstat(fd).st_ino
+        except FileNotFoundError:
+            current = False
+        if not current:
+            # Replaced or removed by a compaction while we waited for it; open the new file
+            os.close(fd)
+            continue
+        return segment, fd
+
+
+class TransactionJournal:
+    """Journal that batches the fsyncs of concurrent appends into a single group commit
+
+    An append returns once its record is durable. While one commit is being synced, new
+    appends queue up and are written and synced together in the next one, so durability
+    costs one fsync per batch rather than one per call. Batches only form within one process,
+    i.e. from the appends of the calls that process is running.
+    """
+
+    def __init__(self, path: str, max_batch: int = 1024):
+        self.path = path
+        self.max_batch = max_batch
+        self.segment: Optional[str] = None
+        self._fd: Optional[int] = None
+        self._seq = 0
+        self._pending: List[Tuple[bytes, asyncio.Future]] = []
+        self._wake = asyncio.Event()
+        self._commit_task: Optional[asyncio.Task] = None
+        self.stats = {"records": 0, "commits": 0, "bytes": 0}
+
+    def open(self) -> None:
+        """Claim a segment no live process holds, truncate any torn tail, and start the commit loop"""
+        self.segment, self._fd = claim_segment(self.path)
+        valid_end = 0
+        for valid_end, record in read_records(self.segment):
+            self._seq = max(self._seq, record.get("seq", 0))
+        if valid_end != os.fstat(self._fd).st_size:
+            # Left by a process that crashed mid-write; nobody else can be appending to this segment
+            logger.warning(f"Truncating torn journal tail at byte {valid_end} of {self.segment}")
+            os.ftruncate(self._fd, valid_end)
+        self._commit_task = asyncio.create_task(self._commit_loop())
+
+    async def close(self) -> None:
+        if self._commit_task is not None:
+            while self._pending:
+                await self._commit(self._take_batch())
+            self._commit_task.cancel()
+            self._commit_task = None
+        if self._fd is not None:
+            # Closing releases the segment's lock for the next process to claim
+            os.close(self._fd)
+            self._fd = None
+
+    async def append(self, kind: str, data: Dict[str, Any]) -> int:
+        """Append a record and wait until it is on disk; returns its sequence number"""
+        self._seq += 1
+        seq = self._seq
+        line = encode_record({"seq": seq, "ts": time.time(), "kind": kind, "data": data})
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((line, future))
+        self._wake.set()
+        await future
+        return seq
+
+    def _take_batch(self) -> List[Tuple[bytes, asyncio.Future]]:
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        return batch
+
+    async def _commit_loop(self) -> None:
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._pending:
+                await self._commit(self._take_batch())
+
+    async def _commit(self, batch: List[Tuple[bytes, asyncio.Future]]) -> None:
+        data = b"".join(line for line, _ in batch)
+        try:
+            await asyncio.to_thread(self._write_and_sync, data)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.stats["records"] += len(batch)
+        self.stats["commits"] += 1
+        self.stats["bytes"] += len(data)
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    def _write_and_sync(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            written = os.write(self._fd, view)
+            view = view[written:]
+        os.fsync(self._fd)
+
+
+def compact(path: str) -> Tuple[int, int]:
+    """Merge every segment into the journal path, keeping only the latest record per transaction or plan id"""
+    segments, locked = segment_paths(path), []
+    try:
+        for segment in segments:
+            fd = os.open(segment, os.O_RDONLY)
+            locked.append(fd)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise RuntimeError(f"{segment} is held by a running process") from None
+
+        latest: Dict[Tuple[str, Any], Dict[str, Any]] = {}
+        records = read_journal(path)
+        for index, record in enumerate(records):
+            id_field = RECORD_IDS.get(record["kind"])
+            record_id = record["data"].get(id_field) if id_field else None
+            latest[(record["kind"], record_id if record_id is not None else ("record", index))] = record
+
+        tmp_path = f"{path}.compact"
+        with open(tmp_path, "wb") as f:
+            # Sequence numbers were only unique per segment; number the merged journal afresh
+            for seq, record in enumerate(sorted(latest.values(), key=lambda r: r["ts"]), 1):
+                f.write(encode_record(dict(record, seq=seq)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        for segment in segments:
+            if segment != path:
+                os.remove(segment)
+    finally:
+        for fd in locked:
+            os.close(fd)
+    return len(records), len(latest)
+
+
+_shared_journal: Optional[TransactionJournal] = None
+
+
+def shared_journal() -> TransactionJournal:
+    """Journal of this job process, opened on first use"""
+    global _shared_journal
+    if _shared_journal is None:
+        journal = TransactionJournal(os.getenv("JOURNAL_PATH", "transactions.journal"))
+        journal.open()
+        _shared_journal = journal
+    return _shared_journal
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or compact a transaction journal")
+    parser.add_argument("command", choices=["replay", "compact"])
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        counts: Dict[str, int] = {}
+        for record in read_journal(args.path):
+            counts[record["kind"]] = counts.get(record["kind"], 0) + 1
+            sys.stdout.write(json.dumps(record) + "\n")
+        sys.stderr.write(f"Replayed {sum(counts.values())} records: {counts}\n")
+    else:
+        before, after = compact(args.path)
+        print(f"Compacted {args.path}: {before} -> {after} records")
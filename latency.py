@@ -0,0 +1,521 @@
+"""Per-turn latency spans for the voice pipeline, aggregated into mergeable histograms
+
+Each job process records spans measured from end of user speech (VAD) and dumps its
+histograms to LATENCY_DUMP_DIR, holding a flock on a lock file beside its dump while it runs.
+Dumps whose lock is free belong to processes that have exited; they are folded into one
+aggregate file and removed, so the directory holds the aggregate plus one dump per live process.
+`python latency.py serve` merges them and serves the result for Prometheus to scrape;
+`python latency.py report` prints the percentiles.
+"""
+import argparse
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from livekit.agents import llm, stt, tts
+from stt_tap import TappedSTT
+
+logger = logging.getLogger("latency")
+logger.setLevel(logging.INFO)
+
+# Spans recorded per turn, in pipeline order
+STAGES = ["stt_final", "llm_first_token", "first_tool_call", "tts_first_byte", "first_audio"]
+QUANTILES = [0.5, 0.9, 0.95, 0.99]
+
+# Histograms of exited processes, merged
+AGGREGATE_FILE = "latency-aggregate.json"
+
+# 128 linear sub-buckets per power of two keeps every recorded value within 1% of its true value
+SUB_BUCKET_BITS = 7
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+
+class LatencyHistogram:
+    """HDR-style log-linear histogram of latencies in microseconds
+
+    Memory is bounded by the value range rather than the sample count, and two histograms
+    merge by adding bucket counts, so dumps from separate processes combine exactly.
+    """
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.min_us: Optional[int] = None
+        self.max_us: Optional[int] = None
+
+    @staticmethod
+    def bucket_index(value_us: int) -> int:
+        if value_us < 2 * SUB_BUCKETS:
+            return value_us
+        shift = value_us.bit_length() - SUB_BUCKET_BITS - 1
+        return shift * SUB_BUCKETS + (value_us >> shift)
+
+    @staticmethod
+    def bucket_value(index: int) -> int:
+        """Midpoint of the values that fall into a bucket"""
+        if index < 2 * SUB_BUCKETS:
+            return index
+        shift = (index >> SUB_BUCKET_BITS) - 1
+        lower = (index - shift * SUB_BUCKETS) << shift
+        return lower + (1 << shift) // 2
+
+    def record(self, seconds: float) -> None:
+        value_us = max(0, int(seconds * 1_000_000))
+        index = self.bucket_index(value_us)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total_us += value_us
+        self.min_us = value_us if self.min_us is None else min(self.min_us, value_us)
+        self.max_us = value_us if self.max_us is None else max(self.max_us, value_us)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total_us += other.total_us
+        for attr, pick in (("min_us", min), ("max_us", max)):
+            theirs = getattr(other, attr)
+            if theirs is not None:
+                ours = getattr(self, attr)
+                setattr(self, attr, theirs if ours is None else pick(ours, theirs))
+
+    def percentile(self, quantile: float) -> Optional[float]:
+        """Latency in seconds at the given quantile (0-1)"""
+        if not self.count:
+            return None
+        rank = max(1, int(round(quantile * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                value_us = min(max(self.bucket_value(index), self.min_us), self.max_us)
+                return value_us / 1_000_000
+        return self.max_us / 1_000_000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "counts": {str(index): count for index, count in self.counts.items()},
+            "count": self.count,
+            "total_us": self.total_us,
+            "min_us": self.min_us,
+            "max_us": self.max_us,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        histogram = cls()
+        histogram.counts = {int(index): count for index, count in data["counts"].items()}
+        histogram.count = data["count"]
+        histogram.total_us = data["total_us"]
+        histogram.min_us = data["min_us"]
+        histogram.max_us = data["max_us"]
+        return histogram
+
+
+class LatencyRegistry:
+    """Histograms keyed by (agent type, stage)"""
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+
+    def record(self, agent_type: str, stage: str, seconds: float) -> None:
+        key = (agent_type, stage)
+        if key not in self.histograms:
+            self.histograms[key] = LatencyHistogram()
+        self.histograms[key].record(seconds)
+
+    def merge(self, other: "LatencyRegistry") -> None:
+        for key, histogram in other.histograms.items():
+            self.histograms.setdefault(key, LatencyHistogram()).merge(histogram)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "histograms": [
+                {"agent": agent_type, "stage": stage, **histogram.to_dict()}
+                for (agent_type, stage), histogram in self.histograms.items()
+            ]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyRegistry":
+        registry = cls()
+        for entry in data["histograms"]:
+            registry.histograms[(entry["agent"], entry["stage"])] = LatencyHistogram.from_dict(entry)
+        return registry
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Count and percentiles in milliseconds per agent type and stage"""
+        result: Dict[str, Dict[str, Any]] = {}
+        for (agent_type, stage), histogram in sorted(self.histograms.items()):
+            result.setdefault(agent_type, {})[stage] = {
+                "count": histogram.count,
+                **{f"p{int(q * 100)}_ms": round(histogram.percentile(q) * 1000, 1) for q in QUANTILES},
+                "max_ms": round(histogram.max_us / 1000, 1),
+            }
+        return result
+
+    def prometheus(self) -> str:
+        """Render as a Prometheus summary"""
+        name = "voice_pipeline_stage_seconds"
+        lines = [
+            f"# HELP {name} Latency from end of user speech to each pipeline stage",
+            f"# TYPE {name} summary",
+        ]
+        for (agent_type, stage), histogram in sorted(self.histograms.items()):
+            labels = f'agent="{agent_type}",stage="{stage}"'
+            for q in QUANTILES:
+                lines.append(f'{name}{{{labels},quantile="{q}"}} {histogram.percentile(q):.6f}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.total_us / 1_000_000:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class LatencyDumper:
+    """Writes this process's histograms to a JSON file in the dump directory every interval"""
+
+    def __init__(self, registry: LatencyRegistry, directory: str, interval: float = 15.0):
+        self.registry = registry
+        self.directory = directory
+        # Named by start time as well as pid, so a reused pid never overwrites an older dump
+        name = f"latency-{os.getpid()}-{int(time.time() * 1000)}"
+        self.path = os.path.join(directory, f"{name}.json")
+        self.lock_path = os.path.join(directory, f"{name}.lock")
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._lock_fd: Optional[int] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self) -> None:
+        # Held until the process exits; compaction only takes dumps whose lock is free
+        self._lock_fd = os.open(self.lock_path, os.O_WRONLY | os.O_CREAT, 0o600)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        self._task = asyncio.create_task(self._dump_loop())
+
+    async def _dump_loop(self) -> None:
+        # Every new process folds in the dumps of those that have exited, so the directory stays small
+        try:
+            await asyncio.to_thread(compact_dumps, self.directory)
+        except OSError as e:
+            logger.warning(f"Failed to compact latency dumps: {e}")
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.dump()
+
+    async def dump(self) -> None:
+        # Periodic and shutdown dumps can overlap; they share the temporary file
+        async with self._lock:
+            payload = json.dumps({"pid": os.getpid(), "written_at": time.time(), **self.registry.to_dict()})
+            await asyncio.to_thread(self._write, payload)
+
+    def _write(self, payload: str) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.dump()
+
+
+_shared_registry: Optional[LatencyRegistry] = None
+_shared_dumper: Optional[LatencyDumper] = None
+
+
+def shared_latency_registry() -> LatencyRegistry:
+    """Registry of this job process; starts the periodic dump on first use"""
+    global _shared_registry, _shared_dumper
+    if _shared_registry is None:
+        _shared_registry = LatencyRegistry()
+        _shared_dumper = LatencyDumper(
+            _shared_registry,
+            os.getenv("LATENCY_DUMP_DIR", ".latency"),
+            float(os.getenv("LATENCY_DUMP_INTERVAL", "15")),
+        )
+        _shared_dumper.start()
+    return _shared_registry
+
+
+async def flush_latency_dump() -> None:
+    """Write the current histograms now, e.g. when a job shuts down"""
+    if _shared_dumper is not None:
+        await _shared_dumper.dump()
+
+
+def read_dump(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def dump_paths(directory: str) -> List[str]:
+    return [
+        path for path in glob.glob(os.path.join(directory, "latency-*.json"))
+        if os.path.basename(path) != AGGREGATE_FILE
+    ]
+
+
+def is_running(lock_path: str) -> bool:
+    """Whether the process that wrote a dump still holds its lock; dumps without one are from exited processes"""
+    try:
+        fd = os.open(lock_path, os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+
+
+def remove_dump(directory: str, name: str) -> None:
+    for suffix in (".json", ".lock"):
+        try:
+            os.remove(os.path.join(directory, name + suffix))
+        except FileNotFoundError:
+            pass
+
+
+def compact_dumps(directory: str) -> int:
+    """Fold the dumps of exited processes into the aggregate and remove them; returns how many
+
+    The aggregate names the dumps it last folded in, so a compaction that stops before
+    removing them neither counts them twice nor leaves them behind.
+    """
+    if not os.path.isdir(directory):
+        return 0
+    with open(os.path.join(directory, "compact.lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0  # Another process is compacting
+
+        aggregate_path = os.path.join(directory, AGGREGATE_FILE)
+        aggregate, merged = LatencyRegistry(), []
+        if os.path.exists(aggregate_path):
+            data = read_dump(aggregate_path)
+            aggregate, merged = LatencyRegistry.from_dict(data), data.get("merged", [])
+        for name in merged:
+            remove_dump(directory, name)
+
+        exited = []
+        for path in dump_paths(directory):
+            name = os.path.basename(path)[:-len(".json")]
+            if is_running(os.path.join(directory, f"{name}.lock")):
+                continue
+            try:
+                aggregate.merge(LatencyRegistry.from_dict(read_dump(path)))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Discarding latency dump {path}: {e}")
+            exited.append(name)
+        if not exited:
+            return 0
+
+        tmp_path = f"{aggregate_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"written_at": time.time(), "merged": exited, **aggregate.to_dict()}, f)
+        os.replace(tmp_path, aggregate_path)
+        for name in exited:
+            remove_dump(directory, name)
+        return len(exited)
+
+
+def load_dumps(directory: str) -> LatencyRegistry:
+    """Merge the aggregate and the dumps of running processes into one registry"""
+    try:
+        compact_dumps(directory)
+    except OSError as e:
+        logger.warning(f"Failed to compact latency dumps: {e}")
+    registry, merged = LatencyRegistry(), set()
+    aggregate_path = os.path.join(directory, AGGREGATE_FILE)
+    if os.path.exists(aggregate_path):
+        data = read_dump(aggregate_path)
+        registry.merge(LatencyRegistry.from_dict(data))
+        merged = set(data.get("merged", []))
+    for path in dump_paths(directory):
+        if os.path.basename(path)[:-len(".json")] in merged:
+            continue
+        try:
+            registry.merge(LatencyRegistry.from_dict(read_dump(path)))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Skipping latency dump {path}: {e}")
+    return registry
+
+
+class TracedLLMStream(llm.LLMStream):
+    """Passes chunks through from the wrapped stream, reporting the first token and first tool call"""
+
+    def __init__(self, wrapped: llm.LLMStream, on_chunk: Callable[[llm.ChatChunk], None]):
+        super().__init__(chat_ctx=wrapped.chat_ctx, fnc_ctx=wrapped.fnc_ctx)
+        self._wrapped = wrapped
+        self._on_chunk = on_chunk
+
+    @property
+    def function_calls(self) -> List[llm.FunctionCallInfo]:
+        return self._wrapped.function_calls
+
+    def execute_functions(self) -> List[llm.CalledFunction]:
+        return self._wrapped.execute_functions()
+
+    async def aclose(self) -> None:
+        await self._wrapped.aclose()
+
+    async def __anext__(self) -> llm.ChatChunk:
+        chunk = await self._wrapped.__anext__()
+        self._on_chunk(chunk)
+        return chunk
+
+
+class TracedLLM(llm.LLM):
+    def __init__(self, wrapped: llm.LLM, on_chunk: Callable[[llm.ChatChunk], None]):
+        self._wrapped = wrapped
+        self._on_chunk = on_chunk
+
+    def chat(self, **kwargs: Any) -> TracedLLMStream:
+        return TracedLLMStream(self._wrapped.chat(**kwargs), self._on_chunk)
+
+
+class TracedChunkedStream(tts.ChunkedStream):
+    """Forwards audio from the wrapped stream, reporting when the first frame arrives"""
+
+    def __init__(self, wrapped: tts.ChunkedStream, on_first_frame: Callable[[], None]):
+        self._wrapped = wrapped
+        self._on_first_frame = on_first_frame
+        super().__init__()
+
+    async def _main_task(self) -> None:
+        first = True
+        async for audio in self._wrapped:
+            if first:
+                self._on_first_frame()
+                first = False
+            self._event_ch.send_nowait(audio)
+
+    async def aclose(self) -> None:
+        await self._wrapped.aclose()
+        await super().aclose()
+
+
+class TracedTTS(tts.TTS):
+    def __init__(self, wrapped: tts.TTS, on_first_frame: Callable[[], None]):
+        super().__init__(
+            capabilities=wrapped.capabilities,
+            sample_rate=wrapped.sample_rate,
+            num_channels=wrapped.num_channels,
+        )
+        self.wrapped = wrapped
+        self._on_first_frame = on_first_frame
+
+    def synthesize(self, text: str) -> TracedChunkedStream:
+        return TracedChunkedStream(self.wrapped.synthesize(text), self._on_first_frame)
+
+    def stream(self) -> tts.SynthesizeStream:
+        return self.wrapped.stream()
+
+
+class TurnTracer:
+    """Measures each turn of one call from end of user speech to the later pipeline stages
+
+    Every stage is recorded at most once per turn. A stage that completes while the user is
+    still speaking (a final transcript, or a preemptive reply) is recorded as zero once the
+    end of speech is detected. A turn ends when the agent's first audio is published.
+    """
+
+    def __init__(self, agent_type: str, registry: Optional[LatencyRegistry] = None):
+        self.agent_type = agent_type
+        self.registry = registry or shared_latency_registry()
+        self._user_speaking = False
+        self._end_of_speech: Optional[float] = None
+        self._early: set = set()
+        self._recorded: set = set()
+
+    def wrap(self, plugins: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-job copies of the shared plugins that report their stage timings to this tracer"""
+        tapped_stt = TappedSTT(plugins["stt"])
+        tapped_stt.add_listener(self._on_speech_event)
+        return dict(
+            plugins,
+            stt=tapped_stt,
+            llm=TracedLLM(plugins["llm"], self._on_llm_chunk),
+            tts=TracedTTS(plugins["tts"], lambda: self.mark("tts_first_byte")),
+        )
+
+    def attach(self, assistant: Any) -> None:
+        assistant.on("user_started_speaking", self._on_user_started_speaking)
+        assistant.on("user_stopped_speaking", self._on_user_stopped_speaking)
+        assistant.on("agent_started_speaking", self._on_agent_started_speaking)
+
+    def mark(self, stage: str) -> None:
+        if self._user_speaking:
+            self._early.add(stage)
+        elif self._end_of_speech is not None and stage not in self._recorded:
+            self._recorded.add(stage)
+            self.registry.record(self.agent_type, stage, time.perf_counter() - self._end_of_speech)
+
+    def _on_user_started_speaking(self) -> None:
+        self._user_speaking = True
+        self._end_of_speech = None
+        self._early = set()
+
+    def _on_user_stopped_speaking(self) -> None:
+        self._user_speaking = False
+        self._end_of_speech = time.perf_counter()
+        self._recorded = set(self._early)
+        for stage in self._early:
+            self.registry.record(self.agent_type, stage, 0.0)
+
+    def _on_speech_event(self, event: stt.SpeechEvent) -> None:
+        if event.type == stt.SpeechEventType.FINAL_TRANSCRIPT:
+            self.mark("stt_final")
+
+    def _on_llm_chunk(self, chunk: llm.ChatChunk) -> None:
+        if not chunk.choices:
+            return
+        delta = chunk.choices[0].delta
+        if delta.content or delta.tool_calls:
+            self.mark("llm_first_token")
+        if delta.tool_calls:
+            self.mark("first_tool_call")
+
+    def _on_agent_started_speaking(self) -> None:
+        self.mark("first_audio")
+        self._end_of_speech = None
+
+
+async def serve(directory: str, port: int) -> None:
+    from aiohttp import web
+
+    async def metrics(request: web.Request) -> web.Response:
+        registry = await asyncio.to_thread(load_dumps, directory)
+        return web.Response(text=registry.prometheus(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    logger.info(f"Serving voice pipeline latency from {directory} on http://127.0.0.1:{port}/metrics")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Voice pipeline latency histograms")
+    parser.add_argument("command", choices=["serve", "report"])
+    parser.add_argument("--dir", default=os.getenv("LATENCY_DUMP_DIR", ".latency"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("LATENCY_METRICS_PORT", "9464")))
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        asyncio.run(serve(args.dir, args.port))
+    else:
+        print(json.dumps(load_dumps(args.dir).summary(), indent=2))
@@ -0,0 +1,294 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from ids import new_id
+
+logger = logging.getLogger("outbox")
+logger.setLevel(logging.INFO)
+
+
+class DeliveryProvider:
+    """Sends a batch of messages; returns one success flag per message"""
+
+    async def send_batch(self, messages: List[Dict[str, Any]]) -> List[bool]:
+        raise NotImplementedError
+
+
+class FakeProvider(DeliveryProvider):
+    """Local stand-in for the email/SMS service that records what it was asked to send"""
+
+    def __init__(self, latency: float = 0.05, failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent: List[Dict[str, Any]] = []
+        self._random = random.Random(seed)
+
+    async def send_batch(self, messages: List[Dict[str, Any]]) -> List[bool]:
+        await asyncio.sleep(self.latency)
+        results = []
+        for message in messages:
+            ok = self._random.random() >= self.failure_rate
+            if ok:
+                self.sent.append(message)
+            results.append(ok)
+        return results
+
+
+def spool_files(spool_path: str) -> List[str]:
+    """The per-process spools next to `spool_path`, live or orphaned, and a spool at `spool_path` itself"""
+    paths = [path for path in glob.glob(glob.escape(spool_path) + ".*") if path.rsplit(".", 1)[1].isdigit()]
+    # Left by versions that shared one spool between processes
+    return ([spool_path] if os.path.exists(spool_path) else []) + paths
+
+
+def lock_orphan(path: str) -> Optional[int]:
+    """Open and flock a spool whose process has exited; None if a live process holds it or it is gone"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Another process may have adopted and removed it between the open and the lock
+        if os.stat(path).st_ino == os.fstat(fd).st_ino:
+            return fd
+    except (BlockingIOError, FileNotFoundError):
+        pass
+    os.close(fd)
+    return None
+
+
+def read_spool(path: str) -> Tuple[Dict[str, Dict[str, Any]], set]:
+    """Messages enqueued in a spool, by id, and the ids acknowledged in it"""
+    enqueued: Dict[str, Dict[str, Any]] = {}
+    acked = set()
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Torn final line
+            if entry["op"] == "enqueue":
+                enqueued[entry["message"]["message_id"]] = entry["message"]
+            else:
+                acked.add(entry["message_id"])
+    return enqueued, acked
+
+
+class Outbox:
+    """In-process outbox: enqueue returns immediately and a background task delivers in batches
+
+    Every message is appended to a spool file when enqueued and acknowledged there once
+    delivered or abandoned. Jobs run in processes of their own, so each process spools to
+    SPOOL_PATH.<pid> and holds an exclusive flock on it while it runs. On start, a process
+    adopts the spools no live process holds, i.e. those of processes that exited with messages
+    undelivered, and redelivers their messages once each. Failed deliveries are retried with
+    exponential backoff and jitter.
+    """
+
+    def __init__(
+        self,
+        provider: DeliveryProvider,
+        spool_path: str,
+        batch_size: int = 50,
+        max_attempts: int = 5,
+        base_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ):
+        self.provider = provider
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._ready: Deque[Dict[str, Any]] = deque()
+        self._delayed: List[Dict[str, Any]] = []
+        self._wake = asyncio.Event()
+        self.spool_file = f"{spool_path}.{os.getpid()}"
+        self._spool_fd: Optional[int] = None
+        self._sending = 0
+        self._task: Optional[asyncio.Task] = None
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self.counters = {"enqueued": 0, "delivered": 0, "retried": 0, "abandoned": 0}
+
+    def start(self) -> None:
+        """Adopt the spools of exited processes, requeue what they left undelivered, and start delivering"""
+        # Built under a name no other process looks at, and locked before it is renamed into place
+        tmp_path = f"{self.spool_file}.tmp"
+        self._spool_fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o600)
+        fcntl.flock(self._spool_fd, fcntl.LOCK_EX)
+
+        orphans = []
+        for path in spool_files(self.spool_path):
+            fd = lock_orphan(path)
+            if fd is not None:
+                orphans.append((path, fd))
+        try:
+            # A message can be in two orphans if a process exited while adopting; it is sent once
+            enqueued: Dict[str, Dict[str, Any]] = {}
+            acked = set()
+            for path, _ in orphans:
+                spooled, spool_acked = read_spool(path)
+                enqueued.update(spooled)
+                acked |= spool_acked
+            pending = [message for message_id, message in enqueued.items() if message_id not in acked]
+            for message in pending:
+                self._spool({"op": "enqueue", "message": message})
+            os.fsync(self._spool_fd)
+            os.replace(tmp_path, self.spool_file)
+            for path, _ in orphans:
+                if path != self.spool_file:
+                    os.remove(path)
+        finally:
+            for _, fd in orphans:
+                os.close(fd)
+
+        self._ready.extend(pending)
+        if pending:
+            logger.info(f"Requeued {len(pending)} undelivered messages from {len(orphans)} orphaned spools")
+        self._task = asyncio.create_task(self._deliver_loop())
+        self._wake.set()
+
+    def _spool(self, entry: Dict[str, Any]) -> None:
+        os.write(self._spool_fd, (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8"))
+
+    def enqueue(self, channel: str, to: str, payload: Dict[str, Any]) -> str:
+        """Queue a message for delivery and return its id without waiting on the provider"""
+        message = {
+            "message_id": new_id("MSG"),
+            "channel": channel,
+            "to": to,
+            "payload": payload,
+            "enqueued_at": time.time(),
+            "attempts": 0,
+        }
+        self._spool({"op": "enqueue", "message": message})
+        self._ready.append(message)
+        self.counters["enqueued"] += 1
+        self._wake.set()
+        return message["message_id"]
+
+    async def _deliver_loop(self) -> None:
+        while True:
+            timeout = None
+            if self._delayed:
+                timeout = max(0.0, min(m["next_attempt_at"] for m in self._delayed) - time.time())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            self._promote_delayed()
+
+            while self._ready:
+                batch = [self._ready.popleft() for _ in range(min(self.batch_size, len(self._ready)))]
+                self._sending += len(batch)
+                try:
+                    await self._deliver(batch)
+                finally:
+                    self._sending -= len(batch)
+
+    def _promote_delayed(self) -> None:
+        now = time.time()
+        due = [m for m in self._delayed if m["next_attempt_at"] <= now]
+        if due:
+            self._delayed = [m for m in self._delayed if m["next_attempt_at"] > now]
+            self._ready.extend(due)
+
+    async def _deliver(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            results = await self.provider.send_batch(batch)
+        except Exception as e:
+            logger.warning(f"Delivery of {len(batch)} messages failed: {e}")
+            results = [False] * len(batch)
+
+        now = time.time()
+        for message, ok in zip(batch, results):
+            message["attempts"] += 1
+            if ok:
+                self._spool({"op": "ack", "message_id": message["message_id"], "status": "delivered"})
+                self._latencies.append(now - message["enqueued_at"])
+                self.counters["delivered"] += 1
+            elif message["attempts"] >= self.max_attempts:
+                self._spool({"op": "ack", "message_id": message["message_id"], "status": "abandoned"})
+                self.counters["abandoned"] += 1
+                logger.error(f"Giving up on {message['channel']} message {message['message_id']} after {message['attempts']} attempts")
+            else:
+                backoff = min(self.max_backoff, self.base_backoff * 2 ** (message["attempts"] - 1))
+                message["next_attempt_at"] = now + backoff * random.uniform(0.5, 1.0)
+                self._delayed.append(message)
+                self.counters["retried"] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, counters and recent delivery latency percentiles in seconds"""
+        latencies = sorted(self._latencies)
+
+        def pct(p: float) -> Optional[float]:
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else None
+
+        return {
+            "queue_depth": len(self._ready) + len(self._delayed),
+            **self.counters,
+            "delivery_latency_p50": pct(0.5),
+            "delivery_latency_p95": pct(0.95),
+        }
+
+    def pending(self) -> int:
+        """Messages neither delivered nor abandoned yet"""
+        return len(self._ready) + len(self._delayed) + self._sending
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for every queued message to be delivered or abandoned"""
+        deadline = time.monotonic() + timeout
+        while self.pending():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def close(self) -> None:
+        """Stop delivering; a spool with messages still pending is left for the next process to adopt"""
+        done = self.pending() == 0
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._spool_fd is not None:
+            if done:
+                os.remove(self.spool_file)
+            # Closing releases the lock, which is what marks a spool as orphaned
+            os.close(self._spool_fd)
+            self._spool_fd = None
+
+
+_shared_outbox: Optional[Outbox] = None
+
+
+def shared_outbox() -> Outbox:
+    """Outbox of this job process, started on first use"""
+    global _shared_outbox
+    if _shared_outbox is None:
+        # Mock delivery - replace FakeProvider with the actual email/SMS service
+        outbox = Outbox(FakeProvider(), os.getenv("OUTBOX_SPOOL_PATH", "outbox.spool"))
+        outbox.start()
+        _shared_outbox = outbox
+    return _shared_outbox
+
+
+async def drain_outbox() -> None:
+    """Deliver what is queued before the job process exits, for up to OUTBOX_DRAIN_TIMEOUT seconds
+
+    The outbox stays open for any other job still running in the process. Messages still
+    pending when the process exits stay in its spool, and the next job process to start
+    delivers them.
+    """
+    if _shared_outbox is None:
+        return
+    if not await _shared_outbox.drain(float(os.getenv("OUTBOX_DRAIN_TIMEOUT", "5"))):
+        logger.warning(f"Leaving {_shared_outbox.pending()} undelivered messages in {_shared_outbox.spool_file}")
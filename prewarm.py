@@ -0,0 +1,111 @@
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+from livekit.agents import JobProcess
+from livekit.plugins import openai, silero, deepgram
+from tts_cache import AudioCache, CachedTTS, load_phrases
+from utterance_templates import UtteranceTemplate
+
+logger = logging.getLogger("prewarm")
+logger.setLevel(logging.INFO)
+
+
+def build_plugins(config: Dict[str, Dict[str, Any]], cache: AudioCache, clients: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Create the STT, LLM and TTS clients described by an agent's plugin config
+
+    Clients already in `clients` with an identical config are reused, so agents served by the
+    same worker share them.
+    """
+    clients = {} if clients is None else clients
+
+    def client(kind: str, factory) -> Any:
+        key = f"{kind}:{json.dumps(config[kind], sort_keys=True)}"
+        if key not in clients:
+            clients[key] = factory(config[kind])
+        return clients[key]
+
+    return {
+        "stt": client("stt", lambda options: deepgram.STT(**options)),
+        "llm": client("llm", lambda options: openai.LLM(**options)),
+        "tts": client("tts", lambda options: CachedTTS(openai.TTS(**options), cache, options)),
+    }
+
+
+def get_clients(proc: JobProcess) -> Dict[str, Any]:
+    """Plugin clients built in this worker process, by kind and config"""
+    return proc.userdata.setdefault("clients", {})
+
+
+def get_tts_cache(proc: JobProcess) -> AudioCache:
+    """Audio cache shared by every agent in the worker process"""
+    if "tts_cache" not in proc.userdata:
+        proc.userdata["tts_cache"] = AudioCache.from_env()
+    return proc.userdata["tts_cache"]
+
+
+def prewarm_process(
+    proc: JobProcess,
+    plugin_configs: Dict[str, Dict[str, Dict[str, Any]]],
+    cached_phrases: Optional[Dict[str, List[Union[str, UtteranceTemplate]]]] = None,
+) -> None:
+    """Load the VAD model and plugin clients once per worker process, before any job is assigned"""
+    start = time.perf_counter()
+    proc.userdata["vad"] = silero.VAD.load()
+    vad_loaded = time.perf_counter()
+
+    cache = get_tts_cache(proc)
+    plugins = proc.userdata.setdefault("plugins", {})
+    for name, config in plugin_configs.items():
+        plugins[name] = build_plugins(config, cache, get_clients(proc))
+        plugins[name]["tts"].warm(load_phrases((cached_phrases or {}).get(name, [])))
+
+    logger.info(
+        f"Prewarmed worker process - VAD: {(vad_loaded - start) * 1000:.0f}ms, "
+        f"plugins ({', '.join(plugin_configs)}): {(time.perf_counter() - vad_loaded) * 1000:.0f}ms, "
+        f"{len(get_clients(proc))} clients"
+    )
+
+
+def get_plugins(proc: JobProcess, name: str, config: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Return the shared VAD and plugin clients for an agent, building them only if prewarm did not run"""
+    if "vad" not in proc.userdata:
+        logger.warning("VAD was not prewarmed, loading it on the answer path")
+        proc.userdata["vad"] = silero.VAD.load()
+
+    plugins = proc.userdata.setdefault("plugins", {})
+    if name not in plugins:
+        logger.warning(f"Plugins for {name} were not prewarmed, building them on the answer path")
+        plugins[name] = build_plugins(config, get_tts_cache(proc), get_clients(proc))
+
+    return {"vad": proc.userdata["vad"], **plugins[name]}
+
+
+class JobTimer:
+    """Record when each setup phase of a job finishes so cold-start cost is visible per call"""
+
+    def __init__(self, job_name: str):
+        self.job_name = job_name
+        self.start = time.perf_counter()
+        self.marks: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str) -> float:
+        """Record the end of a phase and return its offset from job start in milliseconds"""
+        now = time.perf_counter()
+        self.marks.append((phase, now))
+        return (now - self.start) * 1000
+
+    def breakdown(self) -> Dict[str, float]:
+        """Milliseconds spent in each phase, measured from the end of the previous one"""
+        phases = {}
+        previous = self.start
+        for phase, at in self.marks:
+            phases[phase] = (at - previous) * 1000
+            previous = at
+        return phases
+
+    def log(self) -> None:
+        """Log the per-phase breakdown and total setup time"""
+        total = (self.marks[-1][1] - self.start) * 1000 if self.marks else 0.0
+        phases = ", ".join(f"{phase}: {ms:.1f}ms" for phase, ms in self.breakdown().items())
+        logger.info(f"{self.job_name} setup - {phases} (total {total:.1f}ms)")
@@ -0,0 +1,129 @@
+import hashlib
+import string
+import textwrap
+from typing import Any, Dict, List
+from livekit.agents import llm
+
+# Shared by both collections agents; keep it byte-identical so provider prompt caching can reuse it
+COMPLIANCE_RULES = """Compliance requirements (FDCPA):
+- Identify yourself and the company at the beginning
+- State that this is an attempt to collect a debt
+- Inform that any information obtained will be used for that purpose
+- Never threaten, use aggressive language or make false statements
+- Respect requests to cease communication
+- Only call between 8 AM and 9 PM local time"""
+
+
+def normalize(text: str) -> str:
+    """Strip the source indentation so the prompt bytes do not depend on where it is defined"""
+    return textwrap.dedent(text).strip()
+
+
+class PromptBuilder:
+    """System prompt split into a static prefix, identical on every call, and a trailing block of call facts
+
+    Providers cache prompts by exact prefix, so anything that varies per customer must come after
+    the static part. The facts template is parsed once at import and rendered per call.
+    """
+
+    def __init__(self, name: str, prefix: str, facts_template: str = ""):
+        self.name = name
+        self.prefix = normalize(prefix)
+        self.facts_template = normalize(facts_template)
+        self.slots = [field for _, field, _, _ in string.Formatter().parse(self.facts_template) if field]
+        if any(field for _, field, _, _ in string.Formatter().parse(self.prefix)):
+            raise ValueError(f"{name} prompt prefix must not contain {{slots}}")
+        self.prefix_hash = hashlib.sha256(self.prefix.encode("utf-8")).hexdigest()[:16]
+
+    def render_facts(self, **facts: Any) -> str:
+        missing = [slot for slot in self.slots if slot not in facts]
+        if missing:
+            raise KeyError(f"{self.name} prompt is missing call facts: {', '.join(missing)}")
+        return self.facts_template.format(**facts)
+
+    def chat_context(self, **facts: Any) -> llm.ChatContext:
+        """Initial chat context: the static prefix, then the call facts as their own system message"""
+        chat_ctx = llm.ChatContext()
+        chat_ctx.messages.append(llm.ChatMessage.create(role="system", text=self.prefix))
+        if self.facts_template:
+            chat_ctx.messages.append(llm.ChatMessage.create(role="system", text=self.render_facts(**facts)))
+        self.assert_stable_prefix(chat_ctx)
+        return chat_ctx
+
+    def assert_stable_prefix(self, chat_ctx: llm.ChatContext) -> None:
+        """Fail fast if the first message is no longer the cached static prefix"""
+        first = chat_ctx.messages[0].content if chat_ctx.messages else None
+        if first != self.prefix:
+            raise AssertionError(f"{self.name} prompt prefix changed, provider prompt caching will miss")
+
+
+INBOUND = PromptBuilder(
+    "agent_collections",
+    prefix=f"""
+    You are a professional and empathetic collections agent for a financial services company.
+    Your primary goals are to:
+    1. Help customers resolve their outstanding balances
+    2. Offer flexible payment solutions that work for their situation
+    3. Maintain a respectful and understanding tone
+    4. Ensure compliance with FDCPA regulations
+
+    Key behaviors:
+    - Always verify the customer's identity before discussing account details
+    - Be empathetic to financial hardships
+    - Clearly explain all payment options available
+    - Document all payment arrangements accurately
+    - Provide confirmation numbers for all transactions
+
+    Tools:
+    - verify_account before anything else; never discuss the account until it succeeds
+    - get_payment_options to read the options aloud, then process_payment or setup_payment_plan
+    - check_eligibility_for_hardship when the customer describes financial difficulty
+    - send_payment_confirmation after every payment or plan
+
+{textwrap.indent(COMPLIANCE_RULES, "    ")}
+
+    Start by introducing yourself and asking to verify their identity.
+    """,
+)
+
+OUTBOUND = PromptBuilder(
+    "agent_outbound",
+    prefix=f"""
+    You are a professional debt collection agent making an outbound call.
+    The customer's name, balance and due date are given in the call details below.
+
+    Your objectives:
+    1. Confirm you're speaking with the customer named in the call details
+    2. Remind them about the payment amount and its due date
+    3. Understand their ability to make the payment on time
+    4. If they can't pay by the due date, offer alternative arrangements
+    5. Secure a firm commitment for payment
+    6. If unable to commit, understand why and schedule follow-up
+
+    Guidelines:
+    - Be professional but empathetic
+    - Focus on the upcoming due date
+    - Listen to their situation before offering solutions
+    - Document the outcome of the call
+
+    Tools:
+    - confirm_speaking_with_customer as soon as they confirm who they are
+    - offer_payment_options when they ask how they can pay
+    - process_payment_commitment once they agree to an amount and date
+    - schedule_callback if they cannot commit now, handle_dispute if they dispute the balance
+
+{textwrap.indent(COMPLIANCE_RULES, "    ")}
+
+    Start the conversation by introducing yourself and confirming their identity.
+    """,
+    facts_template="""
+    Call details:
+    - Name: {name}
+    - Amount owed: {amount}
+    - Payment due date: {due_date} ({days_until_due} days from now)
+    - Hardship pre-screen: {hardship}
+    """,
+)
+
+BUILDERS = [INBOUND, OUTBOUND]
+
@@ -0,0 +1,231 @@
+import argparse
+import csv
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger("quotes")
+logger.setLevel(logging.INFO)
+
+# Pricing rules shared by the live tools and the batch quote book
+FULL_PAY_DISCOUNT = 0.10
+PLAN_MONTHS = (3, 6, 12)
+SETTLEMENT_RATE = 0.60
+
+ACCOUNT_NUMBER_WIDTH = 24
+
+QUOTE_DTYPE = np.dtype(
+    [("account_number", f"S{ACCOUNT_NUMBER_WIDTH}"), ("balance", "f8"), ("full_pay", "f8"), ("discount", "f8")]
+    + [(f"plan_{months}", "f8") for months in PLAN_MONTHS]
+    + [("settlement", "f8"), ("settlement_savings", "f8")]
+)
+
+FNV_OFFSET = 0xCBF29CE484222325
+FNV_PRIME = 0x100000001B3
+
+RECORDS_FILE = "records.npy"
+INDEX_FILE = "index.npy"
+
+
+def price(balances: np.ndarray) -> Dict[str, np.ndarray]:
+    """Every offer for every balance in one pass, rounded to cents"""
+    balances = np.asarray(balances, dtype=np.float64)
+    full_pay = np.round(balances * (1 - FULL_PAY_DISCOUNT), 2)
+    settlement = np.round(balances * SETTLEMENT_RATE, 2)
+    quote = {
+        "balance": balances,
+        "full_pay": full_pay,
+        "discount": np.round(balances - full_pay, 2),
+        "settlement": settlement,
+        "settlement_savings": np.round(balances - settlement, 2),
+    }
+    for months in PLAN_MONTHS:
+        quote[f"plan_{months}"] = np.round(balances / months, 2)
+    return quote
+
+
+def quote_balance(balance: float) -> Dict[str, float]:
+    """Offers for a single balance, priced by the same rules as the batch path"""
+    return {name: float(values[0]) for name, values in price(np.array([balance])).items()}
+
+
+def payment_options(quote: Dict[str, float]) -> List[Dict[str, Any]]:
+    """The options list the collections tools return to the LLM"""
+    balance = quote["balance"]
+    options = [{
+        "type": "full_payment",
+        "amount": balance,
+        "description": f"Pay in full today with {FULL_PAY_DISCOUNT:.0%} discount",
+        "discount": quote["discount"],
+        "final_amount": quote["full_pay"],
+    }]
+    for months in PLAN_MONTHS:
+        options.append({
+            "type": "payment_plan",
+            "months": months,
+            "monthly_payment": quote[f"plan_{months}"],
+            "total_amount": balance,
+            "description": f"{months}-month payment plan",
+        })
+    options.append({
+        "type": "settlement",
+        "amount": quote["settlement"],
+        "description": "One-time settlement offer",
+        "savings": quote["settlement_savings"],
+    })
+    return options
+
+
+def hash_key(account_number: bytes) -> int:
+    """FNV-1a over the zero-padded fixed-width key, matching hash_keys"""
+    h = FNV_OFFSET
+    for byte in account_number.ljust(ACCOUNT_NUMBER_WIDTH, b"\x00"):
+        h = ((h ^ byte) * FNV_PRIME) & 0xFFFFFFFFFFFFFFFF
+    return h
+
+
+def hash_keys(account_numbers: np.ndarray) -> np.ndarray:
+    """Vectorized FNV-1a over an array of fixed-width account numbers"""
+    raw = np.ascontiguousarray(account_numbers, dtype=f"S{ACCOUNT_NUMBER_WIDTH}")
+    columns = raw.view(np.uint8).reshape(len(raw), ACCOUNT_NUMBER_WIDTH).astype(np.uint64)
+    h = np.full(len(raw), FNV_OFFSET, dtype=np.uint64)
+    prime = np.uint64(FNV_PRIME)
+    for i in range(ACCOUNT_NUMBER_WIDTH):
+        h ^= columns[:, i]
+        h *= prime
+    return h
+
+
+def build_index(account_numbers: np.ndarray) -> np.ndarray:
+    """Open-addressing table of row numbers (-1 when empty), at most half full
+
+    Linear probing is resolved in vectorized rounds: every unplaced key tries its next slot,
+    and the first key aiming at each free slot takes it.
+    """
+    size = 1 << max(4, int(2 * len(account_numbers) - 1).bit_length())
+    mask = np.uint64(size - 1)
+    slots = np.full(size, -1, dtype=np.int64)
+    home = hash_keys(account_numbers) & mask
+
+    pending = np.arange(len(account_numbers), dtype=np.int64)
+    probe = np.zeros(len(account_numbers), dtype=np.uint64)
+    while len(pending):
+        targets = ((home[pending] + probe[pending]) & mask).astype(np.int64)
+        free = slots[targets] == -1
+        placed_slots, first = np.unique(targets[free], return_index=True)
+        winners = pending[free][first]
+        slots[placed_slots] = winners
+
+        placed = np.zeros(len(pending), dtype=bool)
+        placed[np.flatnonzero(free)[first]] = True
+        pending = pending[~placed]
+        probe[pending] += np.uint64(1)
+    return slots
+
+
+def build_quote_book(account_numbers: np.ndarray, balances: np.ndarray, directory: str) -> int:
+    """Price every account and write the records and their hash index to `directory`"""
+    account_numbers = np.asarray(account_numbers, dtype=f"S{ACCOUNT_NUMBER_WIDTH}")
+    if len(np.unique(account_numbers)) != len(account_numbers):
+        raise ValueError("Account numbers in a quote book must be unique")
+
+    records = np.zeros(len(account_numbers), dtype=QUOTE_DTYPE)
+    records["account_number"] = account_numbers
+    for name, values in price(balances).items():
+        records[name] = values
+    index = build_index(account_numbers)
+
+    # Written next to the live files and swapped in, so running workers never see a partial book
+    os.makedirs(directory, exist_ok=True)
+    for name, array in ((RECORDS_FILE, records), (INDEX_FILE, index)):
+        tmp = os.path.join(directory, f".{name}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, os.path.join(directory, name))
+    return len(records)
+
+
+def load_columns(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """account_number and balance columns from an .npz archive or a CSV file with a header row"""
+    if path.endswith(".npz"):
+        with np.load(path) as columns:
+            return columns["account_number"].astype(f"S{ACCOUNT_NUMBER_WIDTH}"), columns["balance"].astype(np.float64)
+
+    account_numbers: List[str] = []
+    balances: List[float] = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            account_numbers.append(row["account_number"])
+            balances.append(float(row["balance"]))
+    return np.array(account_numbers, dtype=f"S{ACCOUNT_NUMBER_WIDTH}"), np.array(balances, dtype=np.float64)
+
+
+class QuoteBook:
+    """Precomputed offers for a portfolio, memory-mapped and looked up by account number in O(1)"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.records = np.load(os.path.join(directory, RECORDS_FILE), mmap_mode="r")
+        self.index = np.load(os.path.join(directory, INDEX_FILE), mmap_mode="r")
+        self.mask = len(self.index) - 1
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, account_number: str) -> Optional[Dict[str, float]]:
+        key = account_number.encode("utf-8")
+        if len(key) > ACCOUNT_NUMBER_WIDTH:
+            return None
+        slot = hash_key(key) & self.mask
+        while True:
+            row = int(self.index[slot])
+            if row < 0:
+                return None
+            record = self.records[row]
+            if record["account_number"] == key:
+                return {name: float(record[name]) for name in QUOTE_DTYPE.names[1:]}
+            slot = (slot + 1) & self.mask
+
+
+_shared_quote_book: Optional[QuoteBook] = None
+_quote_book_checked = False
+
+
+def shared_quote_book() -> Optional[QuoteBook]:
+    """Quote book from QUOTE_BOOK_DIR shared by every job in this worker, or None to price live"""
+    global _shared_quote_book, _quote_book_checked
+    if not _quote_book_checked:
+        _quote_book_checked = True
+        directory = os.getenv("QUOTE_BOOK_DIR")
+        if directory:
+            try:
+                _shared_quote_book = QuoteBook(directory)
+                logger.info(f"Loaded quote book with {len(_shared_quote_book)} accounts from {directory}")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Quote book unavailable, pricing live: {e}")
+    return _shared_quote_book
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Price a portfolio ahead of calls")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Price an account file into a quote book")
+    build.add_argument("accounts", help=".npz with account_number/balance arrays, or CSV with those columns")
+    build.add_argument("--out", default=os.getenv("QUOTE_BOOK_DIR", "quotes"))
+    lookup = subparsers.add_parser("lookup", help="Print the offers for one account")
+    lookup.add_argument("account_number")
+    lookup.add_argument("--dir", default=os.getenv("QUOTE_BOOK_DIR", "quotes"))
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        account_numbers, balances = load_columns(args.accounts)
+        loaded = time.perf_counter()
+        count = build_quote_book(account_numbers, balances, args.out)
+        logger.info(f"Priced {count} accounts into {args.out} (load {loaded - start:.1f}s, price and index {time.perf_counter() - loaded:.1f}s)")
+    else:
+        quote = QuoteBook(args.dir).get(args.account_number)
+        print(payment_options(quote) if quote else f"No quote for {args.account_number}")
@@ -0,0 +1,453 @@
+"""Compliance recording of both legs of every call, encoded off the event loop
+
+The recorder opens no audio streams of its own: every extra AudioStream receives every audio
+event in the process, so its cost grows with the number of calls in the worker. Instead it
+copies the frames the call already moves, the caller's as they are fed to the STT stream and
+the agent's as they are queued on the pipeline's audio source, into one ring buffer per leg
+that is allocated when the call starts. Frames are placed by when they are heard, so the
+agent's silences stay silent, and queued agent audio that is cleared on an interruption is
+cut back out.
+
+One writer thread per worker drains every call's rings a few times a second, downsamples
+them to RECORDING_SAMPLE_RATE, interleaves the legs as stereo (caller left, agent right) or
+mixes them to mono, encodes them as G.711 mu-law through a lookup table, and appends to a
+WAV file whose header is kept current, so a crash leaves a playable file.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import numpy as np
+from livekit import rtc
+from livekit.agents import utils
+from stt_tap import TappedSTT
+
+logger = logging.getLogger("recorder")
+logger.setLevel(logging.INFO)
+
+# Rings hold every leg at one rate; 8, 16, 24 and 48kHz frames are upsampled by repeating samples
+RING_RATE = 48000
+AGENT_SNAP = 0.05
+# How often the WAV header is brought up to date with the data written so far
+HEADER_INTERVAL = 1.0
+WAVE_FORMAT_MULAW = 7
+# RIFF header, 18-byte fmt chunk, fact chunk and data chunk header
+HEADER_BYTES = 58
+
+
+def mulaw_table() -> np.ndarray:
+    """G.711 mu-law byte for every 16-bit sample, indexed by the sample's bits read as uint16
+
+    Follows the reference encoder (as in Sun's g711.c), which works on 14-bit magnitudes.
+    """
+    samples = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32) >> 2
+    mask = np.where(samples < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(samples), 8159) + 0x21
+    segment = np.searchsorted(np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF]), magnitude)
+    code = np.where(segment >= 8, 0x7F, (segment << 4) | ((magnitude >> (segment + 1)) & 0x0F))
+    return (code ^ mask).astype(np.uint8)
+
+
+MULAW = mulaw_table()
+
+
+def wav_header(channels: int, sample_rate: int, data_bytes: int) -> bytes:
+    return struct.pack(
+        "<4sI4s4sIHHIIHHH4sII4sI",
+        b"RIFF", HEADER_BYTES - 8 + data_bytes + (data_bytes & 1), b"WAVE",
+        b"fmt ", 18, WAVE_FORMAT_MULAW, channels, sample_rate, sample_rate * channels, channels, 8, 0,
+        b"fact", 4, data_bytes // channels,
+        b"data", data_bytes,
+    )
+
+
+class RingLeg:
+    """One side of a call: a fixed ring of 16-bit samples, written by the loop and read by the writer
+
+    Positions count RING_RATE samples since the recording started. The loop writes at `cursor`;
+    the writer reads up to a point it first pushes `cursor` past, so the two never touch the
+    same samples. A frame that runs past the end of the ring is written into the `spill`
+    samples after it and copied back to the start, so every frame is one contiguous copy.
+    """
+
+    def __init__(self, capacity: int, spill: int, snap: int, max_ahead: int):
+        self.buffer = np.zeros(capacity + spill, dtype=np.int16)
+        self.capacity = capacity
+        self.spill = spill
+        self.snap = snap
+        self.max_ahead = max_ahead
+        self.cursor = 0
+        self.read = 0
+        self.lock = threading.Lock()
+        self.counters = {"frames": 0, "gaps": 0, "dropped": 0}
+
+    def write(self, samples: np.ndarray, factor: int, position: int) -> bool:
+        """Place a frame, upsampled by `factor`, that ends at `position`; False if it was dropped"""
+        count = len(samples) * factor
+        start = position - count
+        with self.lock:
+            cursor = self.cursor
+            # Frames that follow each other closely are kept contiguous, jitter and all
+            gap = cursor < start - self.snap
+            if gap:
+                cursor = start
+            if cursor - start > self.max_ahead or cursor + count - self.read > self.capacity:
+                # A burst after the loop stalled, or the writer thread has fallen behind
+                self.counters["dropped"] += 1
+                return False
+            if gap:
+                # Silence since the last frame, e.g. between the agent's replies
+                self._zero(self.cursor, cursor)
+                self.counters["gaps"] += 1
+            offset = cursor % self.capacity
+            for phase in range(factor):
+                self.buffer[offset + phase:offset + count:factor] = samples
+            overflow = offset + count - self.capacity
+            if overflow > 0:
+                self.buffer[:overflow] = self.buffer[self.capacity:self.capacity + overflow]
+            self.cursor = cursor + count
+            self.counters["frames"] += 1
+        return True
+
+    def cut(self, position: int) -> None:
+        """Take back what was written past `position`, e.g. queued audio cleared before it played"""
+        with self.lock:
+            if self.cursor > position:
+                self._zero(position, self.cursor)
+                self.cursor = max(position, self.read)
+
+    def advance(self, end: int) -> None:
+        """Writer side: anything below `end` that was never written is silence, and stays so"""
+        with self.lock:
+            if self.cursor < end:
+                self._zero(self.cursor, end)
+                self.cursor = end
+
+    def copy_out(self, end: int, out: np.ndarray) -> None:
+        """Writer side: copy the samples from `read` to `end` into `out`"""
+        count = end - self.read
+        offset = self.read % self.capacity
+        first = min(count, self.capacity - offset)
+        out[:first] = self.buffer[offset:offset + first]
+        if first < count:
+            out[first:count] = self.buffer[:count - first]
+
+    def _zero(self, start: int, end: int) -> None:
+        start = max(start, self.read)
+        if start >= end:
+            return
+        offset = start % self.capacity
+        first = min(end - start, self.capacity - offset)
+        self.buffer[offset:offset + first] = 0
+        if first < end - start:
+            self.buffer[:end - start - first] = 0
+
+
+class RecordedAudioSource:
+    """Stands in for an audio source, recording each frame as it is queued to play"""
+
+    def __init__(self, source: rtc.AudioSource, recording: "CallRecording"):
+        self._source = source
+        self._recording = recording
+
+    async def capture_frame(self, frame: rtc.AudioFrame) -> None:
+        await self._source.capture_frame(frame)
+        # The frame finishes playing once everything queued ahead of it has
+        self._recording.push("agent", frame, ahead=self._source.queued_duration)
+
+    def clear_queue(self) -> None:
+        self._source.clear_queue()
+        self._recording.legs["agent"].cut(self._recording.position())
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._source, name)
+
+
+class CallRecording:
+    """The recording of one call; created by `CallRecorder.start` and closed when the job ends"""
+
+    def __init__(self, recorder: "CallRecorder", session: str, path: Optional[str]):
+        self.recorder = recorder
+        self.session = session
+        self.path = path
+        self.started = time.monotonic()
+        capacity, spill, max_ahead = int(recorder.buffer_seconds * RING_RATE), RING_RATE, int(recorder.max_ahead * RING_RATE)
+        self.legs = {
+            # Caller frames are placed by when they reach the loop, so they keep up to `jitter` of slack
+            "caller": RingLeg(capacity, spill, int(recorder.jitter * RING_RATE), max_ahead),
+            # Agent frames are placed by the source's own playout clock; a short pause is a real one
+            "agent": RingLeg(capacity, spill, int(AGENT_SNAP * RING_RATE), max_ahead),
+        }
+        # Writer-thread scratch space, sized once for the largest block a drain encodes
+        self._factor = RING_RATE // recorder.sample_rate
+        self._block = int(recorder.block_seconds * recorder.sample_rate) * self._factor
+        self._caller = np.zeros(self._block, dtype=np.int16)
+        self._agent = np.zeros(self._block, dtype=np.int16)
+        self._caller_out = np.zeros(self._block // self._factor, dtype=np.int32)
+        self._agent_out = np.zeros(self._block // self._factor, dtype=np.int32)
+        self._encoded = np.zeros(self._block // self._factor * recorder.channels, dtype=np.uint8)
+        self._file: Any = None
+        self._data_bytes = 0
+        self._header_at = 0.0
+        self._failed = False
+        self._unsupported = 0
+        self._closing = False
+        self._closed: "concurrent.futures.Future[None]" = concurrent.futures.Future()
+        self._tasks: List[asyncio.Task] = []
+        self._stt: Optional[TappedSTT] = None
+
+    def position(self, ahead: float = 0.0) -> int:
+        return int((time.monotonic() - self.started + ahead) * RING_RATE)
+
+    def push(self, leg: str, frame: rtc.AudioFrame, ahead: float = 0.0) -> None:
+        """Record a frame that finishes being heard `ahead` seconds from now"""
+        if self.path is None or self._closing:
+            return
+        if RING_RATE % frame.sample_rate:
+            self._unsupported += 1
+            return
+        factor = RING_RATE // frame.sample_rate
+        # A view of the first channel, no copy
+        samples = np.frombuffer(frame.data, dtype=np.int16)[::frame.num_channels]
+        end = self.position(ahead)
+        step = self.legs[leg].spill // factor
+        for i in range(0, len(samples), step):
+            piece = samples[i:i + step]
+            self.legs[leg].write(piece, factor, end - (len(samples) - i - len(piece)) * factor)
+
+    def on_caller_frame(self, frame: rtc.AudioFrame) -> None:
+        self.push("caller", frame)
+
+    def source(self, source: rtc.AudioSource) -> Any:
+        """Wrap an audio source the agent speaks through so that what it plays is recorded"""
+        return source if self.path is None else RecordedAudioSource(source, self)
+
+    def attach(self, assistant: Any, stt: TappedSTT) -> None:
+        """Record the caller from the frames `stt` is fed and the agent from what the pipeline plays"""
+        if self.path is None:
+            return
+        self._stt = stt
+        stt.add_frame_listener(self.on_caller_frame)
+        self._tasks.append(asyncio.create_task(self._wrap_playout(assistant)))
+
+    async def _wrap_playout(self, assistant: Any) -> None:
+        # The pipeline creates its audio source once its track is published, after start()
+        deadline = time.monotonic() + 30.0
+        while getattr(assistant, "_agent_output", None) is None and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+        playout = getattr(getattr(assistant, "_agent_output", None), "playout", None)
+        if playout is None or not hasattr(playout, "_audio_source"):
+            logger.warning("Recording the agent is not supported by this livekit-agents version")
+            return
+        playout._audio_source = self.source(playout._audio_source)
+
+    def drain(self, until: Optional[int] = None) -> None:
+        """Writer thread: encode and append everything both legs hold up to `until`"""
+        caller, agent = self.legs["caller"], self.legs["agent"]
+        if until is None:
+            until = self.position() - int(self.recorder.lag * RING_RATE)
+        until -= until % self._factor
+        wrote = False
+        while caller.read < until:
+            end = min(until, caller.read + self._block)
+            caller.advance(end)
+            agent.advance(end)
+            count = end - caller.read
+            caller.copy_out(end, self._caller)
+            agent.copy_out(end, self._agent)
+            data = self._encode(count)
+            caller.read = agent.read = end
+            if not self._failed:
+                self._append(data)
+                wrote = True
+        if wrote and not self._failed and time.monotonic() - self._header_at >= HEADER_INTERVAL:
+            self._update_header()
+
+    def _encode(self, count: int) -> np.ndarray:
+        frames = count // self._factor
+        caller, agent = self._caller_out[:frames], self._agent_out[:frames]
+        # Downsample by averaging each group of ring samples
+        for ring, out in ((self._caller, caller), (self._agent, agent)):
+            np.add.reduce(ring[:count].reshape(frames, self._factor), axis=1, dtype=np.int32, out=out)
+            np.floor_divide(out, self._factor, out=out)
+        if self.recorder.channels == 2:
+            encoded = self._encoded[:frames * 2]
+            for out, channel in ((caller, encoded[0::2]), (agent, encoded[1::2])):
+                np.bitwise_and(out, 0xFFFF, out=out)
+                np.take(MULAW, out, out=channel, mode="wrap")
+            return encoded
+        np.add(caller, agent, out=caller)
+        np.clip(caller, -32768, 32767, out=caller)
+        np.bitwise_and(caller, 0xFFFF, out=caller)
+        encoded = self._encoded[:frames]
+        np.take(MULAW, caller, out=encoded, mode="wrap")
+        return encoded
+
+    def _append(self, data: np.ndarray) -> None:
+        try:
+            if self._file is None:
+                self._file = open(self.path, "wb")
+                self._file.write(wav_header(self.recorder.channels, self.recorder.sample_rate, 0))
+            self._file.write(data)
+            self._data_bytes += len(data)
+        except OSError as e:
+            # The rest of the call is not recorded, but the rings keep draining so the taps never stall
+            self._failed = True
+            logger.error(f"Recording {self.session} to {self.path} failed: {e}")
+
+    def _update_header(self) -> None:
+        self._header_at = time.monotonic()
+        try:
+            self._file.seek(0)
+            self._file.write(wav_header(self.recorder.channels, self.recorder.sample_rate, self._data_bytes))
+            self._file.seek(0, os.SEEK_END)
+            self._file.flush()
+        except OSError as e:
+            self._failed = True
+            logger.error(f"Recording {self.session} to {self.path} failed: {e}")
+
+    def finish(self) -> None:
+        """Writer thread: write out whatever is left and close the file"""
+        try:
+            end = max(leg.cursor for leg in self.legs.values())
+            self.drain(end + (-end % self._factor))
+            if self._file is not None:
+                if not self._failed:
+                    self._update_header()
+                    if self._data_bytes & 1:
+                        self._file.write(b"\0")
+                self._file.close()
+        except Exception:
+            logger.exception(f"Closing recording {self.session} failed")
+        finally:
+            self._closed.set_result(None)
+
+    async def close(self) -> None:
+        """Stop recording and wait for the writer thread to finish the file"""
+        if self._closing:
+            return
+        self._closing = True
+        if self._stt is not None:
+            self._stt.remove_frame_listener(self.on_caller_frame)
+        for task in self._tasks:
+            await utils.aio.gracefully_cancel(task)
+        if self.path is None:
+            return
+        self.recorder.close(self)
+        await asyncio.wrap_future(self._closed)
+
+    def stats(self) -> Dict[str, Any]:
+        if self.path is None:
+            return {"enabled": False}
+        return {
+            **{f"{name}_{key}": value for name, leg in self.legs.items() for key, value in leg.counters.items()},
+            "unsupported_rate": self._unsupported,
+            "seconds": round(self._data_bytes / self.recorder.channels / self.recorder.sample_rate, 1),
+            "bytes": self._data_bytes,
+            "failed": self._failed,
+        }
+
+
+class CallRecorder:
+    """Worker-wide writer thread that encodes and saves every call's recording
+
+    `buffer_seconds` of each leg are held in memory. They must cover the writer's `lag` behind
+    real time, one `flush_interval`, one encoded block, and `max_ahead`, which is how far ahead
+    of playout the agent's audio source queues frames. The lag must exceed the caller `jitter`,
+    or the writer would fill with silence where late frames are still due.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        sample_rate: int = 16000,
+        stereo: bool = True,
+        buffer_seconds: float = 3.0,
+        flush_interval: float = 0.25,
+        lag: float = 0.6,
+        jitter: float = 0.5,
+        max_ahead: float = 1.2,
+        enabled: bool = True,
+    ):
+        self.block_seconds = 0.5
+        if RING_RATE % sample_rate:
+            raise ValueError(f"The recording sample rate must divide {RING_RATE}, got {sample_rate}")
+        if buffer_seconds < lag + flush_interval + max_ahead + self.block_seconds:
+            raise ValueError(f"A {buffer_seconds}s recording buffer is too small for a {lag}s lag and {max_ahead}s of queued audio")
+        if lag <= jitter:
+            raise ValueError(f"The recording lag ({lag}s) must exceed the caller jitter ({jitter}s)")
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.channels = 2 if stereo else 1
+        self.buffer_seconds = buffer_seconds
+        self.flush_interval = flush_interval
+        self.lag = lag
+        self.jitter = jitter
+        self.max_ahead = max_ahead
+        self.enabled = enabled
+        self._calls: List[CallRecording] = []
+        self._closing: List[CallRecording] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "CallRecorder":
+        """Configured by CALL_RECORDING, RECORDING_DIR, RECORDING_SAMPLE_RATE and RECORDING_LAYOUT"""
+        return cls(
+            os.getenv("RECORDING_DIR", "recordings"),
+            sample_rate=int(os.getenv("RECORDING_SAMPLE_RATE", "16000")),
+            stereo=os.getenv("RECORDING_LAYOUT", "stereo") != "mono",
+            enabled=os.getenv("CALL_RECORDING", "1") != "0",
+        )
+
+    def start(self, session: str) -> CallRecording:
+        """Start recording a call; attach it to the pipeline, and close it when the job shuts down"""
+        if not self.enabled:
+            return CallRecording(self, session, None)
+        name = f"{session.replace(os.sep, '_')}-{int(time.time())}.wav"
+        recording = CallRecording(self, session, os.path.join(self.directory, name))
+        with self._lock:
+            self._calls.append(recording)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="call-recorder", daemon=True)
+                self._thread.start()
+        return recording
+
+    def close(self, recording: CallRecording) -> None:
+        with self._lock:
+            self._calls.remove(recording)
+            self._closing.append(recording)
+        self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            with self._lock:
+                calls, closing = list(self._calls), self._closing
+                self._closing = []
+            for recording in calls:
+                try:
+                    recording.drain()
+                except Exception:
+                    logger.exception(f"Draining recording {recording.session} failed")
+            for recording in closing:
+                recording.finish()
+
+
+_shared_recorder: Optional[CallRecorder] = None
+
+
+def shared_recorder() -> CallRecorder:
+    """Call recorder shared by every job in this worker process"""
+    global _shared_recorder
+    if _shared_recorder is None:
+        _shared_recorder = CallRecorder.from_env()
+    return _shared_recorder
@@ -0,0 +1,280 @@
+"""Sentence and clause chunking of agent speech, with pipelined synthesis of the chunks
+
+The pipeline's default adapter for non-streaming TTS waits for the start of the next sentence
+before releasing one, and synthesizes sentences strictly one after another. `PipelinedTTS`
+releases a chunk as soon as its boundary is certain, cuts the first chunk of a turn at a
+clause so audio starts early, and synthesizes the next chunks while the current one plays.
+Boundaries never fall inside amounts, dates or times ("$1,234.56", "06/15", "3:30 p.m.").
+"""
+import asyncio
+import logging
+import os
+import re
+from typing import AsyncIterator, Callable, Iterable, List, Optional, Tuple
+from livekit.agents import tokenize, tts, utils
+
+logger = logging.getLogger("speech-chunker")
+logger.setLevel(logging.INFO)
+
+# Sentence ends (with any closing quote or bracket), line breaks and clause punctuation
+BOUNDARY = re.compile(r"(?P<sentence>[.!?…]+[\"'”’)\]]*)(?=\s)|(?P<line>\n)|(?P<clause>[,;:—])(?=\s)")
+NEXT_CHAR = re.compile(r"\s*(\S)")
+
+# "1." or "a)" opening a line of a spoken list belongs to the line it numbers
+LIST_MARKER = re.compile(r"(?:^|\n)[ \t]*(?:\d{1,2}|[A-Za-z])[.)]$")
+
+# Titles that are followed by a capitalized name rather than a new sentence
+TITLES = {"mr", "mrs", "ms", "dr", "prof", "st", "mt", "ft", "sgt", "capt", "gen", "rev", "hon"}
+
+# Initials and dotted abbreviations: "J.", "U.S.", "p.m."
+INITIALS = re.compile(r"(?:[a-z]\.)*[a-z]")
+
+
+class SentenceChunker(tokenize.SentenceTokenizer):
+    """Splits text into speakable chunks at sentence ends and line breaks, and at clauses when a chunk runs long
+
+    A boundary is only taken once the next non-space character is known, so streamed and whole
+    text split the same way. After the first chunk of a turn, chunks shorter than `min_chars`
+    are merged into the next one.
+    """
+
+    def __init__(self, min_chars: int = 20, first_chunk_chars: int = 30, max_chunk_chars: int = 120, hard_max_chars: int = 250):
+        self.min_chars = min_chars
+        self.first_chunk_chars = first_chunk_chars
+        self.max_chunk_chars = max_chunk_chars
+        self.hard_max_chars = hard_max_chars
+
+    def split(self, text: str, first: bool = True, final: bool = True) -> Tuple[List[str], int]:
+        """Complete chunks at the start of text and how much of it they consumed
+
+        `first` allows an early clause cut for the opening chunk of a turn; `final` means no more
+        text follows, so the remainder is a chunk too.
+        """
+        chunks: List[str] = []
+        start = 0
+        for match in BOUNDARY.finditer(text):
+            end = match.end()
+            after = NEXT_CHAR.match(text, end)
+            if after is None and not final:
+                break
+            chunk = " ".join(text[start:end].split())
+            if not chunk:
+                start = end
+                continue
+            next_char = after.group(1) if after is not None else ""
+            if self._is_boundary(match, text[start:end], chunk, next_char, first and not chunks):
+                chunks.append(chunk)
+                start = end
+
+        if final:
+            rest = " ".join(text[start:].split())
+            if rest:
+                chunks.append(rest)
+            return chunks, len(text)
+
+        # Run-on text with no usable boundary is cut at a space, never between a number and its words
+        while len(text) - start > self.hard_max_chars:
+            cut = max(
+                (m.start() for m in re.finditer(r"(?<=[^\d\s])\s+(?=[^\d\s])", text[start:start + self.hard_max_chars])),
+                default=None,
+            )
+            if not cut:
+                break
+            chunks.append(" ".join(text[start:start + cut].split()))
+            start += cut
+        return chunks, start
+
+    def _is_boundary(self, match: "re.Match", raw: str, chunk: str, next_char: str, first: bool) -> bool:
+        if match.lastgroup == "clause":
+            # "June 15, 2024" and "10: 30" keep their numbers together
+            if next_char.isdigit():
+                return False
+            return len(chunk) >= (self.first_chunk_chars if first else self.max_chunk_chars)
+
+        # The opening chunk may be a single short sentence ("Perfect!"), so the turn starts sooner
+        if len(chunk) < (1 if first else self.min_chars):
+            return False
+        if match.lastgroup == "line":
+            # A wrapped line continuing in lowercase is the same sentence
+            return not next_char.islower()
+
+        if chunk.rstrip("\"'”’)]").endswith("."):
+            # "Jan. 15", "approx. 30", "p.m. tomorrow" continue the sentence
+            if next_char.islower() or next_char.isdigit():
+                return False
+            word = chunk.rsplit(" ", 1)[-1].rstrip(".\"'”’)]").lower()
+            if word in TITLES or INITIALS.fullmatch(word) or LIST_MARKER.search(raw):
+                return False
+        return True
+
+    def tokenize(self, text: str, *, language: Optional[str] = None) -> List[str]:
+        return self.split(text)[0]
+
+    def stream(self, *, language: Optional[str] = None) -> "ChunkStream":
+        return ChunkStream(self)
+
+
+class ChunkStream(tokenize.SentenceStream):
+    """Incremental SentenceChunker: emits each chunk as soon as its boundary is certain"""
+
+    def __init__(self, chunker: SentenceChunker):
+        super().__init__()
+        self._chunker = chunker
+        self._buffer = ""
+        self._first = True
+        self._segment_id = utils.shortuuid()
+
+    def push_text(self, text: str) -> None:
+        self._check_not_closed()
+        self._buffer += text
+        self._emit(final=False)
+
+    def flush(self) -> None:
+        self._check_not_closed()
+        self._emit(final=True)
+        self._first = True
+        self._segment_id = utils.shortuuid()
+
+    def end_input(self) -> None:
+        self.flush()
+        self._do_close()
+
+    async def aclose(self) -> None:
+        self._do_close()
+
+    def _emit(self, final: bool) -> None:
+        chunks, consumed = self._chunker.split(self._buffer, first=self._first, final=final)
+        self._buffer = self._buffer[consumed:]
+        for chunk in chunks:
+            self._event_ch.send_nowait(tokenize.TokenData(segment_id=self._segment_id, token=chunk))
+            self._first = False
+
+
+class PipelinedTTS(tts.TTS):
+    """Streaming front for a non-streaming TTS: chunks the text and synthesizes up to `lookahead` chunks at once
+
+    Audio is forwarded in chunk order. Text for which `keep_whole` returns True, such as phrases
+    the TTS cache already holds, is synthesized in one piece.
+    """
+
+    def __init__(
+        self,
+        wrapped: tts.TTS,
+        chunker: Optional[SentenceChunker] = None,
+        lookahead: int = 2,
+        keep_whole: Optional[Callable[[str], bool]] = None,
+    ):
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=True),
+            sample_rate=wrapped.sample_rate,
+            num_channels=wrapped.num_channels,
+        )
+        self.wrapped = wrapped
+        self.chunker = chunker or SentenceChunker()
+        self.lookahead = lookahead
+        self._keep_whole = keep_whole
+
+    @classmethod
+    def from_env(cls, wrapped: tts.TTS, keep_whole: Optional[Callable[[str], bool]] = None) -> "PipelinedTTS":
+        """Configured by TTS_CHUNK_LOOKAHEAD and TTS_FIRST_CHUNK_CHARS"""
+        return cls(
+            wrapped,
+            SentenceChunker(first_chunk_chars=int(os.getenv("TTS_FIRST_CHUNK_CHARS", "30"))),
+            lookahead=int(os.getenv("TTS_CHUNK_LOOKAHEAD", "2")),
+            keep_whole=keep_whole,
+        )
+
+    def synthesize(self, text: str) -> tts.ChunkedStream:
+        if self._keep_whole is not None and self._keep_whole(text):
+            return self.wrapped.synthesize(text)
+        chunks = self.chunker.tokenize(text)
+        if len(chunks) <= 1:
+            return self.wrapped.synthesize(text)
+        return PipelinedChunkedStream(self, chunks)
+
+    def stream(self) -> "PipelinedSynthesizeStream":
+        return PipelinedSynthesizeStream(self)
+
+    async def synthesize_chunks(self, chunks: AsyncIterator[str], send: Callable[[tts.SynthesizedAudio], None]) -> None:
+        """Start each chunk's synthesis as it arrives, while an earlier chunk is still being forwarded"""
+        slots = asyncio.Semaphore(self.lookahead)
+        started: "asyncio.Queue[Optional[Tuple[asyncio.Task, asyncio.Queue]]]" = asyncio.Queue()
+        tasks: List[asyncio.Task] = []
+
+        async def synthesize(text: str, frames: asyncio.Queue) -> None:
+            try:
+                async for audio in self.wrapped.synthesize(text):
+                    frames.put_nowait(audio)
+            finally:
+                frames.put_nowait(None)
+
+        async def start() -> None:
+            try:
+                async for text in chunks:
+                    await slots.acquire()
+                    frames: asyncio.Queue = asyncio.Queue()
+                    task = asyncio.create_task(synthesize(text, frames))
+                    tasks.append(task)
+                    started.put_nowait((task, frames))
+            finally:
+                started.put_nowait(None)
+
+        starter = asyncio.create_task(start())
+        try:
+            while (entry := await started.get()) is not None:
+                task, frames = entry
+                while (audio := await frames.get()) is not None:
+                    send(audio)
+                await task
+                slots.release()
+            await starter
+        finally:
+            await utils.aio.gracefully_cancel(starter, *tasks)
+
+
+async def _iterate(chunks: Iterable[str]) -> AsyncIterator[str]:
+    for chunk in chunks:
+        yield chunk
+
+
+class PipelinedChunkedStream(tts.ChunkedStream):
+    """Whole text (e.g. a say() call) synthesized chunk by chunk"""
+
+    def __init__(self, pipelined: PipelinedTTS, chunks: List[str]):
+        self._pipelined = pipelined
+        self._chunks = chunks
+        super().__init__()
+
+    @utils.log_exceptions(logger=logger)
+    async def _main_task(self) -> None:
+        await self._pipelined.synthesize_chunks(_iterate(self._chunks), self._event_ch.send_nowait)
+
+
+class PipelinedSynthesizeStream(tts.SynthesizeStream):
+    """Streamed text (an LLM reply) chunked as it arrives"""
+
+    def __init__(self, pipelined: PipelinedTTS):
+        self._pipelined = pipelined
+        self._chunk_stream = pipelined.chunker.stream()
+        super().__init__()
+
+    @utils.log_exceptions(logger=logger)
+    async def _main_task(self) -> None:
+        async def forward_input() -> None:
+            async for data in self._input_ch:
+                if isinstance(data, self._FlushSentinel):
+                    self._chunk_stream.flush()
+                else:
+                    self._chunk_stream.push_text(data)
+            self._chunk_stream.end_input()
+
+        async def chunks() -> AsyncIterator[str]:
+            async for token in self._chunk_stream:
+                yield token.token
+
+        forward = asyncio.create_task(forward_input())
+        try:
+            await self._pipelined.synthesize_chunks(chunks(), self._event_ch.send_nowait)
+            await forward
+        finally:
+            await utils.aio.gracefully_cancel(forward)
@@ -0,0 +1,79 @@
+from typing import Callable, List
+from livekit import rtc
+from livekit.agents import stt, utils
+
+SpeechListener = Callable[[stt.SpeechEvent], None]
+FrameListener = Callable[[rtc.AudioFrame], None]
+
+
+class TappedSTT(stt.STT):
+    """Per-job STT wrapper that lets the agent observe interim and final transcripts as they stream
+
+    The wrapped client is the one shared by the worker; listeners are registered on this wrapper,
+    so each job only sees the events from its own streams. Frame listeners see the caller audio
+    each stream is fed, without opening another audio stream on the track.
+    """
+
+    def __init__(self, wrapped: stt.STT):
+        super().__init__(capabilities=wrapped.capabilities)
+        self._wrapped = wrapped
+        self._listeners: List[SpeechListener] = []
+        self._frame_listeners: List[FrameListener] = []
+
+    def add_listener(self, listener: SpeechListener) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: SpeechListener) -> None:
+        self._listeners.remove(listener)
+
+    def add_frame_listener(self, listener: FrameListener) -> None:
+        self._frame_listeners.append(listener)
+
+    def remove_frame_listener(self, listener: FrameListener) -> None:
+        self._frame_listeners.remove(listener)
+
+    async def recognize(self, buffer: utils.AudioBuffer, *, language: str | None = None) -> stt.SpeechEvent:
+        event = await self._wrapped.recognize(buffer, language=language)
+        self._notify(event)
+        return event
+
+    def stream(self, *, language: str | None = None) -> "TappedSpeechStream":
+        return TappedSpeechStream(self._wrapped.stream(language=language), self._notify, self._notify_frame)
+
+    def _notify(self, event: stt.SpeechEvent) -> None:
+        for listener in self._listeners:
+            listener(event)
+
+    def _notify_frame(self, frame: rtc.AudioFrame) -> None:
+        for listener in self._frame_listeners:
+            listener(frame)
+
+
+class TappedSpeechStream:
+    """Forwards audio to the wrapped speech stream and reports each frame and event on the way"""
+
+    def __init__(self, wrapped: stt.SpeechStream, notify: SpeechListener, notify_frame: FrameListener):
+        self._wrapped = wrapped
+        self._notify = notify
+        self._notify_frame = notify_frame
+
+    def push_frame(self, frame: rtc.AudioFrame) -> None:
+        self._notify_frame(frame)
+        self._wrapped.push_frame(frame)
+
+    def flush(self) -> None:
+        self._wrapped.flush()
+
+    def end_input(self) -> None:
+        self._wrapped.end_input()
+
+    async def aclose(self) -> None:
+        await self._wrapped.aclose()
+
+    def __aiter__(self) -> "TappedSpeechStream":
+        return self
+
+    async def __anext__(self) -> stt.SpeechEvent:
+        event = await self._wrapped.__anext__()
+        self._notify(event)
+        return event
@@ -0,0 +1,85 @@
+import asyncio
+
+import numpy as np
+import pytest
+from livekit.agents import stt
+
+from amd import HUMAN, MACHINE, AnsweringMachineDetector, late_machine_cue, machine_cue, watch_for_machine
+
+
+class FakeTap:
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def emit(self, text):
+        event = stt.SpeechEvent(type=stt.SpeechEventType.FINAL_TRANSCRIPT, alternatives=[stt.SpeechData(language="en", text=text)])
+        for listener in list(self.listeners):
+            listener(event)
+
+
+@pytest.mark.parametrize("text", [
+    "Sorry, I'm not available right now, can I get back to you later?",
+    "I can't take your call at work, you've reached me at a bad time",
+])
+def test_a_person_is_not_taken_for_a_machine_late(text):
+    assert machine_cue(text)
+    assert late_machine_cue(text) is None
+
+
+@pytest.mark.parametrize("text", ["Leave me a message and I'll call you back", "Please record your message after the tone", "beep"])
+def test_machine_phrases_still_count_late(text):
+    assert late_machine_cue(text)
+
+
+def test_watch_for_machine_needs_a_strong_cue():
+    async def run():
+        tap, cues = FakeTap(), []
+        watch_for_machine(tap, cues.append)
+        tap.emit("I'm not available right now, I'll get back to you")
+        tap.emit("please leave a message after the beep")
+        await asyncio.sleep(0)
+        return tap, cues
+
+    tap, cues = asyncio.run(run())
+    assert cues == ["leave a message"]
+    assert tap.listeners == []
+
+
+def vad_run(detector, speech_until, end, step=0.032):
+    at = step
+    while at <= end and detector.result is None:
+        detector.on_vad(at, 0.9 if at <= speech_until else 0.1)
+        at += step
+    return detector.result
+
+
+def test_long_greeting_alone_is_taken_for_a_person():
+    detector = AnsweringMachineDetector()
+    result = vad_run(detector, speech_until=4.0, end=6.0)
+    assert result["label"] == HUMAN
+    assert result["suspected"] == "long greeting"
+
+
+def test_long_greeting_with_a_cue_is_a_machine():
+    detector = AnsweringMachineDetector()
+    vad_run(detector, speech_until=4.0, end=3.0)
+    detector.on_transcript(3.0, "Hi, you've reached John, I can't take your call right now")
+    assert detector.result["label"] == MACHINE
+
+
+def test_beep_is_a_machine():
+    detector = AnsweringMachineDetector()
+    t = np.arange(320) / 16000
+    tone = (np.sin(2 * np.pi * 1000 * t) * 8000).astype(np.int16)
+    at = 0.0
+    while detector.result is None and at < 1.0:
+        at += 0.02
+        detector.on_frame(at, tone, 16000)
+    assert detector.result["label"] == MACHINE
+    assert detector.result["reason"] == "beep"
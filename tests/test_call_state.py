@@ -0,0 +1,74 @@
+import asyncio
+
+from aiohttp import WSMsgType, web
+
+import call_state
+from call_state import CallStatePublisher, CallStateRegistry, flush_call_state
+
+
+async def start_hub(received):
+    async def publish(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for message in ws:
+            if message.type == WSMsgType.TEXT:
+                received.append(message.json())
+        return ws
+
+    app = web.Application()
+    app.router.add_get("/publish", publish)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def test_final_phase_reaches_the_hub_on_shutdown(monkeypatch):
+    async def run():
+        received = []
+        runner, url = await start_hub(received)
+        # A long interval, so only the shutdown flush can send the last change
+        registry = CallStateRegistry(interval=60.0)
+        registry.start()
+        publisher = CallStatePublisher(registry, url)
+        publisher.start()
+        monkeypatch.setattr(call_state, "_shared_registry", registry)
+        monkeypatch.setattr(call_state, "_shared_publisher", publisher)
+        assert await publisher.drain(2.0)
+
+        registry.update("call-1", phase="ended", outcome="answering machine: hung up")
+        await flush_call_state()
+        await runner.cleanup()
+        return received
+
+    received = asyncio.run(run())
+    assert received[-1]["calls"]["call-1"]["phase"] == "ended"
+    assert received[-1]["calls"]["call-1"]["outcome"] == "answering machine: hung up"
+
+
+def test_next_job_in_the_process_is_published_too(monkeypatch):
+    async def run():
+        received = []
+        runner, url = await start_hub(received)
+        monkeypatch.setenv("CALL_STATE_URL", url)
+        monkeypatch.setattr(call_state, "_shared_registry", None)
+        monkeypatch.setattr(call_state, "_shared_publisher", None)
+
+        first = call_state.shared_call_state()
+        first.update("call-1", phase="in_progress")
+        first.update("call-1", phase="ended")
+        await flush_call_state()
+
+        second = call_state.shared_call_state()
+        assert second is not first
+        second.update("call-2", phase="in_progress")
+        await flush_call_state()
+        await runner.cleanup()
+        return received
+
+    received = asyncio.run(run())
+    rooms = {room: delta for batch in received for room, delta in batch["calls"].items()}
+    assert rooms["call-1"]["phase"] == "ended"
+    assert rooms["call-2"]["phase"] == "in_progress"
@@ -0,0 +1,93 @@
+import asyncio
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import callbacks
+import dialer
+from callbacks import CallbackScheduler, next_calling_window
+from dialer import FakeRoomService, RoomService
+from journal import TransactionJournal, encode_record
+
+ZONE = ZoneInfo("America/New_York")
+
+
+def callback(callback_id, due_at):
+    return {
+        "callback_id": callback_id,
+        "due_at": due_at,
+        "phoneNumber": f"+1555{callback_id[-4:]}",
+        "customerName": "John Smith",
+        "amountOwed": 450.0,
+        "paymentDueDate": "2030-01-15",
+        "timezone": "America/New_York",
+        "scheduled_at": due_at - 60,
+    }
+
+
+def write_journal(path, entries):
+    with open(path, "wb") as f:
+        for entry in entries:
+            f.write(encode_record({"ts": entry["scheduled_at"], "kind": "scheduled", "data": entry}))
+
+
+class FailingRoomService(RoomService):
+    async def create_room(self, name, metadata):
+        raise OSError("SIP trunk unavailable")
+
+    async def active_calls(self):
+        return 0
+
+
+async def dispatch_due(scheduler, room_service):
+    scheduler._outcomes = TransactionJournal(scheduler.outcomes_path)
+    scheduler._outcomes.open()
+    scheduler.load()
+    await scheduler._dispatch(scheduler.pop_due(time.time()), room_service, {"capacity_poll_interval": 60.0})
+    await scheduler._outcomes.close()
+
+
+def test_next_window_is_the_next_morning_after_hours():
+    late = datetime(2030, 1, 14, 21, 30, tzinfo=ZONE).timestamp()
+    early = datetime(2030, 1, 15, 6, 0, tzinfo=ZONE).timestamp()
+    open_ = datetime(2030, 1, 15, 12, 0, tzinfo=ZONE).timestamp()
+    morning = datetime(2030, 1, 15, 8, 0, tzinfo=ZONE).timestamp()
+    assert next_calling_window({"timezone": "America/New_York"}, late, "UTC") == morning
+    assert next_calling_window({"timezone": "America/New_York"}, early, "UTC") == morning
+    assert next_calling_window({"timezone": "America/New_York"}, open_, "UTC") == open_
+    assert next_calling_window({"timezone": "Mars/Olympus_Mons"}, late, "UTC") is None
+
+
+def test_callback_skipped_outside_hours_is_moved_to_the_next_window(tmp_path, monkeypatch):
+    journal, outcomes = str(tmp_path / "callbacks.journal"), str(tmp_path / "outcomes.journal")
+    write_journal(journal, [callback("CB0001", time.time() - 1)])
+    monkeypatch.setattr(dialer, "within_calling_hours", lambda call, now, default_timezone: False)
+    window = time.time() + 3600
+    monkeypatch.setattr(callbacks, "next_calling_window", lambda call, now, default_timezone: window)
+
+    rooms = FakeRoomService(create_latency=0.0)
+    asyncio.run(dispatch_due(CallbackScheduler(journal, outcomes), rooms))
+    assert rooms.created == []
+
+    restarted = CallbackScheduler(journal, outcomes)
+    restarted.load()
+    assert restarted.pending["CB0001"]["due_at"] == window
+    assert restarted.next_due() == window
+
+
+def test_retries_survive_a_restart(tmp_path, monkeypatch):
+    journal, outcomes = str(tmp_path / "callbacks.journal"), str(tmp_path / "outcomes.journal")
+    write_journal(journal, [callback("CB0002", time.time() - 1)])
+    monkeypatch.setattr(dialer, "within_calling_hours", lambda call, now, default_timezone: True)
+
+    scheduler = CallbackScheduler(journal, outcomes, max_attempts=2, retry_delay=0.0)
+    asyncio.run(dispatch_due(scheduler, FailingRoomService()))
+    assert scheduler.stats["retried"] == 1
+
+    # After a restart the one retry left is used, rather than starting over from zero attempts
+    restarted = CallbackScheduler(journal, outcomes, max_attempts=2, retry_delay=0.0)
+    asyncio.run(dispatch_due(restarted, FailingRoomService()))
+    assert restarted.stats["failed"] == 1
+    final = CallbackScheduler(journal, outcomes)
+    final.load()
+    assert final.pending == {}
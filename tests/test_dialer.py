@@ -0,0 +1,39 @@
+import asyncio
+
+import dialer
+from dialer import Dialer, FakeRoomService
+
+CALL = {
+    "phoneNumber": "+15550100",
+    "customerName": "John Smith",
+    "amountOwed": "450.00",
+    "paymentDueDate": "2030-01-15",
+    "timezone": "America/New_York",
+}
+
+
+def test_calling_hours_are_checked_again_after_waiting(monkeypatch):
+    checks = []
+
+    def closes_while_waiting(call, now, default_timezone):
+        # Open when the call is taken off the queue, 9 PM by the time a slot and a token are free
+        checks.append(now)
+        return len(checks) == 1
+
+    monkeypatch.setattr(dialer, "within_calling_hours", closes_while_waiting)
+    rooms = FakeRoomService(create_latency=0.0)
+    result = asyncio.run(Dialer(rooms, concurrency=1).run([dict(CALL)]))
+    assert len(checks) == 2
+    assert rooms.created == []
+    assert result["skipped_outside_hours"] == 1
+
+
+def test_row_missing_a_field_fails_without_leaking_its_slot(monkeypatch):
+    monkeypatch.setattr(dialer, "within_calling_hours", lambda call, now, default_timezone: True)
+    rooms = FakeRoomService(create_latency=0.0)
+    calls = [{k: v for k, v in CALL.items() if k != "phoneNumber"}, dict(CALL)]
+    run = Dialer(rooms, concurrency=1, calls_per_second=100.0)
+    result = asyncio.run(run.run(calls))
+    assert result["failed"] == 1
+    assert result["dialed"] == 1
+    assert run.in_flight == 0
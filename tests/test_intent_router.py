@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from agent_outbound import OutboundCollectionsAssistant
+from intent_router import FastPathRouter
+
+CUSTOMER = {
+    "customerName": "John Smith",
+    "amountOwed": 450.0,
+    "paymentDueDate": "2030-01-15",
+    "timezone": "America/New_York",
+}
+
+
+@pytest.fixture
+def router():
+    return FastPathRouter(OutboundCollectionsAssistant(dict(CUSTOMER)), dict(CUSTOMER))
+
+
+def test_confirms_identity_before_anything_else(router):
+    assert router.classify("yes") == "confirm_identity"
+    assert router.classify("yes i will pay it in full") is None
+
+
+@pytest.mark.parametrize("text", ["yes", "yeah", "yes i will"])
+def test_confirmation_by_the_llm_is_not_repeated(router, text):
+    # The LLM called the tool itself, e.g. after "who is this?"
+    asyncio.run(router.fnc_ctx.confirm_speaking_with_customer(confirmed=True))
+    assert router.identity_confirmed
+    assert router.classify(text) != "confirm_identity"
+
+
+def test_fast_path_confirmation_is_recorded_in_the_call_outcome(router):
+    async def confirm():
+        return await router._dispatch("confirm_identity", "yes", None, 0.0)
+
+    asyncio.run(confirm())
+    assert router.fnc_ctx.call_outcome["identity_confirmed"]
+    assert router.classify("yes") != "confirm_identity"
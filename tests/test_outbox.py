@@ -0,0 +1,149 @@
+import asyncio
+import fcntl
+import json
+import os
+
+import outbox as outbox_module
+from outbox import FakeProvider, Outbox
+
+
+class FlakyProvider(FakeProvider):
+    """Fails every message for the first `failures` batches"""
+
+    def __init__(self, failures: int):
+        super().__init__(latency=0.0)
+        self.failures = failures
+        self.batches = 0
+
+    async def send_batch(self, messages):
+        self.batches += 1
+        if self.batches <= self.failures:
+            return [False] * len(messages)
+        return await super().send_batch(messages)
+
+
+def write_spool(path, entries):
+    with open(path, "w") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+
+def message(message_id):
+    return {"message_id": message_id, "channel": "email", "to": "a@example.com", "payload": {}, "enqueued_at": 0.0, "attempts": 0}
+
+
+def test_enqueue_delivers_in_background_and_removes_spool(tmp_path):
+    async def run():
+        provider = FakeProvider(latency=0.0)
+        outbox = Outbox(provider, str(tmp_path / "outbox.spool"))
+        outbox.start()
+        message_id = outbox.enqueue("email", "a@example.com", {"summary": "Paid $100"})
+        assert provider.sent == []
+        assert await outbox.drain(2.0)
+        await outbox.close()
+        return provider, outbox, message_id
+
+    provider, outbox, message_id = asyncio.run(run())
+    assert [m["message_id"] for m in provider.sent] == [message_id]
+    assert outbox.counters["delivered"] == 1
+    assert not os.path.exists(outbox.spool_file)
+
+
+def test_failed_delivery_is_retried_with_backoff(tmp_path):
+    async def run():
+        provider = FlakyProvider(failures=2)
+        outbox = Outbox(provider, str(tmp_path / "outbox.spool"), base_backoff=0.01)
+        outbox.start()
+        outbox.enqueue("sms", "+15550100", {})
+        assert await outbox.drain(2.0)
+        await outbox.close()
+        return provider, outbox
+
+    provider, outbox = asyncio.run(run())
+    assert len(provider.sent) == 1
+    assert outbox.counters["retried"] == 2
+    assert outbox.counters["delivered"] == 1
+
+
+def test_gives_up_after_max_attempts(tmp_path):
+    async def run():
+        outbox = Outbox(FakeProvider(latency=0.0, failure_rate=1.0), str(tmp_path / "outbox.spool"), max_attempts=3, base_backoff=0.01)
+        outbox.start()
+        outbox.enqueue("email", "a@example.com", {})
+        assert await outbox.drain(2.0)
+        await outbox.close()
+        return outbox
+
+    outbox = asyncio.run(run())
+    assert outbox.counters["abandoned"] == 1
+    assert outbox.counters["retried"] == 2
+
+
+def test_orphaned_spools_are_redelivered_once(tmp_path):
+    spool = str(tmp_path / "outbox.spool")
+    # A process that exited with M2 undelivered, and one that exited while adopting M2
+    write_spool(f"{spool}.101", [
+        {"op": "enqueue", "message": message("M1")},
+        {"op": "enqueue", "message": message("M2")},
+        {"op": "ack", "message_id": "M1", "status": "delivered"},
+    ])
+    write_spool(f"{spool}.102", [
+        {"op": "enqueue", "message": message("M2")},
+        {"op": "enqueue", "message": message("M3")},
+    ])
+
+    async def run():
+        provider = FakeProvider(latency=0.0)
+        outbox = Outbox(provider, spool)
+        outbox.start()
+        assert await outbox.drain(2.0)
+        await outbox.close()
+        return provider
+
+    provider = asyncio.run(run())
+    assert sorted(m["message_id"] for m in provider.sent) == ["M2", "M3"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_spool_of_a_live_process_is_left_alone(tmp_path):
+    spool = str(tmp_path / "outbox.spool")
+    live = f"{spool}.103"
+    write_spool(live, [{"op": "enqueue", "message": message("M4")}])
+    fd = os.open(live, os.O_RDONLY)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+
+    async def run():
+        provider = FakeProvider(latency=0.0)
+        outbox = Outbox(provider, spool)
+        outbox.start()
+        assert await outbox.drain(2.0)
+        await outbox.close()
+        return provider
+
+    try:
+        provider = asyncio.run(run())
+    finally:
+        os.close(fd)
+    assert provider.sent == []
+    assert os.path.exists(live)
+
+
+def test_outbox_still_takes_messages_after_a_job_drains_it(tmp_path, monkeypatch):
+    monkeypatch.setenv("OUTBOX_SPOOL_PATH", str(tmp_path / "outbox.spool"))
+    monkeypatch.setattr(outbox_module, "_shared_outbox", None)
+
+    async def run():
+        first = outbox_module.shared_outbox()
+        first.provider.latency = 0.0
+        first.enqueue("email", "a@example.com", {})
+        await outbox_module.drain_outbox()
+        # The next job in the same process
+        second = outbox_module.shared_outbox()
+        second.enqueue("sms", "+15550100", {})
+        assert await second.drain(2.0)
+        await second.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert second is first
+    assert second.counters["delivered"] == 2
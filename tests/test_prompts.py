@@ -0,0 +1,31 @@
+import pytest
+
+from prompts import BUILDERS
+
+CALLS = [
+    {"name": "John Smith", "amount": "$450.00", "due_date": "2030-01-15", "days_until_due": 12, "hardship": "not pre-screened"},
+    {"name": "Maria Garcia", "amount": "$1,275.50", "due_date": "2030-03-02", "days_until_due": 3, "hardship": "pre-qualified for the hardship payment plan (25% discount)"},
+]
+
+
+@pytest.mark.parametrize("builder", BUILDERS, ids=lambda builder: builder.name)
+def test_prefix_is_byte_identical_across_calls(builder):
+    prefixes = {builder.chat_context(**facts).messages[0].content.encode("utf-8") for facts in CALLS}
+    assert prefixes == {builder.prefix.encode("utf-8")}
+
+
+@pytest.mark.parametrize("builder", BUILDERS, ids=lambda builder: builder.name)
+def test_call_facts_stay_out_of_the_prefix(builder):
+    for facts in CALLS:
+        for value in facts.values():
+            if isinstance(value, str):
+                assert value not in builder.prefix
+
+
+@pytest.mark.parametrize("builder", BUILDERS, ids=lambda builder: builder.name)
+def test_call_facts_follow_the_prefix(builder):
+    if not builder.facts_template:
+        pytest.skip(f"{builder.name} has no call facts")
+    messages = builder.chat_context(**CALLS[1]).messages
+    assert len(messages) == 2
+    assert "Maria Garcia" in messages[1].content
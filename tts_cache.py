@@ -0,0 +1,326 @@
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import struct
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from livekit import rtc
+from livekit.agents import tts, utils
+from utterance_templates import Segment, UtteranceTemplate
+
+logger = logging.getLogger("tts-cache")
+logger.setLevel(logging.INFO)
+
+# On-disk entry header: sample rate, channel count
+HEADER = struct.Struct("<IH")
+
+# Cached audio is replayed in 100ms frames
+FRAME_MS = 100
+
+CachedAudio = Tuple[int, int, memoryview]
+
+
+def cache_key(text: str, tts_options: Dict[str, Any]) -> str:
+    """Content address for a phrase rendered with a specific model, voice and speed"""
+    material = "\x00".join([
+        str(tts_options.get("model", "")),
+        str(tts_options.get("voice", "")),
+        str(tts_options.get("speed", "")),
+        text,
+    ])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Two-tier PCM cache: an LRU memory tier in front of memory-mapped files on disk"""
+
+    def __init__(self, directory: str, max_memory_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self._memory: "OrderedDict[str, CachedAudio]" = OrderedDict()
+        self._memory_bytes = 0
+        self._registered: set = set()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "AudioCache":
+        """Create a cache configured by TTS_CACHE_DIR and TTS_CACHE_MEMORY_MB"""
+        return cls(
+            os.getenv("TTS_CACHE_DIR", ".tts_cache"),
+            int(os.getenv("TTS_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def register(self, keys: Iterable[str]) -> None:
+        """Mark keys whose audio should be persisted to disk when synthesized"""
+        self._registered.update(keys)
+
+    def is_registered(self, key: str) -> bool:
+        return key in self._registered
+
+    def get(self, key: str, record: bool = True) -> Optional[CachedAudio]:
+        """Look up audio in memory, then on disk; disk hits are promoted to the memory tier"""
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            if record:
+                self.stats["memory_hits"] += 1
+            return entry
+
+        entry = self._load(key)
+        if entry is not None:
+            if record:
+                self.stats["disk_hits"] += 1
+            self._remember(key, entry)
+            return entry
+
+        if record:
+            self.stats["misses"] += 1
+        return None
+
+    def _load(self, key: str) -> Optional[CachedAudio]:
+        try:
+            with open(self._path(key), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        if len(mapped) < HEADER.size:
+            # Truncated by a partial copy; treat as a miss so it is synthesized and written again
+            mapped.close()
+            logger.warning(f"Discarding truncated TTS cache entry {key}")
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            return None
+        sample_rate, num_channels = HEADER.unpack_from(mapped, 0)
+        return sample_rate, num_channels, memoryview(mapped)[HEADER.size:]
+
+    def _remember(self, key: str, entry: CachedAudio) -> None:
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key)[2])
+        self._memory[key] = entry
+        self._memory_bytes += len(entry[2])
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted[2])
+            self.stats["evictions"] += 1
+
+    async def put(self, key: str, sample_rate: int, num_channels: int, pcm: bytes, persist: bool = False) -> None:
+        """Store audio in memory, and on disk as well when persist is set"""
+        self._remember(key, (sample_rate, num_channels, memoryview(pcm)))
+        self.stats["stores"] += 1
+        if persist:
+            await asyncio.to_thread(self._write, key, sample_rate, num_channels, pcm)
+
+    def _write(self, key: str, sample_rate: int, num_channels: int, pcm: bytes) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(sample_rate, num_channels))
+            f.write(pcm)
+        os.replace(tmp_path, path)
+
+    def preload(self, keys: Iterable[str]) -> List[str]:
+        """Pull persisted entries into memory ahead of the first call; returns the keys not on disk"""
+        missing = []
+        for key in keys:
+            entry = self._memory.get(key) or self._load(key)
+            if entry is None:
+                missing.append(key)
+            else:
+                self._remember(key, entry)
+        return missing
+
+
+def load_phrases(default_phrases: Iterable[str]) -> List[str]:
+    """Phrases to pre-populate: the agent's defaults plus one per line from TTS_CACHE_PHRASES"""
+    phrases = list(default_phrases)
+    path = os.getenv("TTS_CACHE_PHRASES")
+    if path:
+        with open(path) as f:
+            phrases.extend(line.strip() for line in f if line.strip())
+    return phrases
+
+
+class CachedTTS(tts.TTS):
+    """TTS wrapper that serves repeated phrases from the audio cache and falls back to the wrapped TTS"""
+
+    def __init__(self, wrapped: tts.TTS, cache: AudioCache, tts_options: Dict[str, Any]):
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=False),
+            sample_rate=wrapped.sample_rate,
+            num_channels=wrapped.num_channels,
+        )
+        self._wrapped = wrapped
+        self._cache = cache
+        self._tts_options = tts_options
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._templates: List[UtteranceTemplate] = []
+        self._missing_phrases: List[str] = []
+        self._populate_task: Optional[asyncio.Task] = None
+
+    def key(self, text: str) -> str:
+        return cache_key(text, self._tts_options)
+
+    def warm(self, phrases: Iterable[Union[str, UtteranceTemplate]]) -> None:
+        """Register phrases (or the static segments of templates) for disk persistence and load any already on disk"""
+        texts = []
+        for phrase in phrases:
+            if isinstance(phrase, UtteranceTemplate):
+                self._templates.append(phrase)
+                texts.extend(phrase.static_segments())
+            else:
+                texts.append(phrase)
+        phrases = texts
+        keys = {self.key(text): text for text in phrases}
+        self._cache.register(keys)
+        missing = self._cache.preload(keys)
+        # A TTS shared by several agents is warmed once per agent
+        self._missing_phrases.extend(keys[key] for key in missing if keys[key] not in self._missing_phrases)
+        logger.info(f"Warmed TTS cache - {len(phrases) - len(missing)} phrases loaded, {len(missing)} to synthesize")
+
+    def populate_missing(self) -> None:
+        """Synthesize registered phrases that were not on disk, in the background, once per process"""
+        if self._populate_task is None and self._missing_phrases:
+            self._populate_task = asyncio.create_task(self._populate())
+
+    async def _populate(self) -> None:
+        for text in self._missing_phrases:
+            try:
+                await self.prefetch(text)
+            except Exception as e:
+                logger.warning(f"Failed to pre-populate TTS cache: {e}")
+
+    def segments(self, text: str) -> Optional[List[Segment]]:
+        """Static and variable segments of text if it renders one of the registered templates"""
+        for template in self._templates:
+            segments = template.split(text)
+            if segments is not None:
+                return segments
+        return None
+
+    def has_audio(self, text: str) -> bool:
+        """Whether text plays from the cache or a registered template rather than a fresh synthesis"""
+        key = self.key(text)
+        return self.segments(text) is not None or key in self._pending or self._cache.get(key, record=False) is not None
+
+    async def prefetch(self, text: str) -> None:
+        """Synthesize text now so a later synthesize() call plays it without a round trip"""
+        segments = self.segments(text)
+        if segments is not None:
+            await asyncio.gather(*(self._prefetch_text(segment) for segment, _ in segments))
+        else:
+            await self._prefetch_text(text)
+
+    async def render(self, text: str) -> CachedAudio:
+        """Audio for text from the cache, synthesizing it first on a miss"""
+        cached = await self.lookup(text)
+        if cached is None:
+            await self._prefetch_text(text)
+            cached = self._cache.get(self.key(text), record=False)
+        return cached
+
+    async def _prefetch_text(self, text: str) -> None:
+        key = self.key(text)
+        if self._cache.get(key, record=False) is not None:
+            return
+        if key not in self._pending:
+            self._pending[key] = asyncio.create_task(self._synthesize_into_cache(text, key))
+        try:
+            await self._pending[key]
+        finally:
+            self._pending.pop(key, None)
+
+    async def _synthesize_into_cache(self, text: str, key: str) -> None:
+        pcm = bytearray()
+        sample_rate, num_channels = self.sample_rate, self.num_channels
+        async for audio in self._wrapped.synthesize(text):
+            sample_rate, num_channels = audio.frame.sample_rate, audio.frame.num_channels
+            pcm.extend(audio.frame.data.cast("B"))
+        await self._cache.put(key, sample_rate, num_channels, bytes(pcm), persist=self._cache.is_registered(key))
+
+    async def lookup(self, text: str) -> Optional[CachedAudio]:
+        """Return cached audio for text, waiting on a prefetch that is still in flight"""
+        key = self.key(text)
+        pending = self._pending.get(key)
+        if pending is not None:
+            try:
+                await asyncio.shield(pending)
+            except Exception as e:
+                logger.warning(f"Prefetch failed, synthesizing live: {e}")
+                return None
+        return self._cache.get(key)
+
+    def synthesize(self, text: str) -> "CachedChunkedStream":
+        return CachedChunkedStream(self, text)
+
+    async def aclose(self) -> None:
+        for task in self._pending.values():
+            task.cancel()
+        if self._populate_task is not None:
+            self._populate_task.cancel()
+
+
+class CachedChunkedStream(tts.ChunkedStream):
+    """Replays cached PCM when available, otherwise streams from the wrapped TTS and fills the cache"""
+
+    def __init__(self, cached_tts: CachedTTS, text: str):
+        super().__init__()
+        self._cached_tts = cached_tts
+        self._text = text
+
+    async def _main_task(self) -> None:
+        request_id = utils.shortuuid()
+        segments = self._cached_tts.segments(self._text)
+        if segments is not None:
+            await self._stitch(request_id, segments)
+            return
+
+        cached = await self._cached_tts.lookup(self._text)
+        if cached is not None:
+            for frame in pcm_frames(*cached):
+                self._event_ch.send_nowait(tts.SynthesizedAudio(request_id=request_id, segment_id="", frame=frame))
+            return
+
+        key = self._cached_tts.key(self._text)
+        pcm = bytearray()
+        sample_rate, num_channels = self._cached_tts.sample_rate, self._cached_tts.num_channels
+        async for audio in self._cached_tts._wrapped.synthesize(self._text):
+            sample_rate, num_channels = audio.frame.sample_rate, audio.frame.num_channels
+            pcm.extend(audio.frame.data.cast("B"))
+            self._event_ch.send_nowait(audio)
+
+        cache = self._cached_tts._cache
+        if cache.is_registered(key):
+            await cache.put(key, sample_rate, num_channels, bytes(pcm), persist=True)
+
+    async def _stitch(self, request_id: str, segments: List[Segment]) -> None:
+        # Static segments come straight from the cache while variable slots synthesize in parallel
+        renders = [asyncio.create_task(self._cached_tts.render(text)) for text, _ in segments]
+        try:
+            for render in renders:
+                for frame in pcm_frames(*await render):
+                    self._event_ch.send_nowait(tts.SynthesizedAudio(request_id=request_id, segment_id="", frame=frame))
+        finally:
+            for render in renders:
+                render.cancel()
+
+
+def pcm_frames(sample_rate: int, num_channels: int, pcm: memoryview) -> Iterable[rtc.AudioFrame]:
+    """Slice 16-bit PCM into fixed-size audio frames"""
+    samples_per_frame = sample_rate * FRAME_MS // 1000
+    frame_bytes = samples_per_frame * num_channels * 2
+    for offset in range(0, len(pcm), frame_bytes):
+        chunk = pcm[offset:offset + frame_bytes]
+        yield rtc.AudioFrame(
+            data=chunk,
+            sample_rate=sample_rate,
+            num_channels=num_channels,
+            samples_per_channel=len(chunk) // (2 * num_channels),
+        )
@@ -0,0 +1,101 @@
+import re
+import string
+from typing import Dict, List, Optional, Tuple
+
+# Punctuation that ends a clause, a natural place for an audio seam
+CLAUSE_END = re.compile(r"[.,;:?!](?=\s|$)")
+
+# A segment's text (a format string when variable) and whether it is static, i.e. the same audio on every call
+Segment = Tuple[str, bool]
+
+
+def _escape(literal: str) -> str:
+    return literal.replace("{", "{{").replace("}", "}}")
+
+
+class UtteranceTemplate:
+    """A spoken line with named {slots}, split into cacheable static segments and per-call variable segments
+
+    Seams are only placed at clause punctuation, or at a word boundary ahead of a slot when the
+    static run before it is long enough to be worth caching on its own. Connective words between
+    a slot and the next clause end stay with the slot so they are synthesized in one breath.
+    """
+
+    def __init__(self, template: str, min_static_words: int = 4):
+        self.template = " ".join(template.split())
+        self.min_static_words = min_static_words
+        self.slots: List[str] = []
+        self.segments = self._segment()
+        self._pattern = self._compile()
+
+    def _segment(self) -> List[Segment]:
+        pieces: List[Segment] = []
+        previous_slot = False
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(self.template):
+            if format_spec or conversion:
+                raise ValueError(f"Template slots must be plain {{name}} fields: {self.template}")
+            rest = literal
+
+            # Words after a slot up to the end of its clause belong to the slot
+            if previous_slot:
+                end = CLAUSE_END.search(rest)
+                cut = end.end() if end else len(rest)
+                if end is None and field_name is None and len(rest.split()) >= self.min_static_words:
+                    cut = 0
+                pieces.append((_escape(rest[:cut]), False))
+                rest = rest[cut:]
+
+            if field_name is None:
+                pieces.append((rest, True))
+                break
+
+            # Static text before a slot is cached up to the last clause end, or whole if long enough
+            boundaries = list(CLAUSE_END.finditer(rest))
+            static_end = boundaries[-1].end() if boundaries else 0
+            if len(rest[static_end:].split()) >= self.min_static_words:
+                static_end = len(rest)
+            pieces.append((rest[:static_end], True))
+            pieces.append((_escape(rest[static_end:]) + "{" + field_name + "}", False))
+            self.slots.append(field_name)
+            previous_slot = True
+
+        segments: List[Segment] = []
+        for text, static in pieces:
+            if not text:
+                continue
+            if segments and segments[-1][1] == static:
+                segments[-1] = (segments[-1][0] + text, static)
+            else:
+                segments.append((text, static))
+        return [(text.strip(), static) for text, static in segments if text.strip()]
+
+    def _compile(self) -> "re.Pattern":
+        pattern = ""
+        seen = set()
+        for literal, field_name, _, _ in string.Formatter().parse(self.template):
+            pattern += re.escape(literal)
+            if field_name is None:
+                continue
+            pattern += f"(?P={field_name})" if field_name in seen else f"(?P<{field_name}>.+?)"
+            seen.add(field_name)
+        return re.compile(pattern)
+
+    def render(self, **values: str) -> str:
+        """The full line as it will be spoken"""
+        return self.template.format(**values)
+
+    def static_segments(self) -> List[str]:
+        """Segments whose audio is the same on every call"""
+        return [text for text, static in self.segments if static]
+
+    def match(self, text: str) -> Optional[Dict[str, str]]:
+        """Slot values if text is a rendering of this template"""
+        found = self._pattern.fullmatch(" ".join(text.split()))
+        return found.groupdict() if found else None
+
+    def split(self, text: str) -> Optional[List[Segment]]:
+        """Rendered segments of text in speaking order, or None if text does not match this template"""
+        values = self.match(text)
+        if values is None:
+            return None
+        return [(segment if static else segment.format(**values), static) for segment, static in self.segments]
@@ -0,0 +1,79 @@
+"""One worker for every persona, routed by room metadata
+
+Each job goes to the general, inbound collections or outbound collections agent. The worker
+process prewarms all three, so the VAD model, the TTS audio cache and any plugin clients with
+identical settings are loaded once and shared between personas.
+"""
+import json
+import logging
+import os
+from typing import Optional
+from livekit.agents import JobContext, JobProcess, WorkerOptions, cli
+import agent
+import agent_collections
+import agent_outbound
+from prewarm import prewarm_process
+
+logger = logging.getLogger("worker")
+logger.setLevel(logging.INFO)
+
+PERSONAS = {
+    "general": agent,
+    "collections": agent_collections,
+    "outbound": agent_outbound,
+}
+
+# callType set by initiate-call and the dialer
+CALL_TYPES = {
+    "outbound_collection": "outbound",
+    "inbound_collection": "collections",
+}
+
+# Persona for rooms whose metadata names none, e.g. inbound SIP calls
+DEFAULT_PERSONA = os.getenv("WORKER_DEFAULT_PERSONA", "general")
+
+
+def persona_for(room_metadata: Optional[str]) -> str:
+    """Persona named by the room metadata: an explicit "persona", then the callType, then the default"""
+    try:
+        metadata = json.loads(room_metadata) if room_metadata else {}
+    except json.JSONDecodeError:
+        logger.warning("Room metadata is not JSON, using the default persona")
+        metadata = {}
+    if not isinstance(metadata, dict):
+        metadata = {}
+
+    persona = metadata.get("persona") or CALL_TYPES.get(metadata.get("callType"), DEFAULT_PERSONA)
+    if persona not in PERSONAS:
+        logger.warning(f"Unknown persona {persona!r}, using {DEFAULT_PERSONA}")
+        persona = DEFAULT_PERSONA
+    return persona
+
+
+def prewarm(proc: JobProcess):
+    """Load the VAD model and every persona's plugin clients before the worker accepts jobs"""
+    prewarm_process(
+        proc,
+        {name: module.PLUGIN_CONFIG for name, module in PERSONAS.items()},
+        {name: getattr(module, "CACHED_PHRASES", []) for name, module in PERSONAS.items()},
+    )
+
+
+async def entrypoint(ctx: JobContext):
+    """Hand the job to the persona its room asks for"""
+    persona = persona_for(ctx.job.room.metadata)
+    logger.info(f"Routing room {ctx.job.room.name} to the {persona} persona")
+    await PERSONAS[persona].entrypoint(ctx)
+
+
+if __name__ == "__main__":
+    # Run the worker
+    cli.run_app(
+        WorkerOptions(
+            entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,  # Load models once per process, off the answer path
+            api_key=None,  # Will use LIVEKIT_API_KEY env var
+            api_secret=None,  # Will use LIVEKIT_API_SECRET env var
+            ws_url=None,  # Will use LIVEKIT_URL env var
+        )
+    )